@@ -1,9 +1,13 @@
 import streamlit as st
 import logging
+import os
+import threading
 from datetime import datetime
-from src.agent import get_agent
-from rate_limit import RateLimit
-import uuid
+from src import metering, tracing
+from src.agent import get_run_config, get_shared_agent, get_thread_id, stream_response, warm_up
+from src.helpers import ROOT_DIR
+from src.rendering import StreamRenderer
+from rate_limit import get_rate_limiter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,7 +19,7 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('medbot.log'),
+        logging.FileHandler(os.path.join(ROOT_DIR, 'medbot.log'), delay=True),
     ]
 )
 
@@ -44,7 +48,7 @@ def get_user_ip():
 st.set_page_config(page_title="MedBot", page_icon=":robot_face:")
 st.title("MedBot: Your Medical Chatbot Assistant")
 
-rate_limiter = RateLimit()
+rate_limiter = get_rate_limiter()
 
 # Initialize session state for chat history and thread_id
 if "messages" not in st.session_state:
@@ -52,12 +56,30 @@ if "messages" not in st.session_state:
     logger.info("Initialized new chat session")
 
 if "thread_id" not in st.session_state:
-    st.session_state.thread_id =  str(uuid.uuid4())
+    st.session_state.thread_id = get_thread_id()
     logger.info(f"Created new thread_id: {st.session_state.thread_id}")
 
-if "agent" not in st.session_state:
-    st.session_state.agent = get_agent()
-    logger.info(f"Created the agent and stored in session")
+def run_warm_up():
+    try:
+        warm_up()
+    except Exception as e:
+        # The first request builds the agent itself and surfaces the error to the user
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+
+@st.cache_resource
+def start_warm_up():
+    """Builds the shared agent in the background once per process, while the first page renders."""
+    thread = threading.Thread(target=run_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    logger.info("Started warming up the shared agent")
+    return thread
+
+@st.cache_resource
+def load_agent():
+    """Built once per process and shared by every session; sessions are isolated by thread_id."""
+    return get_shared_agent()
+
+start_warm_up()
 
 
 # Disclaimer
@@ -116,51 +138,54 @@ if prompt := st.chat_input("Ask a medical question"):
     # GENERATE RESPONSE
     # ============================================
     with st.chat_message("assistant"):
-        update_placeholder = st.empty()
-        message_placeholder = st.empty()
-        full_updates = ""
+        # Status updates and answer tokens are buffered and re-rendered at most every `rendering.interval`
+        renderer = StreamRenderer(st.empty(), st.empty())
         full_response = ""
         
         try:
             start_time = datetime.now()
             logger.info(f"Starting agent processing for IP {user_ip}")
             
-            agent = st.session_state.agent
-            config = {"configurable": {"thread_id": st.session_state.thread_id}}
+            request_meter = metering.RequestMeter(st.session_state.thread_id, user_ip)
+            callbacks = [request_meter.callback()] if metering.is_enabled() else []
+            config = get_run_config(st.session_state.thread_id, callbacks)
             
+            # Waits for the background warm-up if it is still building the agent
+            agent = load_agent()
+
             # Stream response
-            token_count = 0
-            for stream_mode, chunk in agent.stream({
-                "messages": [{"role": "user", "content": prompt}]
-            }, config=config, stream_mode=["messages", "custom"]):
-
-                if stream_mode == "custom":
-                    # Handle custom streaming data (e.g., tool output)
-                    logger.debug(f"Custom stream: {chunk}")
-                    update_placeholder.markdown(f"*{chunk}*")
-                    full_updates += chunk + "\n"
-                    
-                elif stream_mode == "messages":
-                    # Handle message stream
-                    token, metadata = chunk[0], chunk[1]
-                    if metadata['langgraph_node'] == "model":
-                        full_response += token.content
-                        token_count += len(token.content.split())
-                    message_placeholder.markdown(full_response + "▌")
+            first_token_time = None
+            with tracing.trace(st.session_state.thread_id):
+                # First-turn questions may be replayed from the answer cache through the same stream
+                for stream_mode, chunk in stream_response(agent, prompt, config):
+
+                    if stream_mode == "custom":
+                        # Handle custom streaming data (e.g., tool output)
+                        logger.debug(f"Custom stream: {chunk}")
+
+                    # Model tokens are appended to the answer; other nodes' messages are skipped
+                    if renderer.handle(stream_mode, chunk) and first_token_time is None:
+                        first_token_time = datetime.now()
+                        tracing.observe('request.ttft', (first_token_time - start_time).total_seconds())
             
             # Final response
-            message_placeholder.markdown(full_response)
+            full_response = renderer.close()
             
             # Calculate response time
             end_time = datetime.now()
             response_time = (end_time - start_time).total_seconds()
+            tracing.observe('request.total', response_time)
+            usage = request_meter.total
+            if metering.is_enabled():
+                request_meter.log(response_time=round(response_time, 3))
             
             # Log success
             logger.info(
                 f"Response generated successfully for IP {user_ip} | "
                 f"Response time: {response_time:.2f}s | "
                 f"Response length: {len(full_response)} chars | "
-                f"Estimated tokens: {token_count}"
+                f"Tokens: {usage.input_tokens} in / {usage.output_tokens} out | "
+                f"Cost: ${usage.cost:.5f}"
             )
             
             # Add assistant response to chat history
@@ -180,4 +205,13 @@ if prompt := st.chat_input("Ask a medical question"):
             )
   
 
+# Token usage and cost of this session so far, drawn after the response so it includes it
+if metering.is_enabled() and metering.metering_config['sidebar']:
+    session_usage = metering.meter.totals('thread', st.session_state.thread_id)
+    with st.sidebar:
+        st.subheader("Session usage")
+        st.metric("Tokens", f"{session_usage.total_tokens:,}",
+                  help=f"{session_usage.input_tokens:,} prompt / {session_usage.output_tokens:,} completion")
+        st.metric("Cost", f"${session_usage.cost:.4f}")
+
 logger.info("Chat interaction completed")
\ No newline at end of file
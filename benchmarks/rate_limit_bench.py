@@ -0,0 +1,125 @@
+"""Microbenchmark of rate limit checks per second.
+
+Compares the previous per-request-connection implementation with the
+`immediate` and `batched` write modes of `rate_limit.RateLimit`, under a burst
+of checks from many IPs spread over several threads. `--processes` also runs
+several worker processes against one database and verifies that no IP was
+admitted more than `max_requests` times.
+
+Usage:
+    python -m benchmarks.rate_limit_bench --checks 20000 --ips 500 --threads 8
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from rate_limit import RateLimit
+
+
+def legacy_is_allowed(db_path, ip_address, max_requests, time_window):
+    """The previous algorithm: new connection, DELETE, COUNT, MIN and INSERT per check."""
+    current_time = time.time()
+    cutoff_time = current_time - time_window
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DELETE FROM rate_limits WHERE ip_address = ? AND request_time < ?", (ip_address, cutoff_time))
+        count = conn.execute(
+            "SELECT COUNT(*) FROM rate_limits WHERE ip_address = ? AND request_time > ?", (ip_address, cutoff_time)
+        ).fetchone()[0]
+        if count >= max_requests:
+            conn.execute("SELECT MIN(request_time) FROM rate_limits WHERE ip_address = ?", (ip_address,)).fetchone()
+            return False, 0
+        conn.execute("INSERT OR IGNORE INTO rate_limits (ip_address, request_time) VALUES (?, ?)",
+                     (ip_address, current_time))
+        conn.commit()
+        return True, None
+    finally:
+        conn.close()
+
+
+def run_threads(check, checks, ips, threads):
+    """Runs `checks` calls of check(ip) over `threads` threads; returns checks/sec."""
+    per_thread = checks // threads
+
+    def worker(offset):
+        for i in range(per_thread):
+            check(f"10.0.{(offset + i) % ips // 256}.{(offset + i) % ips % 256}")
+
+    pool = [threading.Thread(target=worker, args=(t * per_thread,)) for t in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def bench_mode(mode, args, db_path):
+    if mode == 'legacy':
+        RateLimit(db_path).close()  # creates the schema
+        return run_threads(lambda ip: legacy_is_allowed(db_path, ip, args.max_requests, args.window),
+                           args.checks, args.ips, args.threads)
+
+    limiter = RateLimit(db_path, write_mode=mode)
+    try:
+        return run_threads(lambda ip: limiter.is_allowed(ip, args.max_requests, args.window),
+                           args.checks, args.ips, args.threads)
+    finally:
+        limiter.close()
+
+
+def process_worker(db_path, ips, checks, max_requests, window):
+    limiter = RateLimit(db_path, write_mode='immediate')
+    for i in range(checks):
+        limiter.is_allowed(f"ip-{i % ips}", max_requests, window)
+    limiter.close()
+
+
+def check_processes(args, db_path):
+    """Hammers one database from several processes and returns the max admissions seen per IP."""
+    RateLimit(db_path).close()
+    workers = [
+        multiprocessing.Process(target=process_worker, args=(db_path, 20, args.checks // args.processes,
+                                                             args.max_requests, args.window))
+        for _ in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    conn = sqlite3.connect(db_path)
+    counts = conn.execute("SELECT COUNT(*) FROM rate_limits GROUP BY ip_address").fetchall()
+    conn.close()
+    return max(count for (count,) in counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rate limiter checks/sec microbenchmark.")
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--ips', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--max-requests', type=int, default=5)
+    parser.add_argument('--window', type=float, default=1800)
+    parser.add_argument('--processes', type=int, default=0, help="Also verify the limit across this many processes.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{args.checks} checks from {args.ips} IPs over {args.threads} threads")
+        for mode in ('legacy', 'immediate', 'batched'):
+            rate = bench_mode(mode, args, os.path.join(tmp_dir, f"{mode}.db"))
+            print(f"  {mode:<10} {rate:>10,.0f} checks/sec")
+
+        if args.processes:
+            admitted = check_processes(args, os.path.join(tmp_dir, "processes.db"))
+            status = "OK" if admitted <= args.max_requests else "LIMIT EXCEEDED"
+            print(f"  {args.processes} processes: max {admitted} admissions per IP "
+                  f"(limit {args.max_requests}) {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Server CPU per streamed answer: re-rendering on every chunk vs StreamRenderer.
+
+A synthetic agent stream (status updates, tool-node messages and model
+tokens arriving at `--tokens-per-sec` on a virtual clock) is rendered into
+placeholders that do the server-side work of one Streamlit markdown update:
+dedent the body, build the ForwardMsg delta and serialize it for the
+websocket. CPU time is process time, so the number does not depend on how
+fast the virtual stream is.
+
+Usage:
+    python -m benchmarks.render_bench --tokens 800 --repeat 20
+"""
+import argparse
+import statistics
+import textwrap
+import time
+from types import SimpleNamespace
+
+from src.rendering import StreamRenderer
+
+WORDS = ("Hypertension is persistently raised arterial blood pressure, usually treated with lifestyle changes "
+         "and antihypertensive drugs such as thiazide diuretics, ACE inhibitors or calcium channel blockers. ").split()
+
+
+class ProtoPlaceholder:
+    """Stands in for `st.empty()`; each markdown call costs what Streamlit's server spends on it."""
+
+    def __init__(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self.forward_msg = ForwardMsg
+        self.calls = 0
+        self.bytes = 0
+
+    def markdown(self, body):
+        msg = self.forward_msg()
+        msg.delta.new_element.markdown.body = textwrap.dedent(body)
+        self.calls += 1
+        self.bytes += len(msg.SerializeToString())
+
+
+def make_stream(tokens, tokens_per_sec, clock):
+    """Agent stream items, advancing `clock[0]` to the virtual arrival time of each."""
+    items = []
+    for i in range(6):
+        items.append((0.005, ("custom", f"Accepted source: Medical Book (Page: {100 + i})")))
+    items.append((0.01, ("messages", (SimpleNamespace(content="x" * 2000), {'langgraph_node': 'tools'}))))
+    for i in range(tokens):
+        token = SimpleNamespace(content=WORDS[i % len(WORDS)] + " ")
+        items.append((1.0 / tokens_per_sec, ("messages", (token, {'langgraph_node': 'model'}))))
+
+    for delay, item in items:
+        clock[0] += delay
+        yield item
+
+
+def render_per_chunk(stream, status, answer, clock):
+    """The loop app.py used to run: every chunk re-renders the whole answer."""
+    response = ""
+    for stream_mode, chunk in stream:
+        if stream_mode == "custom":
+            status.markdown(f"*{chunk}*")
+        elif stream_mode == "messages":
+            token, metadata = chunk
+            if metadata['langgraph_node'] == "model":
+                response += token.content
+            answer.markdown(response + "▌")
+    answer.markdown(response)
+    return response
+
+
+def render_throttled(stream, status, answer, clock):
+    renderer = StreamRenderer(status, answer, clock=lambda: clock[0])
+    for stream_mode, chunk in stream:
+        renderer.handle(stream_mode, chunk)
+    return renderer.close()
+
+
+MODES = {'per-chunk': render_per_chunk, 'throttled': render_throttled}
+
+
+def measure(mode, tokens, tokens_per_sec, repeat):
+    cpu, calls, sent = [], 0, 0
+    for _ in range(repeat):
+        clock = [0.0]
+        status, answer = ProtoPlaceholder(), ProtoPlaceholder()
+        start = time.process_time()
+        MODES[mode](make_stream(tokens, tokens_per_sec, clock), status, answer, clock)
+        cpu.append(time.process_time() - start)
+        calls, sent = status.calls + answer.calls, status.bytes + answer.bytes
+    return {'cpu_ms': statistics.median(cpu) * 1000, 'renders': calls, 'mb_sent': sent / 1e6}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, nargs='+', default=[200, 800, 2000], help="Answer lengths in tokens.")
+    parser.add_argument('--tokens-per-sec', type=float, default=60.0)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{'tokens':>7} {'mode':<10} {'CPU ms':>9} {'renders':>8} {'MB sent':>9}")
+    for tokens in args.tokens:
+        for mode in MODES:
+            result = measure(mode, tokens, args.tokens_per_sec, args.repeat)
+            print(f"{tokens:>7} {mode:<10} {result['cpu_ms']:>9.1f} {result['renders']:>8} {result['mb_sent']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Cold-start benchmark of the entry points.
+
+Each entry point is measured in fresh interpreters: the time to import it,
+and the time from start-up until it could serve its first request (agent,
+retriever or evaluation pipeline built). Building clients makes no API calls,
+but the Pinecone backend resolves the index host, so keys and network are needed
+for the full number; failures are reported per entry point.
+
+Usage:
+    python -m benchmarks.startup_bench --repeat 5
+    python -m benchmarks.startup_bench --importtime 15  # slowest imports per entry point
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry point -> (import statement, statement that prepares the first request)
+ENTRY_POINTS = {
+    'app.py': ("import streamlit, rate_limit, src.agent", "src.agent.warm_up(); rate_limit.get_rate_limiter()"),
+    'src/data_retrieve.py': ("import src.data_retrieve", "src.data_retrieve.get_shared_agent()"),
+    'evaluate.py': ("import evaluate", "evaluate.build_pipeline()"),
+}
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+{import_stmt}
+imported = time.perf_counter()
+error = None
+try:
+    {ready_stmt}
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+ready = time.perf_counter()
+print(json.dumps({{"import": imported - start, "ready": ready - start, "error": error}}))
+"""
+
+
+def run_probe(import_stmt, ready_stmt):
+    code = PROBE.format(import_stmt=import_stmt, ready_stmt=ready_stmt)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"import": None, "ready": None, "error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(import_stmt, top):
+    """Top modules by cumulative import time, from python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', import_stmt],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time to first request of each entry point.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per entry point.")
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help="Also list the N slowest imports.")
+    args = parser.parse_args(argv)
+
+    print(f"{'entry point':<24}{'import (s)':>12}{'first request (s)':>20}")
+    for name, (import_stmt, ready_stmt) in ENTRY_POINTS.items():
+        runs = [run_probe(import_stmt, ready_stmt) for _ in range(args.repeat)]
+        ok = [run for run in runs if run['import'] is not None]
+        if not ok:
+            print(f"{name:<24}{'failed':>12}  {runs[0]['error']}")
+            continue
+        import_time = statistics.median(run['import'] for run in ok)
+        ready_time = statistics.median(run['ready'] for run in ok)
+        error = next((run['error'][:100] for run in ok if run['error']), None)
+        print(f"{name:<24}{import_time:>12.3f}{ready_time:>20.3f}" + (f"  ({error})" if error else ""))
+
+        for cumulative_us, module in slowest_imports(import_stmt, args.importtime):
+            print(f"    {cumulative_us / 1e6:>8.3f}s  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,17 @@
 # Check if this content is in Pinecone
-from pinecone import Pinecone
-from openai import OpenAI
 from dotenv import load_dotenv
+from src.clients import get_cached_embeddings, get_index
 
 load_dotenv()
 
 
-pc = Pinecone()
-index = pc.Index("medbot")
+index = get_index("medbot")
 
 # Search directly for the content
-client = OpenAI()
-query_embedding = client.embeddings.create(
-    model="text-embedding-3-small",
-    input="Safety Data Sheets (SDS), formerly referred to as Material Safety Data Sheets",
-    dimensions=700
-).data[0].embedding
+embeddings = get_cached_embeddings("text-embedding-3-small", 700)
+query_embedding = embeddings.embed_query(
+    "Safety Data Sheets (SDS), formerly referred to as Material Safety Data Sheets"
+)
 
 results = index.query(
     vector=query_embedding, 
@@ -1,24 +1,13 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import argparse
+import functools
 import json
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from ragas import evaluate
-from datasets import Dataset
-from ragas.metrics import (
-    context_recall, 
-    context_precision, 
-    answer_relevancy, 
-    faithfulness, 
-    answer_correctness
-)
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_cohere import CohereRerank
+import os
 from dotenv import load_dotenv
+from src.evaluation import EvaluationRunner, get_results_path, print_report
 from src.helpers import load_config
-from tqdm import tqdm
-
-
 
+# ragas, datasets, langchain and the API clients are imported inside the functions that use them,
+# so importing this module (e.g. from benchmarks) is cheap.
 
 # Load environment and config
 load_dotenv()
@@ -32,21 +21,8 @@ index_name = config['index_name']
 search_type = config['retrieval']['search_type']
 k = config['retrieval']['k']
 rerank_k = config['rerank']['k']
-
-
-if rerank_k > k:
-    raise ValueError(
-        f"rerank_k ({rerank_k}) cannot be greater than retrieval k ({k}). "
-        f"You can only rerank documents that were retrieved."
-    )
-
-
-
-print(f"Configuration loaded:")
-print(f"  Model: {model_name}")
-print(f"  Embeddings: {embedding_model} ({dimensions}D)")
-print(f"  Retrieval: {search_type}, k={k}")
-print()
+max_concurrency = config['evaluation']['max_concurrency']
+ground_truths_dir = config['paths']['ground_truths']
 
 # Load test files
 test_files = [
@@ -54,28 +30,16 @@ test_files = [
     'health_safety_and_nutrition.json', 
     'nursing_fundamentals.json'
 ]
-test_questions = []
-
-for file_name in test_files:
-    with open(f'ground_truths/{file_name}', 'r') as f:
-        test_questions.extend(json.loads(f.read()))
-
-print(f"Loaded {len(test_questions)} test questions\n")
 
-# Setup embeddings and vector store
-embeddings = OpenAIEmbeddings(model=embedding_model, dimensions=dimensions)
-pc = Pinecone()
-index = pc.Index(name=index_name)
-vector_store = PineconeVectorStore(index=index, embedding=embeddings)
-
-retriever = vector_store.as_retriever(
-    search_type=search_type,
-    search_kwargs={"k": k}
-)
+metrics = [
+    'context_recall', 
+    'context_precision', 
+    'answer_relevancy', 
+    'faithfulness',
+    'answer_correctness'
+]
 
-# Define RAG prompt
-rag_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert Medical Chatbot assistant. Your role is to:
+SYSTEM_PROMPT = """You are an expert Medical Chatbot assistant. Your role is to:
 
 1. Answer medical questions using ONLY the provided context.
 2. Always cite the source of your information.
@@ -83,157 +47,231 @@ rag_prompt = ChatPromptTemplate.from_messages([
 4. Never make up medical information - only use the provided context.
 5. Be empathetic and clear in your explanations.
 
-Important: This is NOT a replacement for professional medical advice. Always recommend consulting a healthcare provider for diagnosis or treatment decisions."""),
-    ("user", """Context:
+Important: This is NOT a replacement for professional medical advice. Always recommend consulting a healthcare provider for diagnosis or treatment decisions."""
+
+
+def load_test_questions():
+    test_questions = []
+    for file_name in test_files:
+        with open(os.path.join(ground_truths_dir, file_name), 'r') as f:
+            test_questions.extend(json.loads(f.read()))
+    return test_questions
+
+
+def build_pipeline(k=k, rerank_k=rerank_k):
+    """Builds (embeddings, retriever, reranker, rag_chain, llm) for one evaluation run."""
+    from langchain_core.prompts import ChatPromptTemplate
+    from src.clients import get_cached_embeddings, get_chat_model, get_reranker, get_vector_store
+    from src.retriever import build_retriever
+
+    if rerank_k > k:
+        raise ValueError(
+            f"rerank_k ({rerank_k}) cannot be greater than retrieval k ({k}). "
+            f"You can only rerank documents that were retrieved."
+        )
+
+    # Setup embeddings and vector store
+    embeddings = get_cached_embeddings(embedding_model, dimensions)
+    vector_store = get_vector_store(embeddings)
+
+    retriever = build_retriever(vector_store, search_type=search_type, k=k)
+
+    # Define RAG prompt
+    rag_prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("user", """Context:
 {context}
 
 Question: {question}
 
 Answer based on the context above:""")
-])
-
-# Initialize LLM (FIXED: Clear naming)
-llm = ChatOpenAI(model=model_name, temperature=0)
-
-# Create RAG chain once (FIXED: Outside loop)
-rag_chain = rag_prompt | llm
-
-# Prepare lists for evaluation
-questions = []
-ground_truths = []
-contexts = []
-answers = []
-
-# Process each test question 
-print("Processing questions...")
-errors = 0
-
-reranker = CohereRerank(
-    model = 'rerank-english-v3.0',
-    top_n = rerank_k
-)
-
-
-for test_question in tqdm(test_questions, desc="Evaluating"):
-    try:
-        question = test_question['question']
-        ground_truth = test_question['answer']
-        
-        
-
-        # Retrieve relevant documents
-        relevant_docs = retriever.invoke(question)
-
-        reranked_docs = reranker.compress_documents(relevant_docs, question)
-
-        context_list = [doc.page_content for doc in reranked_docs]
-        
-        # Format context for prompt
-        context_text = "\n\n".join([
-            f"Source: {doc.metadata.get('source', 'Unknown')}\n{doc.page_content}"
-            for doc in reranked_docs
-        ])
-        
-        # Generate answer
-        response = rag_chain.invoke({
-            'question': question, 
-            'context': context_text
-        })
-        
-        answer = response.content if hasattr(response, 'content') else str(response)
-        
-        # Store for RAGAS
-        questions.append(question)
-        ground_truths.append(ground_truth)
-        contexts.append(context_list)  # List of strings for RAGAS
-        answers.append(answer)
-        
-    except Exception as e:
-        errors += 1
-        print(f"\nError processing question: {e}")
-        continue
-
-print(f"\nSuccessfully processed {len(questions)}/{len(test_questions)} questions")
-if errors > 0:
-    print(f"{errors} questions failed")
-
-# Create RAGAS dataset
-print('\nCreating RAGAS dataset...')
-dataset = Dataset.from_dict({
-    "question": questions,
-    "answer": answers,
-    "contexts": contexts,
-    "ground_truth": ground_truths
-})
-
-# Run evaluation (FIXED: Added answer_correctness back)
-print('Running RAGAS evaluation (this may take a few minutes)...\n')
-results = evaluate(
-    dataset,
-    metrics=[
-        context_recall,
-        context_precision,
-        faithfulness,
-        answer_relevancy,
-        answer_correctness  
-    ],
-    llm=llm  
-)
-
-# Convert to DataFrame
-results_df = results.to_pandas()
-
-# Save results
-output_file = 'ragas_evaluation_results.csv'
-results_df.to_csv(output_file, index=False)
-print(f"\nResults saved to '{output_file}'")
-
-# Print summary statistics
-print("\n" + "="*70)
-print("EVALUATION RESULTS SUMMARY")
-print("="*70)
+    ])
 
-metrics = [
-    'context_recall', 
-    'context_precision', 
-    'answer_relevancy', 
-    'faithfulness',
-    'answer_correctness'
-]
+    # Initialize LLM (FIXED: Clear naming)
+    llm = get_chat_model(model_name, temperature=0)
+
+    # Create RAG chain once (FIXED: Outside loop)
+    rag_chain = rag_prompt | llm
+
+    reranker = get_reranker(rerank_k)
+    return embeddings, retriever, reranker, rag_chain, llm
+
+
+def answer_question(test_question, retriever, reranker, rag_chain):
+    """Retrieve -> rerank -> generate for one test question; returns the record kept for RAGAS."""
+    question = test_question['question']
+
+    # Retrieve relevant documents
+    relevant_docs = retriever.invoke(question)
+
+    reranked_docs = reranker.compress_documents(relevant_docs, question)
+
+    context_list = [doc.page_content for doc in reranked_docs]
+
+    # Format context for prompt
+    context_text = "\n\n".join([
+        f"Source: {doc.metadata.get('source', 'Unknown')}\n{doc.page_content}"
+        for doc in reranked_docs
+    ])
+
+    # Generate answer
+    response = rag_chain.invoke({
+        'question': question, 
+        'context': context_text
+    })
+
+    answer = response.content if hasattr(response, 'content') else str(response)
+
+    return {
+        'question': question,
+        'ground_truth': test_question['answer'],
+        'contexts': context_list,  # List of strings for RAGAS
+        'answer': answer,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer the ground-truth questions and score them with RAGAS.")
+    parser.add_argument('--k', type=int, default=k, help="Documents retrieved per question.")
+    parser.add_argument('--rerank-k', type=int, default=rerank_k, help="Documents kept after reranking.")
+    parser.add_argument('--workers', type=int, default=max_concurrency, help="Questions processed concurrently.")
+    parser.add_argument('--fresh', action='store_true', help="Discard saved answers instead of resuming.")
+    parser.add_argument('--output', default=None,
+                        help="RAGAS results CSV (default: ragas_evaluation_results.csv, or _k<k> with --k).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from ragas import evaluate
+    from ragas.run_config import RunConfig
+    from datasets import Dataset
+    from ragas.metrics import (
+        context_recall, 
+        context_precision, 
+        answer_relevancy, 
+        faithfulness, 
+        answer_correctness
+    )
+    from tqdm import tqdm
+
+    args = parse_args(argv)
+
+    print(f"Configuration loaded:")
+    print(f"  Model: {model_name}")
+    print(f"  Embeddings: {embedding_model} ({dimensions}D)")
+    print(f"  Retrieval: {search_type}, k={args.k}, rerank_k={args.rerank_k}")
+    print(f"  Workers: {args.workers}")
+    print()
+
+    test_questions = load_test_questions()
+    print(f"Loaded {len(test_questions)} test questions\n")
+
+    embeddings, retriever, reranker, rag_chain, llm = build_pipeline(args.k, args.rerank_k)
+
+    # Answers are saved per question, so an interrupted run picks up where it stopped
+    results_path = get_results_path(f"{search_type}_{model_name}_k{args.k}_rerank{args.rerank_k}")
+    if args.fresh and os.path.exists(results_path):
+        os.remove(results_path)
+    runner = EvaluationRunner(
+        lambda test_question: answer_question(test_question, retriever, reranker, rag_chain),
+        results_path,
+        max_concurrency=args.workers,
+    )
+
+    # Process each test question 
+    print("Processing questions...")
+    records, report = runner.run(test_questions, progress=functools.partial(tqdm, desc="Evaluating"))
+    print_report(report)
+    print(f"Answers saved to '{results_path}'")
+
+    questions = [record['question'] for record in records]
+    ground_truths = [record['ground_truth'] for record in records]
+    contexts = [record['contexts'] for record in records]
+    answers = [record['answer'] for record in records]
+
+    print(f"\nSuccessfully processed {len(questions)}/{len(test_questions)} questions")
+    if report['failed'] > 0:
+        print(f"{report['failed']} questions failed; rerun to retry them")
+
+    # Create RAGAS dataset
+    print('\nCreating RAGAS dataset...')
+    dataset = Dataset.from_dict({
+        "question": questions,
+        "answer": answers,
+        "contexts": contexts,
+        "ground_truth": ground_truths
+    })
+
+    # Run evaluation (FIXED: Added answer_correctness back)
+    print('Running RAGAS evaluation (this may take a few minutes)...\n')
+    results = evaluate(
+        dataset,
+        metrics=[
+            context_recall,
+            context_precision,
+            faithfulness,
+            answer_relevancy,
+            answer_correctness  
+        ],
+        llm=llm,
+        run_config=RunConfig(max_workers=args.workers)
+    )
 
-for metric in metrics:
-    if metric in results_df.columns:
-        mean_score = results_df[metric].mean()
-        std_score = results_df[metric].std()
-        min_score = results_df[metric].min()
-        max_score = results_df[metric].max()
-        
-        print(f"\n{metric.replace('_', ' ').title()}:")
-        print(f"  Mean: {mean_score:.3f} ({mean_score*100:.1f}%)")
-        print(f"  Std:  {std_score:.3f}")
-        print(f"  Min:  {min_score:.3f}")
-        print(f"  Max:  {max_score:.3f}")
-
-# Overall average
-overall_avg = results_df[metrics].mean().mean()
-print(f"\n{'='*70}")
-print(f"Overall Average Score: {overall_avg:.3f} ({overall_avg*100:.1f}%)")
-print(f"{'='*70}")
-
-# Show best and worst examples
-print("\n" + "="*70)
-print("SAMPLE RESULTS")
-print("="*70)
-
-best_idx = results_df['answer_correctness'].idxmax()
-worst_idx = results_df['answer_correctness'].idxmin()
-
-print(f"\nBEST PERFORMING QUESTION:")
-print(f"Question: {questions[best_idx][:80]}...")
-print(f"Answer Correctness: {results_df.loc[best_idx, 'answer_correctness']:.3f}")
-
-print(f"\nWORST PERFORMING QUESTION:")
-print(f"Question: {questions[worst_idx][:80]}...")
-print(f"Answer Correctness: {results_df.loc[worst_idx, 'answer_correctness']:.3f}")
-
-print("\nEvaluation complete!")
\ No newline at end of file
+    # Convert to DataFrame
+    results_df = results.to_pandas()
+
+    # Save results
+    output_file = args.output or ('ragas_evaluation_results.csv' if args.k == k else f'ragas_evaluation_results_k{args.k}.csv')
+    results_df.to_csv(output_file, index=False)
+    print(f"\nResults saved to '{output_file}'")
+
+    # Print summary statistics
+    print("\n" + "="*70)
+    print("EVALUATION RESULTS SUMMARY")
+    print("="*70)
+
+    for metric in metrics:
+        if metric in results_df.columns:
+            mean_score = results_df[metric].mean()
+            std_score = results_df[metric].std()
+            min_score = results_df[metric].min()
+            max_score = results_df[metric].max()
+
+            print(f"\n{metric.replace('_', ' ').title()}:")
+            print(f"  Mean: {mean_score:.3f} ({mean_score*100:.1f}%)")
+            print(f"  Std:  {std_score:.3f}")
+            print(f"  Min:  {min_score:.3f}")
+            print(f"  Max:  {max_score:.3f}")
+
+    # Overall average
+    overall_avg = results_df[metrics].mean().mean()
+    print(f"\n{'='*70}")
+    print(f"Overall Average Score: {overall_avg:.3f} ({overall_avg*100:.1f}%)")
+    print(f"{'='*70}")
+
+    # Show best and worst examples
+    print("\n" + "="*70)
+    print("SAMPLE RESULTS")
+    print("="*70)
+
+    best_idx = results_df['answer_correctness'].idxmax()
+    worst_idx = results_df['answer_correctness'].idxmin()
+
+    print(f"\nBEST PERFORMING QUESTION:")
+    print(f"Question: {questions[best_idx][:80]}...")
+    print(f"Answer Correctness: {results_df.loc[best_idx, 'answer_correctness']:.3f}")
+
+    print(f"\nWORST PERFORMING QUESTION:")
+    print(f"Question: {questions[worst_idx][:80]}...")
+    print(f"Answer Correctness: {results_df.loc[worst_idx, 'answer_correctness']:.3f}")
+
+    print(f"\nEmbedding cache: {embeddings.hits} hits, {embeddings.misses} API embeddings")
+    from src.cassette import get_cassette
+    cassette = get_cassette()
+    if cassette is not None:
+        print(f"Cassette ({cassette.mode}): {cassette.stats['replayed']} replayed, {cassette.stats['recorded']} recorded")
+    print("\nEvaluation complete!")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,208 @@
 import sqlite3
+import threading
 import time
-from contextlib import contextmanager
+from collections import deque
 from src.helpers import load_config
 
 config = load_config()
 
 max_requests = config['rate_limiting']['max_requests']
 time_window = config['rate_limiting']['time_window']
+db_path = config['rate_limiting']['db_path']
+write_mode = config['rate_limiting']['write_mode']
+flush_interval = config['rate_limiting']['flush_interval']
+sweep_interval = config['rate_limiting']['sweep_interval']
+
+
 class RateLimit:
+    """Sliding-window rate limiter backed by SQLite.
+
+    Every process keeps one persistent WAL-mode connection and an in-memory
+    window of admitted request times per IP. Requests that the in-memory window
+    already rejects never touch the database. Admissions are written in one of
+    two ways:
 
-    def __init__(self, db_path = 'rate_limits.db'):
-        self.requests = {}
+    * `batched` (the default): admissions are decided from memory and written in
+      batches every `flush_interval` seconds, so concurrent requests share one
+      write transaction. Each IP's window is re-read from SQLite once it is
+      older than `flush_interval`, so other processes' requests are seen within
+      about two flush intervals.
+    * `immediate`: count-and-insert in a single `BEGIN IMMEDIATE` transaction,
+      so the limit holds exactly across any number of worker processes.
+
+    A background thread flushes pending writes and periodically deletes rows
+    older than the largest window in use.
+    """
+
+    def __init__(self, db_path = db_path, write_mode = write_mode, flush_interval = flush_interval,
+                 sweep_interval = sweep_interval):
+        if write_mode not in ('immediate', 'batched'):
+            raise ValueError(f"Unknown rate limit write mode: {write_mode}")
         self.db_path = db_path
+        self.write_mode = write_mode
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.Lock()
+        self._windows = {}    # ip -> deque of admitted request times
+        self._synced_at = {}  # ip -> when its window was last read from SQLite
+        self._pending = []    # (ip, request_time) rows waiting for the next flush
+        self._max_window = time_window
+        self._last_sweep = time.time()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
         self._init_db()
 
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run_background, name="rate-limit-writer", daemon=True)
+        self._worker.start()
+
     def _init_db(self):
         """Create table if it doesn't exist"""
-        with self._get_connection() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS rate_limits (
-                    ip_address TEXT,
-                    request_time REAL,
-                    PRIMARY KEY (ip_address, request_time)
-                )
-            """)
-            # Create index for faster queries
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_ip_time 
-                ON rate_limits(ip_address, request_time)
-            """)
-
-    @contextmanager
-    def _get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                ip_address TEXT,
+                request_time REAL,
+                PRIMARY KEY (ip_address, request_time)
+            )
+        """)
+        # Create index for faster queries
+        self._conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_ip_time
+            ON rate_limits(ip_address, request_time)
+        """)
+        # Index for the periodic sweep of expired rows
+        self._conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_time
+            ON rate_limits(request_time)
+        """)
+
+    def _read_window(self, ip_address, cutoff_time):
+        rows = self._conn.execute("""
+            SELECT request_time FROM rate_limits
+            WHERE ip_address = ? AND request_time > ?
+            ORDER BY request_time
+        """, (ip_address, cutoff_time)).fetchall()
+        return deque(row[0] for row in rows)
+
+    def _admit_immediate(self, ip_address, current_time, cutoff_time, max_requests):
+        """Count and insert atomically across processes; returns (allowed, window)."""
+        self._conn.execute("BEGIN IMMEDIATE")
         try:
-            yield conn
-            conn.commit()
-        finally:
-            conn.close()
-    
+            window = self._read_window(ip_address, cutoff_time)
+            allowed = len(window) < max_requests
+            if allowed:
+                self._conn.execute("""
+                    INSERT OR IGNORE INTO rate_limits (ip_address, request_time)
+                    VALUES (?, ?)
+                """, (ip_address, current_time))
+                window.append(current_time)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return allowed, window
+
     def is_allowed(self, ip_address, max_requests=max_requests, time_window=time_window):
         """Check if request is allowed"""
         current_time = time.time()
         cutoff_time = current_time - time_window
-        
-        with self._get_connection() as conn:
-            # STEP 1: Clean old requests (older than time_window)
-            conn.execute("""
-                DELETE FROM rate_limits 
-                WHERE ip_address = ? AND request_time < ?
-            """, (ip_address, cutoff_time))
-            
-            # STEP 2: Count recent requests
-            cursor = conn.execute("""
-                SELECT COUNT(*) FROM rate_limits 
-                WHERE ip_address = ? AND request_time > ?
-            """, (ip_address, cutoff_time))
-            
-            request_count = cursor.fetchone()[0]
-            
-            # STEP 3: Check if over limit
-            if request_count >= max_requests:
-                # Get oldest timestamp to calculate wait time
-                cursor = conn.execute("""
-                    SELECT MIN(request_time) FROM rate_limits 
-                    WHERE ip_address = ?
-                """, (ip_address,))
-                
-                oldest_timestamp = cursor.fetchone()[0]
-                wait_time = int((oldest_timestamp + time_window) - current_time)
-                return False, wait_time
-            
-            # STEP 4: Add new request
-            conn.execute("""
-                INSERT INTO rate_limits (ip_address, request_time) 
-                VALUES (?, ?)
-            """, (ip_address, current_time))
-        
-        return True, None
-    
+
+        with self._lock:
+            self._max_window = max(self._max_window, time_window)
+
+            # STEP 1: Drop expired requests from the in-memory window
+            window = self._windows.get(ip_address)
+            if window is None:
+                window = self._windows[ip_address] = deque()
+            while window and window[0] <= cutoff_time:
+                window.popleft()
+
+            # STEP 2: A window that is already full rejects without touching SQLite
+            if len(window) < max_requests:
+                if self.write_mode == 'immediate':
+                    allowed, window = self._admit_immediate(ip_address, current_time, cutoff_time, max_requests)
+                    self._windows[ip_address] = window
+                    if allowed:
+                        return True, None
+                else:
+                    if current_time - self._synced_at.get(ip_address, 0) > self.flush_interval:
+                        # Merge what other processes have flushed with our own unflushed requests
+                        pending = [t for ip, t in self._pending if ip == ip_address and t > cutoff_time]
+                        window = deque(sorted(set(self._read_window(ip_address, cutoff_time)) | set(pending)))
+                        self._windows[ip_address] = window
+                        self._synced_at[ip_address] = current_time
+
+                    if len(window) < max_requests:
+                        window.append(current_time)
+                        self._pending.append((ip_address, current_time))
+                        return True, None
+
+            # STEP 3: Over the limit, wait until the oldest request in the window expires
+            oldest_timestamp = window[0] if window else current_time
+            wait_time = int((oldest_timestamp + time_window) - current_time)
+            return False, max(wait_time, 0)
+
+    def flush(self):
+        """Write pending admissions in one transaction."""
+        # The connection is shared, so every statement runs under the lock
+        with self._lock:
+            if not self._pending:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("""
+                    INSERT OR IGNORE INTO rate_limits (ip_address, request_time)
+                    VALUES (?, ?)
+                """, self._pending)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending = []
+
+    def sweep(self):
+        """Delete rows no window can still count, and forget idle IPs."""
+        cutoff_time = time.time() - self._max_window
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limits WHERE request_time <= ?", (cutoff_time,))
+            for ip_address in [ip for ip, window in self._windows.items() if not window or window[-1] <= cutoff_time]:
+                del self._windows[ip_address]
+                self._synced_at.pop(ip_address, None)
+        self._last_sweep = time.time()
+
+    def _run_background(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self._last_sweep >= self.sweep_interval:
+                    self.sweep()
+            except sqlite3.Error:
+                # Keep the writer alive; pending rows are retried on the next flush
+                continue
+
+    def close(self):
+        self._stop.set()
+        self._worker.join()
+        self.flush()
+        self._conn.close()
+
     def cleanup_old_records(self, days=7):
         """Clean up records older than X days (maintenance)"""
         cutoff = time.time() - (days * 24 * 3600)
-        with self._get_connection() as conn:
-            conn.execute("DELETE FROM rate_limits WHERE request_time < ?", (cutoff,))
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limits WHERE request_time < ?", (cutoff,))
 
 
+_shared = {}
+_shared_lock = threading.Lock()
 
 
+def get_rate_limiter(db_path = db_path):
+    """Process-wide RateLimit per database, so reruns of app.py reuse one connection and writer thread."""
+    with _shared_lock:
+        if db_path not in _shared:
+            _shared[db_path] = RateLimit(db_path)
+        return _shared[db_path]
@@ -1,17 +1,13 @@
-from langchain_openai import ChatOpenAI
-from pinecone import Pinecone
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain.tools import tool
-from langchain.agents import create_agent
-from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.config import get_stream_writer
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from typing import Literal
-from langchain.agents.middleware import SummarizationMiddleware
 import logging
+import threading
+import uuid
 from src.helpers import load_config
+from src import tracing
+from src.clients import get_chat_model, get_embeddings, get_vector_store
+from src.gating import GateResult, ScoreGate, log_savings
+
+# langchain, langgraph and the retrieval stack are imported on first use, so importing this module stays cheap.
 
 # ============= CONFIGURATION =============
 load_dotenv()
@@ -25,12 +21,19 @@ index_name = config['index_name']
 search_type = config['retrieval']['search_type']
 k = config['retrieval']['k']
 log_file_name = config['logging']['file']
+rerank_k = config['rerank']['k']
+gating_enabled = config['gating']['enabled']
+packing_enabled = config['context_packing']['enabled']
+compaction_config = config['compaction']
+summarization_config = config['summarization']
+answer_cache_enabled = config['answer_cache']['enabled']
+backend = config['vector_store']['backend']
 
 # Logger Setup
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-handler = logging.FileHandler(log_file_name)
+handler = logging.FileHandler(log_file_name, delay=True)
 handler.setLevel(logging.INFO)
 
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -41,34 +44,107 @@ logger.addHandler(handler)
 
 def get_retriever():
     """Initializes and returns the vector store retriever."""
-    embedding_model = OpenAIEmbeddings(model=embedding_model_name, dimensions=dimensions)
-    pc = Pinecone()
-    index = pc.Index(index_name)
-    vector_store = PineconeVectorStore(index=index, embedding=embedding_model)
-    return vector_store.as_retriever(search_type= search_type, search_kwargs={"k": k})
+    from src.retriever import build_retriever
 
-retriever = get_retriever()
+    embedding_model = get_embeddings(embedding_model_name, dimensions)
+    vector_store = get_vector_store(embedding_model)
+    return build_retriever(vector_store, search_type=search_type, k=k)
 
-# ============= TOOLS =============
-class RelevanceOutput(BaseModel):
-    output: Literal["yes", "no"]
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared(name, factory):
+    """Builds a process-wide object once; readers after the first build never take the lock."""
+    value = _shared.get(name)
+    if value is None:
+        with _shared_lock:
+            value = _shared.get(name)
+            if value is None:
+                value = _shared[name] = factory()
+    return value
+
+
+def get_shared_retriever():
+    """The retriever shared by every session in this process."""
+    return _get_shared('retriever', get_retriever)
+
+
+def get_shared_chunk_store():
+    """The local chunk store (chunk ID -> text and metadata) that compacted tool results are rehydrated from."""
+    from src.chunk_store import get_chunk_store
+
+    return _get_shared('chunk_store', lambda: get_chunk_store(backend))
+
+
+def get_context_docs(ids):
+    """Chunks for `ids`, in order: from the local chunk store, else from the vector store.
 
+    The chunk store is only written by indexing runs, so a deployed app may not
+    have it; the vector store holds every indexed chunk under its own id.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = {doc.id: doc for doc in get_shared_chunk_store().get_by_ids(ids)}
+    missing = [doc_id for doc_id in ids if doc_id not in found]
+    if missing:
+        vector_store = get_vector_store(get_embeddings(embedding_model_name, dimensions))
+        found.update((doc.id, doc) for doc in vector_store.get_by_ids(missing))
+    return [found[doc_id] for doc_id in ids if doc_id in found]
+
+
+def get_answer_cache():
+    """The process-wide first-turn answer cache, or None when it is disabled."""
+    if not answer_cache_enabled:
+        return None
+    from src.answer_cache import AnswerCache
+
+    return _get_shared('answer_cache', AnswerCache)
+
+
+def get_thread_id():
+    """A new conversation id; sessions sharing the agent are isolated only by their thread_id."""
+    return str(uuid.uuid4())
+
+
+def get_run_config(thread_id, callbacks=()):
+    """Run config for one turn of a conversation, with the tracing callbacks when tracing is on.
+
+    Extra `callbacks` (e.g. a `RequestMeter`'s handler) are attached to this run only.
+    """
+    return {"configurable": {"thread_id": thread_id}, "callbacks": [*tracing.get_callbacks(), *callbacks]}
+
+# ============= TOOLS =============
 def validate_relevance(query: str, docs: list) -> list:
-    """Filter docs by relevance score"""
-    relevance_checker_model = ChatOpenAI(model= model, temperature=temperature).with_structured_output(RelevanceOutput)
-    
-    filtered_docs = []
-    for doc in docs:
-        prompt = f"""Rate if this document is relevant to the query (yes/no) only:
-            Query : {query}
-            Document : {doc.page_content}
-            Answer : 
-        """
-        response = relevance_checker_model.invoke(prompt)
-        if response.output == 'yes':
-            filtered_docs.append(doc)
-    
-    return filtered_docs
+    """Filter docs by relevance, keeping at most `rerank.k` of them in rank order"""
+    from src.relevance import RelevanceValidator
+
+    validator = RelevanceValidator()
+    return list(validator.iter_relevant(query, docs))
+
+
+def select_relevant_docs(query: str, docs: list, writer) -> list:
+    """Accept/drop docs by similarity score and LLM-validate only the ambiguous ones.
+
+    Returns at most `rerank.k` docs in retrieval-rank order.
+    """
+    from src.relevance import RelevanceValidator
+
+    gate = ScoreGate().split(docs) if gating_enabled else GateResult(ambiguous=list(docs))
+
+    selected = gate.accepted[:rerank_k]
+    for doc in selected:
+        writer(f"Accepted source: {doc.metadata['book_name']} (Page: {doc.metadata['page']})")
+
+    # Validate the ambiguous documents, reporting each accepted source as it arrives.
+    validator = RelevanceValidator(limit=rerank_k - len(selected))
+    if validator.limit > 0 and gate.ambiguous:
+        for doc in validator.iter_relevant(query, gate.ambiguous):
+            selected.append(doc)
+            writer(f"Accepted source: {doc.metadata['book_name']} (Page: {doc.metadata['page']})")
+    log_savings(query, len(docs), gate, validator.llm_calls)
+
+    rank = {id(doc): i for i, doc in enumerate(docs)}
+    return sorted(selected, key=lambda doc: rank[id(doc)])
 
 
 def rewrite_query(query: str) -> str:
@@ -76,7 +152,7 @@ def rewrite_query(query: str) -> str:
     try:
         
         # Rewriting the user's query using LLM.
-        rewriter = ChatOpenAI(model=model, temperature=temperature)
+        rewriter = get_chat_model(model, temperature)
 
         # Prompt 
         rewrite_query = f"""Rewrite this medical question to be more specific and searchable.
@@ -86,7 +162,7 @@ def rewrite_query(query: str) -> str:
         """
 
         # Executing the LLM.
-        rewritten = rewriter.invoke(rewrite_query).content
+        rewritten = rewriter.invoke(rewrite_query, config={'tags': ['stage:rewrite']}).content
 
         return rewritten
 
@@ -96,18 +172,23 @@ def rewrite_query(query: str) -> str:
 
 
 
-@tool
 def retrieve_context(query: str):
     """Retrieve information to help answer a query"""
+    from langgraph.config import get_stream_writer
+
     try:
         # This writer is useful to give updates to the user 
         writer = get_stream_writer()
 
         writer(f'Rewriting the query for better searching...')
-        rewritten_query = rewrite_query(query)
+        with tracing.span('rewrite'):
+            rewritten_query = rewrite_query(query)
         
         # Retreiving the relevant documents from the vector store.
-        retrieved_docs = retriever.invoke(rewritten_query)
+        retriever = get_shared_retriever()
+        with tracing.span('retrieve'):
+            retrieved_docs = retriever.invoke(rewritten_query)
+        logger.info(f"Retrieval cache stats: {retriever.cache_stats()}")
 
         # If there are no relevant docs, just return empty
         if not retrieved_docs:
@@ -116,8 +197,9 @@ def retrieve_context(query: str):
             return "No relevant information found.", []
         writer(f'Found {len(retrieved_docs)} sources. Checking for relevance...')
 
-        # Validate the relevancy of the retrieved documents.
-        filtered_docs = validate_relevance(query, retrieved_docs)
+        # Validate the relevancy of the retrieved documents, skipping the LLM where the score is decisive.
+        with tracing.span('validate', docs=len(retrieved_docs)):
+            filtered_docs = select_relevant_docs(query, retrieved_docs, writer)
 
         # If none of them are relevant, return empty
         if not filtered_docs:
@@ -126,6 +208,15 @@ def retrieve_context(query: str):
 
         writer(f'Found {len(filtered_docs)} relevant sources.')
 
+        # Merge, de-duplicate and fit the documents into the context token budget
+        if packing_enabled:
+            from src.context_packing import ContextPacker
+
+            with tracing.span('pack', docs=len(filtered_docs)):
+                packed = ContextPacker(model_name=model).pack(filtered_docs)
+            logger.info(f"Context packing: {packed.stats}")
+            return packed.text, packed.docs
+
         # Join all the documents and return
         serialized = "\n\n".join((f"Source: {doc.metadata['book_name']} (Page: {doc.metadata['page']})\nContent: {doc.page_content}") for doc in filtered_docs)
         return serialized, filtered_docs
@@ -137,9 +228,33 @@ def retrieve_context(query: str):
 
 
 
+def rehydrate_context(ids: list[str]) -> str:
+    """Read the full text of context retrieved in an earlier turn, by the chunk ids in its compacted reference"""
+    from src.context_packing import ContextPacker
+
+    try:
+        docs = get_context_docs(ids)
+        if not docs:
+            return "No stored context found for these ids."
+        # Re-pack so neighbouring chunks of a page are merged again and the budget still holds
+        return ContextPacker(model_name=model).pack(docs).text
+
+    except Exception as e:
+        logger.error(f"Rehydration Error: {str(e)}", exc_info=True)
+        return f"Error while reading stored context: {str(e)}"
+
+
+
 # ============= AGENT SETUP =============
 def get_agent():
     """Creates and returns the LangGraph agent."""
+    from langchain.agents import create_agent
+    from langchain.tools import tool
+    from src.checkpoint import get_checkpointer
+    from src.metering import count_message_tokens
+    from src.middleware import (BackgroundSummarizationMiddleware, CompactToolResultsMiddleware,
+                                TracedSummarizationMiddleware, TracingMiddleware)
+
     system_prompt = """You are an expert Medical Chatbot assistant. Your name is MedBot. Your role is to:
 
     1. Help users with medical questions using the medical database available to you.
@@ -150,22 +265,126 @@ def get_agent():
     6. Be empathetic and clear in your explanations.
 
     Important: This is NOT a replacement for professional medical advice. Always recommend consulting a healthcare provider for diagnosis or treatment decisions."""
-    checkpointer = InMemorySaver()
+    checkpointer = get_checkpointer()
+
+    tools = [tool(retrieve_context, response_format="content_and_artifact")]
+    middleware = [TracingMiddleware()]
+    if summarization_config['mode'] == 'background':
+        # Listed before compaction: end-of-turn hooks run last to first, so it measures the compacted history
+        middleware.append(BackgroundSummarizationMiddleware(
+            model=get_chat_model(model),
+            trigger_tokens=summarization_config['trigger_tokens'],
+            keep_tokens=summarization_config['keep_tokens'],
+            max_workers=summarization_config['max_workers'],
+            max_pending=summarization_config['max_pending'],
+            model_name=model,
+        ))
+    elif summarization_config['mode'] == 'blocking':
+        middleware.append(TracedSummarizationMiddleware(
+            model=get_chat_model(model),
+            trigger=("tokens", summarization_config['trigger_tokens']),
+            keep=("tokens", summarization_config['keep_tokens']),
+            token_counter=lambda messages: count_message_tokens(messages, model),
+        ))
+    else:
+        raise ValueError(f"Unknown summarization mode: {summarization_config['mode']}")
+    if compaction_config['enabled']:
+        # Earlier turns' retrieved context is kept as references; the full text is read back on demand
+        system_prompt += """
+
+    Context retrieved in earlier turns is shown as compacted references. If you need its full text, call rehydrate_context with the ids listed in the reference."""
+        tools.append(tool(rehydrate_context))
+        middleware.append(CompactToolResultsMiddleware(
+            tool_names=['retrieve_context'],
+            rehydrate_tool='rehydrate_context',
+            snippet_chars=compaction_config['snippet_chars'],
+            resolve=get_context_docs,
+        ))
 
 
     agent = create_agent(
-        model=ChatOpenAI(model=model),
-        tools=[retrieve_context],
+        model=get_chat_model(model),
+        tools=tools,
         system_prompt=system_prompt,
         checkpointer=checkpointer,
-        middleware=[
-            SummarizationMiddleware(
-                model = ChatOpenAI(model = model),
-                trigger = ("messages", 10),
-                keep = ("messages", 3)
-            )
-        ]
+        middleware=middleware,
     )
     return agent
 
 
+def get_shared_agent():
+    """The compiled agent shared by every session and thread in this process.
+
+    The graph holds no per-conversation state: conversations are kept apart by
+    the `thread_id` in the run config and stored in the shared checkpointer.
+    """
+    return _get_shared('agent', get_agent)
+
+
+def _get_exit_node(agent):
+    """The node whose writes end a turn; a replayed turn is recorded as if it had run."""
+    return _get_shared(('exit_node', id(agent)), lambda: next(
+        edge.source for edge in agent.get_graph().edges if edge.target == '__end__'))
+
+
+def stream_response(agent, question, config):
+    """Streams one turn as the `(stream_mode, chunk)` pairs of `agent.stream(..., stream_mode=["messages", "custom"])`.
+
+    When the question opens a conversation and is in the answer cache, its
+    sources are replayed as status updates and the answer as `model` message
+    chunks, and the turn is written to the thread so the conversation can go
+    on. A first-turn answer grounded in retrieved sources is cached; turns of a
+    thread that already has messages bypass the cache.
+    """
+    from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+    from src.answer_cache import replay_chunks
+    from src.context_packing import citation
+
+    cache = get_answer_cache()
+    first_turn = cache is not None and not agent.get_state(config).values.get('messages')
+    if first_turn:
+        cached = cache.get(question)
+        if cached is not None:
+            logger.info(f"Answer cache hit: '{question[:100]}'")
+            for source in cached.citations:
+                yield "custom", f"Source: {source}"
+            for piece in replay_chunks(cached.answer):
+                yield "messages", (AIMessageChunk(content=piece), {'langgraph_node': 'model', 'answer_cache': True})
+            agent.update_state(config, {"messages": [HumanMessage(question), AIMessage(cached.answer)]},
+                               as_node=_get_exit_node(agent))
+            return
+
+    citations = []
+    for stream_mode, chunk in agent.stream({
+        "messages": [{"role": "user", "content": question}]
+    }, config=config, stream_mode=["messages", "custom"]):
+        if first_turn and stream_mode == "messages":
+            token, _ = chunk
+            if isinstance(token, ToolMessage) and token.name == 'retrieve_context' and token.artifact:
+                for doc in token.artifact:
+                    citations.extend(c for c in doc.metadata.get('citations') or [citation(doc)] if c not in citations)
+        yield stream_mode, chunk
+
+    if first_turn and citations:
+        # The model node also streams the text it writes before a tool call, so
+        # the answer is the final message of the turn rather than the chunks.
+        messages = agent.get_state(config).values.get('messages') or []
+        final = messages[-1] if messages else None
+        if (isinstance(final, AIMessage) and not final.tool_calls and isinstance(final.content, str)
+                and final.content.strip()):
+            cache.set(question, final.content, citations)
+
+
+def warm_up(query=None):
+    """Builds the shared agent and retriever ahead of the first request.
+
+    With a `query`, also runs one retrieval, which opens the embedding and
+    vector store connections and loads the lexical index.
+    """
+    tracing.start_from_config()
+    agent = get_shared_agent()
+    retriever = get_shared_retriever()
+    if query:
+        retriever.invoke(query)
+    logger.info("Agent warmed up")
+    return agent
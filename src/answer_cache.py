@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from glob import glob
+
+from src.cache import LRUCache, get_index_version, normalize_text
+from src.helpers import load_config
+
+config = load_config()
+
+model = config['model']['name']
+answer_cache_config = config['answer_cache']
+ground_truths_pattern = os.path.join(config['paths']['ground_truths'], '*.json')
+
+
+@dataclass
+class CachedAnswer:
+    """A first-turn answer with the citations of the context it was grounded in."""
+    question: str
+    answer: str
+    citations: list = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """Full answers to first-turn questions, keyed by normalized question, model and index version.
+
+    Only the first turn of a conversation is looked up, since later answers
+    depend on the history. A rebuild of the index changes the version and so
+    invalidates every entry. Entries are bounded by count, bytes and TTL.
+    """
+
+    def __init__(self, max_entries=answer_cache_config['max_entries'], max_bytes=answer_cache_config['max_bytes'],
+                 ttl=answer_cache_config['ttl'], sqlite_path=answer_cache_config['sqlite_path'], model_name=model):
+        self.model_name = model_name
+        self._cache = LRUCache(namespace='answers', max_entries=max_entries, max_bytes=max_bytes, ttl=ttl,
+                               sqlite_path=sqlite_path)
+
+    def key(self, question):
+        digest = hashlib.sha256(normalize_text(question).encode('utf-8')).hexdigest()
+        return f"{get_index_version()}:{self.model_name}:{digest}"
+
+    def get(self, question):
+        return self._cache.get(self.key(question))
+
+    def set(self, question, answer, citations):
+        entry = CachedAnswer(question=question, answer=answer, citations=list(citations))
+        self._cache.set(self.key(question), entry)
+        return entry
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def replay_chunks(text, size=answer_cache_config['replay_chunk_chars']):
+    """Splits a cached answer into stream-sized pieces at word boundaries."""
+    pieces, start = [], 0
+    while start < len(text):
+        end = text.find(' ', start + size)
+        end = len(text) if end == -1 else end + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+# ============= WARM-UP =============
+
+def load_faq(path):
+    """Questions from a FAQ file: a JSON list of strings or {"question": ...} objects, or one question per line."""
+    with open(path, 'r') as f:
+        if path.endswith('.json'):
+            return [item['question'] if isinstance(item, dict) else item for item in json.load(f)]
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def load_warm_questions(pattern=ground_truths_pattern, faq_paths=()):
+    """Ground-truth and FAQ questions, de-duplicated on their normalized form."""
+    questions = []
+    for file_name in sorted(glob(pattern)) if pattern else []:
+        with open(file_name, 'r') as f:
+            questions.extend(item['question'] for item in json.load(f))
+    for path in faq_paths:
+        questions.extend(load_faq(path))
+    return list({normalize_text(question): question for question in questions}.values())
+
+
+def warm(questions, workers=answer_cache_config['warm_workers'], force=False):
+    """Answers each question in a fresh thread so its first-turn answer lands in the cache."""
+    from src.agent import get_answer_cache, get_run_config, get_shared_agent, get_thread_id, stream_response
+
+    agent = get_shared_agent()
+    cache = get_answer_cache()
+    if cache is None:
+        raise ValueError("answer_cache.enabled is false")
+    if force:
+        cache.clear()
+
+    def answer(question):
+        if cache.get(question) is not None:
+            return 'cached'
+        try:
+            for _ in stream_response(agent, question, get_run_config(get_thread_id())):
+                pass
+        except Exception as e:
+            return f"error: {e}"
+        return 'added' if cache.get(question) is not None else 'not cacheable'
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, (question, outcome) in enumerate(zip(questions, executor.map(answer, questions)), start=1):
+            status = outcome.split(':')[0]
+            counts[status] = counts.get(status, 0) + 1
+            print(f"[{i}/{len(questions)}] {outcome:<14} {question[:80]}")
+    return counts
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="First-turn answer cache.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    warm_parser = subparsers.add_parser('warm', help="Pre-compute answers for the ground-truth and FAQ questions.")
+    warm_parser.add_argument('--ground-truths', default=ground_truths_pattern,
+                             help="Glob of ground-truth files; pass '' to skip them.")
+    warm_parser.add_argument('--faq', nargs='*', default=[], help="FAQ files (.json list or one question per line).")
+    warm_parser.add_argument('--workers', type=int, default=answer_cache_config['warm_workers'])
+    warm_parser.add_argument('--force', action='store_true', help="Clear the cache and answer everything again.")
+    subparsers.add_parser('clear', help="Drop every cached answer.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.command == 'warm':
+        questions = load_warm_questions(args.ground_truths, args.faq)
+        print(f"Warming the answer cache with {len(questions)} questions")
+        print(warm(questions, workers=args.workers, force=args.force))
+    else:
+        AnswerCache().clear()
+        print("Answer cache cleared")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+from src.helpers import load_config
+
+config = load_config()
+
+index_version_file = config['cache']['index_version_file']
+
+
+def normalize_text(text):
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a query."""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' ?!.')
+
+
+# ============= INDEX VERSION =============
+# Every rebuild of the index writes a fresh version. Caches whose entries depend
+# on the index contents put the version in their keys, so a rebuild invalidates
+# them in every running process without any coordination.
+
+_version = {'mtime': None, 'value': 'unversioned'}
+_version_lock = threading.Lock()
+
+
+def get_index_version(path=index_version_file):
+    """Returns the current index version, re-reading the file only when it changes."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 'unversioned'
+
+    with _version_lock:
+        if _version['mtime'] != mtime:
+            with open(path, 'r') as f:
+                _version['value'] = f.read().strip() or 'unversioned'
+            _version['mtime'] = mtime
+        return _version['value']
+
+
+def bump_index_version(path=index_version_file):
+    """Marks the index as rebuilt and returns the new version."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    version = uuid.uuid4().hex
+    with open(path, 'w') as f:
+        f.write(version)
+    return version
+
+
+# ============= LRU + TTL CACHE =============
+
+class LRUCache:
+    """Thread-safe LRU cache with TTL expiry, an entry/byte bound and an optional SQLite tier.
+
+    The in-memory tier evicts least recently used entries once `max_entries` or
+    `max_bytes` (measured on the pickled value) is exceeded. When `sqlite_path`
+    is set every write also goes to disk, so entries survive restarts and a
+    memory miss falls back to the disk tier before counting as a miss.
+    """
+
+    def __init__(self, namespace, max_entries=1024, max_bytes=None, ttl=None, sqlite_path=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._conn = self._connect(sqlite_path) if sqlite_path else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self, sqlite_path):
+        os.makedirs(os.path.dirname(sqlite_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT,
+                key TEXT,
+                value BLOB,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.commit()
+        return conn
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    def _store(self, key, blob, expires_at):
+        if key in self._data:
+            self._bytes -= len(self._data.pop(key)[0])
+        self._data[key] = (blob, expires_at)
+        self._bytes += len(blob)
+
+        while self._data and (
+            len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _, (evicted, _) = self._data.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _get_from_disk(self, key):
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+
+        blob, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+            self._conn.commit()
+            return None
+
+        self._store(key, blob, expires_at)
+        return blob
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                blob, expires_at = entry
+                if expires_at is None or expires_at >= time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(blob)
+                self._bytes -= len(self._data.pop(key)[0])
+
+            if self._conn is not None:
+                blob = self._get_from_disk(key)
+                if blob is not None:
+                    self.disk_hits += 1
+                    return pickle.loads(blob)
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = self._expires_at()
+        with self._lock:
+            self._store(key, blob, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, blob, expires_at),
+                )
+                self._conn.commit()
+
+    def clear(self):
+        """Drops every entry of this namespace from memory and disk."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'namespace': self.namespace,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,449 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.documents import BaseDocumentCompressor
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.vectorstores import VectorStore
+from pydantic import PrivateAttr
+
+from src.helpers import load_config
+
+config = load_config()
+
+cassette_config = config['cassette']
+
+MODES = ('off', 'record', 'replay', 'auto')
+
+# Inner calls run without the caller's callbacks, so a recorded call streams and traces once, not twice
+_NO_CALLBACKS = {"callbacks": []}
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def request_key(request):
+    """Stable hash of a JSON-like request description."""
+    payload = json.dumps(request, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Record/replay store for external API calls, keyed by (kind, request hash).
+
+    Modes:
+      * `record`: every call goes to the API and its response is saved.
+      * `replay`: responses are served from the store; a miss raises CassetteMiss.
+      * `auto`: replay what was recorded, record the rest.
+
+    Responses are stored as zlib-compressed pickles in SQLite, with the latency
+    of the original call. Replayed calls sleep `replay_latency` seconds, or the
+    recorded latency when it is 'recorded'.
+    """
+
+    def __init__(self, mode=cassette_config['mode'], path=cassette_config['path'],
+                 replay_latency=cassette_config['replay_latency']):
+        if mode not in MODES or mode == 'off':
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.replay_latency = replay_latency
+        self.stats = {'replayed': 0, 'recorded': 0}
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cassette (
+                    kind TEXT,
+                    key TEXT,
+                    value BLOB,
+                    latency REAL,
+                    created_at REAL,
+                    PRIMARY KEY (kind, key)
+                )
+            """)
+            self._conn.commit()
+
+    def lookup(self, kind, key):
+        """Recorded response for the request, or None; sleeps the replay latency on a hit."""
+        if self.mode == 'record':
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value, latency FROM cassette WHERE kind = ? AND key = ?",
+                                     (kind, key)).fetchone()
+        if row is None:
+            if self.mode == 'replay':
+                raise CassetteMiss(f"No recorded {kind} response for request {key[:12]}; record it first")
+            return None
+        delay = row[1] if self.replay_latency == 'recorded' else self.replay_latency
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.stats['replayed'] += 1
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def record(self, kind, key, value, latency):
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cassette (kind, key, value, latency, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, blob, latency, time.time()),
+            )
+            self._conn.commit()
+            self.stats['recorded'] += 1
+
+    def call(self, kind, request, fn):
+        """Replays the response to `request`, or calls fn() and records it."""
+        key = request_key(request)
+        value = self.lookup(kind, key)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = fn()
+        self.record(kind, key, value, time.perf_counter() - start)
+        return value
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT kind, COUNT(*) FROM cassette GROUP BY kind").fetchall())
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_mode():
+    """`MEDBOT_CASSETTE` if set, else `cassette.mode`."""
+    return os.environ.get('MEDBOT_CASSETTE') or cassette_config['mode']
+
+
+def get_cassette():
+    """The process-wide cassette, or None when recording and replay are off."""
+    global _cassette
+    mode = get_mode()
+    if mode == 'off':
+        return None
+    with _cassette_lock:
+        if _cassette is None or _cassette.mode != mode:
+            _cassette = Cassette(mode=mode)
+        return _cassette
+
+
+# ============= CHAT MODELS =============
+
+def _message_request(message: BaseMessage):
+    # Message ids are random per run, so only the content that reaches the API is hashed
+    request = {'type': message.type, 'content': message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        request['tool_calls'] = [(call['name'], call['args'], call['id']) for call in message.tool_calls]
+    for attribute in ('tool_call_id', 'name'):
+        if getattr(message, attribute, None):
+            request[attribute] = getattr(message, attribute)
+    return request
+
+
+def _to_chunk(message: AIMessage) -> AIMessageChunk:
+    return AIMessageChunk(
+        content=message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        usage_metadata=message.usage_metadata,
+        id=message.id,
+        tool_call_chunks=[
+            tool_call_chunk(name=call['name'], args=json.dumps(call['args']), id=call['id'], index=i)
+            for i, call in enumerate(message.tool_calls)
+        ],
+    )
+
+
+def _reroute(runnable, model, replacement):
+    """`runnable` with every step that calls `model` calling `replacement` instead; unchanged parts are shared."""
+    if runnable is model:
+        return replacement
+    if isinstance(runnable, BaseChatModel):
+        return runnable
+
+    update = {}
+    # Pydantic runnables (sequences, bindings, parallels, ...) hold their steps in fields; others are leaves
+    for field in getattr(type(runnable), 'model_fields', {}):
+        value = getattr(runnable, field)
+        if isinstance(value, Runnable):
+            rerouted = _reroute(value, model, replacement)
+            changed = rerouted is not value
+        elif isinstance(value, (list, dict)):
+            # e.g. the steps of a RunnableParallel or the fallbacks of a RunnableWithFallbacks
+            items = list(value.items() if isinstance(value, dict) else enumerate(value))
+            pairs = [(key, _reroute(item, model, replacement) if isinstance(item, Runnable) else item)
+                     for key, item in items]
+            changed = any(new is not old for (_, new), (_, old) in zip(pairs, items))
+            rerouted = dict(pairs) if isinstance(value, dict) else [item for _, item in pairs]
+        else:
+            continue
+        if changed:
+            update[field] = rerouted
+    return runnable.model_copy(update=update) if update else runnable
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model wrapper that records and replays responses through a Cassette.
+
+    `bind_tools` and `with_structured_output` delegate to the wrapped model, so
+    tool calling and structured output (with the wrapped model's default
+    method) send the same request parameters as the unwrapped model would.
+    """
+
+    model: BaseChatModel
+    cassette: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.model._llm_type}"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        bound = self.model.bind_tools(tools, tool_choice=tool_choice, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        # The wrapped model picks the method (e.g. json_schema for OpenAI); its model call is routed through the cassette
+        return _reroute(self.model.with_structured_output(schema, **kwargs), self.model, self)
+
+    def _key(self, messages, stop, kwargs):
+        return request_key({
+            'model': self.model._identifying_params,
+            'messages': [_message_request(message) for message in messages],
+            'stop': stop,
+            'kwargs': {key: value for key, value in kwargs.items() if not key.startswith('ls_')},
+        })
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        message = self.cassette.lookup('chat', key)
+        if message is None:
+            start = time.perf_counter()
+            message = self.model.invoke(messages, config=_NO_CALLBACKS, stop=stop, **kwargs)
+            self.cassette.record('chat', key, message, time.perf_counter() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, kwargs)
+        message = self.cassette.lookup('chat', key)
+        if message is not None:
+            chunk = ChatGenerationChunk(message=_to_chunk(message))
+            if run_manager:
+                run_manager.on_llm_new_token(message.text, chunk=chunk)
+            yield chunk
+            return
+
+        start = time.perf_counter()
+        final = None
+        for message_chunk in self.model.stream(messages, config=_NO_CALLBACKS, stop=stop, **kwargs):
+            # Models without native streaming yield their whole AIMessage once
+            if not isinstance(message_chunk, AIMessageChunk):
+                message_chunk = _to_chunk(message_chunk)
+            final = message_chunk if final is None else final + message_chunk
+            chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(message_chunk.text, chunk=chunk)
+            yield chunk
+        if final is not None:
+            self.cassette.record('chat', key, message_chunk_to_message(final), time.perf_counter() - start)
+
+
+# ============= EMBEDDINGS =============
+
+class CassetteEmbeddings(Embeddings):
+    """Embeddings wrapper that records and replays vectors per text."""
+
+    def __init__(self, embeddings, cassette):
+        self.embeddings = embeddings
+        self.cassette = cassette
+        # Passed through so wrappers such as CachedEmbeddings see the same model and size
+        self.model = getattr(embeddings, 'model', None)
+        self.dimensions = getattr(embeddings, 'dimensions', None)
+        self.model_id = (type(embeddings).__name__, self.model, self.dimensions)
+
+    def _key(self, text):
+        return request_key({'model': self.model_id, 'text': text})
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = [self.cassette.lookup('embedding', key) for key in keys]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            start = time.perf_counter()
+            embedded = self.embeddings.embed_documents([texts[i] for i in misses])
+            latency = (time.perf_counter() - start) / len(misses)
+            for i, vector in zip(misses, embedded):
+                self.cassette.record('embedding', keys[i], vector, latency)
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+# ============= VECTOR STORES =============
+
+class CassetteVectorStore(VectorStore):
+    """Vector store wrapper that records and replays search results.
+
+    The wrapped store is built by `factory` on the first call that needs it,
+    so a fully replayed run never connects to it. Writes pass through unrecorded.
+    """
+
+    def __init__(self, factory, embeddings, name, cassette):
+        self._factory = factory
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._embeddings = embeddings
+        self.name = name
+        self.cassette = cassette
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = self._factory()
+        return self._store
+
+    def __getattr__(self, name):
+        # Anything not recorded (e.g. LocalVectorStore.build_ivf) goes straight to the wrapped store
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def _search(self, method, query, **kwargs):
+        request = {'store': self.name, 'method': method, 'query': query, 'kwargs': kwargs}
+        return self.cassette.call('vector', request, lambda: getattr(self.store, method)(query, **kwargs))
+
+    def _search_by_vector(self, method, embedding, **kwargs):
+        digest = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        request = {'store': self.name, 'method': method, 'embedding': digest, 'kwargs': kwargs}
+        return self.cassette.call('vector', request, lambda: getattr(self.store, method)(embedding, **kwargs))
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self._search('similarity_search', query, k=k, **kwargs)
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self._search('similarity_search_with_score', query, k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return self._search_by_vector('similarity_search_by_vector', embedding, k=k, **kwargs)
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        return self._search_by_vector('similarity_search_by_vector_with_score', embedding, k=k, **kwargs)
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self._search('max_marginal_relevance_search', query, k=k, fetch_k=fetch_k,
+                            lambda_mult=lambda_mult, **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self._search_by_vector('max_marginal_relevance_search_by_vector', embedding, k=k, fetch_k=fetch_k,
+                                      lambda_mult=lambda_mult, **kwargs)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        return self.store.add_texts(texts, metadatas=metadatas, **kwargs)
+
+    def add_documents(self, documents, **kwargs):
+        return self.store.add_documents(documents, **kwargs)
+
+    def delete(self, ids=None, **kwargs):
+        return self.store.delete(ids=ids, **kwargs)
+
+    def get_by_ids(self, ids):
+        return self.store.get_by_ids(ids)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, store_cls, name=None, cassette=None, **kwargs):
+        """Builds `store_cls.from_texts(...)` and wraps it.
+
+        The texts are written to the wrapped store, since writes are never
+        recorded; the remaining `kwargs` go to `store_cls.from_texts`. `cassette`
+        defaults to the process-wide one, so recording or replay must be on.
+        """
+        cassette = cassette or get_cassette()
+        if cassette is None:
+            raise ValueError(f"Recording and replay are off; use {store_cls.__name__}.from_texts directly")
+        store = store_cls.from_texts(texts, embedding, metadatas=metadatas, **kwargs)
+        return cls(lambda: store, embedding, name or store_cls.__name__, cassette)
+
+
+# ============= RERANKERS =============
+
+class CassetteReranker(BaseDocumentCompressor):
+    """Document compressor (e.g. CohereRerank) wrapper that records and replays reranked documents.
+
+    The wrapped compressor is built by `factory` on the first recorded call.
+    """
+
+    factory: Callable[[], BaseDocumentCompressor]
+    name: str
+    cassette: Any
+
+    _compressor: Optional[BaseDocumentCompressor] = PrivateAttr(default=None)
+
+    def compress_documents(self, documents, query, callbacks=None):
+        def rerank():
+            if self._compressor is None:
+                self._compressor = self.factory()
+            return list(self._compressor.compress_documents(documents, query, callbacks=callbacks))
+
+        request = {
+            'reranker': self.name,
+            'query': query,
+            'documents': [(doc.id, doc.page_content) for doc in documents],
+        }
+        return self.cassette.call('rerank', request, rerank)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the record/replay cassette.")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--kind', choices=['chat', 'embedding', 'vector', 'rerank'], default=None)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(cassette_config['path']):
+        print(f"No recordings at {cassette_config['path']}")
+        return
+    conn = sqlite3.connect(cassette_config['path'])
+    if args.command == 'stats':
+        rows = conn.execute("SELECT kind, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cassette GROUP BY kind")
+        for kind, count, size in rows:
+            print(f"{kind:<10} {count:>8} responses {size / 1e6:>8.2f} MB")
+    else:
+        if args.kind:
+            conn.execute("DELETE FROM cassette WHERE kind = ?", (args.kind,))
+        else:
+            conn.execute("DELETE FROM cassette")
+        conn.commit()
+        print(f"Cleared {args.kind or 'all'} recordings")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
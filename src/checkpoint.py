@@ -0,0 +1,263 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.helpers import load_config
+
+config = load_config()
+
+checkpointer_config = config['checkpointer']
+
+
+class BoundedSaver(InMemorySaver):
+    """InMemorySaver that keeps only the most recently used threads in memory.
+
+    Threads live in memory while they are "hot". A thread is evicted to SQLite,
+    as one zlib-compressed pickle of its checkpoints, writes and channel blobs,
+    once it has been idle for `idle_ttl` seconds or when more than
+    `max_hot_threads` threads are hot. It is loaded back on its next access.
+    Each thread keeps only its last `keep_checkpoints` checkpoints per namespace.
+    A background thread periodically persists hot threads that changed, so a
+    restart loses at most `flush_interval` seconds of conversation.
+    """
+
+    def __init__(self, path=checkpointer_config['path'], max_hot_threads=checkpointer_config['max_hot_threads'],
+                 idle_ttl=checkpointer_config['idle_ttl'], keep_checkpoints=checkpointer_config['keep_checkpoints'],
+                 flush_interval=checkpointer_config['flush_interval'],
+                 compression_level=checkpointer_config['compression_level']):
+        super().__init__()
+        self.path = path
+        self.max_hot_threads = max_hot_threads
+        self.idle_ttl = idle_ttl
+        self.keep_checkpoints = keep_checkpoints
+        self.flush_interval = flush_interval
+        self.compression_level = compression_level
+
+        self._lock = threading.RLock()
+        self._hot = OrderedDict()  # thread_id -> last access time, least recently used first
+        self._keys = {}            # thread_id -> (blob keys, write keys) held in memory
+        self._dirty = set()        # hot threads changed since they were last persisted
+        self.loads = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                data BLOB,
+                updated_at REAL
+            )
+        """)
+
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run_background, name="checkpoint-writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    # ---------- hot set ----------
+
+    def _touch(self, thread_id):
+        """Marks a thread as used, loading it from disk if it was evicted."""
+        if thread_id not in self._hot:
+            self._load(thread_id)
+        self._hot[thread_id] = time.time()
+        self._hot.move_to_end(thread_id)
+        while len(self._hot) > self.max_hot_threads:
+            self._evict(next(iter(self._hot)))
+
+    def _load(self, thread_id):
+        row = self._conn.execute("SELECT data FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        blob_keys, write_keys = self._keys[thread_id] = (set(), set())
+        if row is None:
+            return
+        storage, writes, blobs = pickle.loads(zlib.decompress(row[0]))
+        self.storage[thread_id] = defaultdict(dict, storage)
+        self.writes.update(writes)
+        self.blobs.update(blobs)
+        write_keys.update(writes)
+        blob_keys.update(blobs)
+        self.loads += 1
+
+    def _serialize(self, thread_id):
+        blob_keys, write_keys = self._keys[thread_id]
+        record = (
+            dict(self.storage.get(thread_id, {})),
+            {key: self.writes[key] for key in write_keys if key in self.writes},
+            {key: self.blobs[key] for key in blob_keys if key in self.blobs},
+        )
+        return zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), self.compression_level)
+
+    def _persist(self, thread_ids):
+        if not thread_ids:
+            return
+        rows = [(thread_id, self._serialize(thread_id), time.time()) for thread_id in thread_ids]
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("INSERT OR REPLACE INTO threads (thread_id, data, updated_at) VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._dirty.difference_update(thread_ids)
+
+    def _drop_from_memory(self, thread_id):
+        blob_keys, write_keys = self._keys.pop(thread_id, (set(), set()))
+        self.storage.pop(thread_id, None)
+        for key in write_keys:
+            self.writes.pop(key, None)
+        for key in blob_keys:
+            self.blobs.pop(key, None)
+        self._hot.pop(thread_id, None)
+        self._dirty.discard(thread_id)
+
+    def _evict(self, thread_id):
+        if thread_id in self._dirty:
+            self._persist([thread_id])
+        self._drop_from_memory(thread_id)
+        self.evictions += 1
+
+    def _prune(self, thread_id, checkpoint_ns):
+        """Drops checkpoints beyond `keep_checkpoints`, with their writes and unreferenced blobs."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if not self.keep_checkpoints or len(checkpoints) <= self.keep_checkpoints:
+            return
+        blob_keys, write_keys = self._keys[thread_id]
+        # Checkpoint ids sort in creation order
+        for checkpoint_id in sorted(checkpoints)[:-self.keep_checkpoints]:
+            del checkpoints[checkpoint_id]
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(key, None)
+            write_keys.discard(key)
+
+        referenced = set()
+        for checkpoint, _, _ in checkpoints.values():
+            for channel, version in self.serde.loads_typed(checkpoint)['channel_versions'].items():
+                referenced.add((thread_id, checkpoint_ns, channel, version))
+        for key in [key for key in blob_keys if key[1] == checkpoint_ns and key not in referenced]:
+            self.blobs.pop(key, None)
+            blob_keys.discard(key)
+
+    # ---------- BaseCheckpointSaver ----------
+
+    def get_tuple(self, config):
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # Materialize one thread at a time so the lock is never held across a yield
+        if config:
+            thread_ids = [config["configurable"]["thread_id"]]
+        else:
+            with self._lock:
+                stored = [row[0] for row in self._conn.execute("SELECT thread_id FROM threads")]
+                thread_ids = list(dict.fromkeys([*self._hot, *stored]))
+
+        for thread_id in thread_ids:
+            if limit is not None and limit <= 0:
+                return
+            thread_config = {"configurable": {**(config or {}).get("configurable", {}), "thread_id": thread_id}}
+            with self._lock:
+                self._touch(thread_id)
+                items = list(super().list(thread_config, filter=filter, before=before, limit=limit))
+            if limit is not None:
+                limit -= len(items)
+            yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._touch(thread_id)
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self._keys[thread_id][0].update((thread_id, checkpoint_ns, channel, version)
+                                            for channel, version in new_versions.items())
+            self._prune(thread_id, checkpoint_ns)
+            self._dirty.add(thread_id)
+            return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            super().put_writes(config, writes, task_id, task_path)
+            self._keys[thread_id][1].add(
+                (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+            )
+            self._dirty.add(thread_id)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._drop_from_memory(thread_id)
+            self._conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+
+    # ---------- maintenance ----------
+
+    def flush(self):
+        """Persists every hot thread that changed since it was last written."""
+        with self._lock:
+            self._persist(list(self._dirty))
+
+    def evict_idle(self):
+        """Evicts threads idle for longer than `idle_ttl`."""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            for thread_id in [thread_id for thread_id, last_used in self._hot.items() if last_used < cutoff]:
+                self._evict(thread_id)
+
+    def stats(self):
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM threads").fetchone()
+            return {
+                'hot_threads': len(self._hot),
+                'dirty_threads': len(self._dirty),
+                'stored_threads': stored[0],
+                'stored_bytes': stored[1],
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+    def _run_background(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.evict_idle()
+                self.flush()
+            except sqlite3.Error:
+                # Dirty threads stay dirty and are retried on the next pass
+                continue
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._worker.join()
+        self.flush()
+        self._conn.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """Process-wide checkpointer for `checkpointer.backend`: 'sqlite' (bounded) or 'memory' (InMemorySaver)."""
+    backend = checkpointer_config['backend']
+    with _shared_lock:
+        if backend not in _shared:
+            if backend == 'sqlite':
+                _shared[backend] = BoundedSaver()
+            elif backend == 'memory':
+                _shared[backend] = InMemorySaver()
+            else:
+                raise ValueError(f"Unknown checkpointer backend: {backend}")
+        return _shared[backend]
@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import threading
+
+from langchain_core.documents import Document
+
+from src.helpers import load_config
+
+config = load_config()
+
+chunk_store_path = config['chunk_store']['path']
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+class ChunkStore:
+    """Indexed chunks by ID (text and metadata), kept next to the vector store.
+
+    Lets in-process components such as the lexical index resolve chunk IDs to
+    Documents without a vector store round trip.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                text TEXT,
+                metadata TEXT
+            )
+        """)
+        self._conn.commit()
+
+    def add_documents(self, documents):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                [(doc.id, doc.page_content, json.dumps(doc.metadata)) for doc in documents],
+            )
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def get_by_ids(self, ids):
+        """Documents for `ids`, in the given order; unknown IDs are skipped."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                found.update((doc_id, (text, metadata)) for doc_id, text, metadata in rows)
+
+        return [
+            Document(id=doc_id, page_content=found[doc_id][0], metadata=json.loads(found[doc_id][1]))
+            for doc_id in ids if doc_id in found
+        ]
+
+    def iter_texts(self):
+        """Yields (id, text) for every chunk, in ID order."""
+        # A separate connection streams rows without holding the store lock
+        conn = sqlite3.connect(self.path)
+        try:
+            yield from conn.execute("SELECT id, text FROM chunks ORDER BY id")
+        finally:
+            conn.close()
+
+
+def get_chunk_store_path(backend):
+    return chunk_store_path.format(backend=backend)
+
+
+def get_chunk_store(backend):
+    return ChunkStore(get_chunk_store_path(backend))
@@ -0,0 +1,231 @@
+import threading
+
+from src.helpers import load_config
+
+config = load_config()
+
+model = config['model']['name']
+embedding_model_name = config['embeddings']['name']
+dimensions = config['embeddings']['dimensions']
+index_name = config['index_name']
+backend = config['vector_store']['backend']
+client_config = config['clients']
+
+# Process-wide registry: every client is built once per configuration and shared.
+# SDKs are imported inside the factories, so importing this module stays cheap.
+_registry = {}
+_lock = threading.RLock()
+
+
+def _get_or_create(key, factory):
+    """Returns the registered object for `key`, building it on first use."""
+    instance = _registry.get(key)
+    if instance is None:
+        with _lock:
+            instance = _registry.get(key)
+            if instance is None:
+                instance = factory()
+                _registry[key] = instance
+    return instance
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=client_config['max_connections'],
+        max_keepalive_connections=client_config['max_keepalive_connections'],
+        keepalive_expiry=client_config['keepalive_expiry'],
+    )
+
+
+def _cassette_types():
+    import src.cassette
+
+    return src.cassette
+
+
+def _with_cassette(client, wrap):
+    """`client` wrapped for record/replay when the cassette is on, else `client` itself."""
+    cassette = _cassette_types().get_cassette()
+    return client if cassette is None else wrap(cassette)
+
+
+# ============= HTTP CONNECTION POOLS =============
+
+def get_http_client():
+    """Shared keep-alive connection pool for synchronous OpenAI calls."""
+    from openai import DefaultHttpxClient
+
+    return _get_or_create(
+        ('http', 'sync'),
+        lambda: DefaultHttpxClient(limits=_limits(), timeout=client_config['timeout']),
+    )
+
+
+def get_async_http_client():
+    """Shared keep-alive connection pool for asynchronous OpenAI calls."""
+    from openai import DefaultAsyncHttpxClient
+
+    return _get_or_create(
+        ('http', 'async'),
+        lambda: DefaultAsyncHttpxClient(limits=_limits(), timeout=client_config['timeout']),
+    )
+
+
+# ============= OPENAI =============
+
+def get_openai_client():
+    """Raw OpenAI SDK client on the shared connection pool."""
+    from openai import OpenAI
+
+    return _get_or_create(('openai', 'sync'), lambda: OpenAI(http_client=get_http_client()))
+
+
+def get_async_openai_client():
+    """Raw async OpenAI SDK client on the shared connection pool."""
+    from openai import AsyncOpenAI
+
+    return _get_or_create(('openai', 'async'), lambda: AsyncOpenAI(http_client=get_async_http_client()))
+
+
+def get_chat_model(model_name=model, temperature=None):
+    """Chat model for (model_name, temperature); usable from sync and async code."""
+    def factory():
+        from langchain_openai import ChatOpenAI
+
+        kwargs = {} if temperature is None else {'temperature': temperature}
+        chat_model = ChatOpenAI(
+            model=model_name,
+            stream_usage=True,  # token usage on streamed responses too, for src.metering
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **kwargs,
+        )
+        return _with_cassette(chat_model, lambda cassette: _cassette_types().CassetteChatModel(
+            model=chat_model, cassette=cassette))
+
+    return _get_or_create(('chat', model_name, temperature), factory)
+
+
+def get_structured_model(schema, model_name=model, temperature=None):
+    """Chat model bound to a structured output `schema`."""
+    return _get_or_create(
+        ('structured', schema, model_name, temperature),
+        lambda: get_chat_model(model_name, temperature).with_structured_output(schema),
+    )
+
+
+def get_embeddings(model_name=embedding_model_name, dimensions=dimensions):
+    """Embeddings model for (model_name, dimensions)."""
+    def factory():
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(
+            model=model_name,
+            dimensions=dimensions,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        )
+        return _with_cassette(embeddings, lambda cassette: _cassette_types().CassetteEmbeddings(embeddings, cassette))
+
+    return _get_or_create(('embeddings', model_name, dimensions), factory)
+
+
+def get_cached_embeddings(model_name=embedding_model_name, dimensions=dimensions):
+    """Embeddings model backed by the persistent embedding cache."""
+    from src.embedding_cache import CachedEmbeddings
+
+    return _get_or_create(
+        ('cached_embeddings', model_name, dimensions),
+        lambda: CachedEmbeddings(get_embeddings(model_name, dimensions)),
+    )
+
+
+# ============= PINECONE =============
+
+def get_pinecone():
+    """Shared Pinecone control-plane client."""
+    from pinecone import Pinecone
+
+    return _get_or_create(('pinecone',), lambda: Pinecone(pool_threads=client_config['pinecone_pool_threads']))
+
+
+def get_index(index_name):
+    """Shared data-plane connection to a Pinecone index."""
+    return _get_or_create(
+        ('pinecone', 'index', index_name),
+        lambda: get_pinecone().Index(index_name, pool_threads=client_config['pinecone_pool_threads']),
+    )
+
+
+# ============= VECTOR STORES =============
+
+_pinecone_store_class = None
+
+
+def _get_pinecone_store_class():
+    """PineconeVectorStore with `get_by_ids`, which langchain_pinecone leaves unimplemented."""
+    global _pinecone_store_class
+    if _pinecone_store_class is None:
+        from langchain_core.documents import Document
+        from langchain_pinecone import PineconeVectorStore
+
+        class PineconeStore(PineconeVectorStore):
+            def get_by_ids(self, ids, /):
+                response = self.index.fetch(ids=list(ids), namespace=self._namespace)
+                docs = []
+                for vector_id, vector in response.vectors.items():
+                    metadata = dict(vector.metadata or {})
+                    text = metadata.pop(self._text_key, None)
+                    if text is not None:
+                        docs.append(Document(id=vector_id, page_content=text, metadata=metadata))
+                return docs
+
+        _pinecone_store_class = PineconeStore
+    return _pinecone_store_class
+
+
+def get_vector_store(embeddings, backend=backend, index_name=index_name):
+    """Vector store for the configured backend: the Pinecone index or the local memory-mapped store."""
+    if backend == 'local':
+        def factory():
+            from src.local_store import LocalVectorStore
+
+            return LocalVectorStore(embedding=embeddings)
+
+        key = ('vector_store', 'local', id(embeddings))
+    elif backend == 'pinecone':
+        def factory():
+            return _get_pinecone_store_class()(index=get_index(index_name), embedding=embeddings)
+
+        key = ('vector_store', 'pinecone', index_name, id(embeddings))
+    else:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    # Under the cassette the store is only built when a search was not recorded
+    cassette = _cassette_types().get_cassette()
+    if cassette is None:
+        return _get_or_create(key, factory)
+    return _get_or_create(
+        ('cassette', *key),
+        lambda: _cassette_types().CassetteVectorStore(factory, embeddings, f"{backend}:{index_name}", cassette),
+    )
+
+
+# ============= RERANKERS =============
+
+def get_reranker(top_n, model_name='rerank-english-v3.0'):
+    """Cohere reranker keeping the `top_n` best documents."""
+    def factory():
+        from langchain_cohere import CohereRerank
+
+        return CohereRerank(model=model_name, top_n=top_n)
+
+    cassette = _cassette_types().get_cassette()
+    if cassette is None:
+        return _get_or_create(('reranker', model_name, top_n), factory)
+    return _get_or_create(
+        ('cassette', 'reranker', model_name, top_n),
+        lambda: _cassette_types().CassetteReranker(factory=factory, name=f"{model_name}:{top_n}", cassette=cassette),
+    )
@@ -0,0 +1,155 @@
+import logging
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+
+from src.data_chunking import make_chunk_id
+from src.helpers import load_config
+from src.lexical import tokenize
+from src.metering import count_tokens
+
+config = load_config()
+
+packing_config = config['context_packing']
+
+logger = logging.getLogger(__name__)
+
+
+def citation(doc):
+    return f"{doc.metadata['book_name']} (Page: {doc.metadata['page']})"
+
+
+def format_passage(doc):
+    """One passage as the model sees it; every book/page it stands for is cited."""
+    return f"Source: {'; '.join(doc.metadata.get('citations') or [citation(doc)])}\nContent: {doc.page_content}"
+
+
+def overlap_length(left, right, min_overlap, max_overlap):
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 below `min_overlap`)."""
+    for size in range(min(max_overlap, len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+@dataclass
+class PackedContext:
+    text: str
+    docs: list
+    tokens: int
+    stats: dict = field(default_factory=dict)
+
+
+class ContextPacker:
+    """Packs ranked retrieved chunks into at most `max_tokens` of context.
+
+    1. Near-duplicates (term-set Jaccard >= `duplicate_threshold`) of a
+       higher-ranked chunk are dropped; their citation is kept on that chunk.
+    2. Chunks from the same book and page are merged into one passage, joined
+       on the splitter overlap when they are neighbours.
+    3. Passages are added in the rank of their best chunk while they fit the
+       token budget; the first one is truncated if it alone does not.
+    """
+
+    def __init__(self, max_tokens=packing_config['max_tokens'], duplicate_threshold=packing_config['duplicate_threshold'],
+                 min_overlap=packing_config['min_overlap'], max_overlap=packing_config['max_overlap'], model_name=None):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.model_name = model_name
+
+    def _count(self, text):
+        return count_tokens(text, self.model_name)
+
+    def _drop_duplicates(self, docs):
+        kept = []  # (doc, terms, citations)
+        for doc in docs:
+            terms = set(tokenize(doc.page_content))
+            for kept_doc, kept_terms, citations in kept:
+                if jaccard(terms, kept_terms) >= self.duplicate_threshold:
+                    if citation(doc) not in citations:
+                        citations.append(citation(doc))
+                    break
+            else:
+                kept.append((doc, terms, [citation(doc)]))
+        return [(doc, citations) for doc, _, citations in kept]
+
+    def _merge_segments(self, texts):
+        """Joins texts that overlap end-to-start into segments; texts contained in a segment are dropped."""
+        segments = []
+        for text in texts:
+            for i, segment in enumerate(segments):
+                if text in segment:
+                    break
+                size = overlap_length(segment, text, self.min_overlap, self.max_overlap)
+                if size:
+                    segments[i] = segment + text[size:]
+                    break
+                size = overlap_length(text, segment, self.min_overlap, self.max_overlap)
+                if size:
+                    segments[i] = text + segment[size:]
+                    break
+            else:
+                segments.append(text)
+        return segments
+
+    def _passages(self, docs):
+        groups = {}  # (book, page) -> [(doc, citations)], in rank order of the first chunk
+        for doc, citations in self._drop_duplicates(docs):
+            groups.setdefault((doc.metadata['book_name'], doc.metadata['page']), []).append((doc, citations))
+
+        passages = []
+        for members in groups.values():
+            citations = []
+            for _, member_citations in members:
+                citations.extend(c for c in member_citations if c not in citations)
+            segments = self._merge_segments([doc.page_content for doc, _ in members])
+            passages.append(Document(
+                page_content="\n...\n".join(segments),
+                metadata={**members[0][0].metadata, 'citations': citations,
+                          'chunk_ids': [doc.id or make_chunk_id(doc) for doc, _ in members]},
+            ))
+        return passages
+
+    def _truncate(self, doc, budget):
+        """`doc` cut down (at a word boundary) until its formatted passage fits `budget` tokens."""
+        text = doc.page_content
+        while text:
+            passage = Document(page_content=text + " ...", metadata=doc.metadata)
+            tokens = self._count(format_passage(passage))
+            if tokens <= budget:
+                return passage, tokens
+            keep = max(0, int(len(text) * budget / tokens * 0.95))
+            text = text[:keep].rsplit(' ', 1)[0] if keep < len(text) else text[:-1]
+        return None, 0
+
+    def pack(self, docs):
+        passages = self._passages(docs)
+        separator_tokens = self._count("\n\n")
+
+        packed, used = [], 0
+        for passage in passages:
+            tokens = self._count(format_passage(passage)) + (separator_tokens if packed else 0)
+            if used + tokens <= self.max_tokens:
+                packed.append(passage)
+                used += tokens
+            elif not packed:
+                passage, tokens = self._truncate(passage, self.max_tokens)
+                if passage is not None:
+                    packed.append(passage)
+                    used += tokens
+
+        text = "\n\n".join(format_passage(passage) for passage in packed)
+        stats = {
+            'chunks': len(docs),
+            'passages': len(passages),
+            'packed': len(packed),
+            'tokens': used,
+            'unpacked_tokens': self._count("\n\n".join(format_passage(doc) for doc in docs)),
+        }
+        return PackedContext(text=text, docs=packed, tokens=used, stats=stats)
@@ -1,17 +1,52 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import hashlib
 from src.helpers import load_config
 
 config = load_config()
 
 chunk_size = config['chunk']['chunk_size']
 chunk_overlap = config['chunk']['chunk_overlap']
+chunk_batch_size = config['indexing']['chunk_batch_size']
 
 
 # Split the documents into smaller chunks
 def split_text_into_chunks(documents):
+  from langchain_text_splitters import RecursiveCharacterTextSplitter
 
   text_splitter = RecursiveCharacterTextSplitter(chunk_size = chunk_size, chunk_overlap = chunk_overlap)
 
   chunks = text_splitter.split_documents(documents)
 
-  return chunks
\ No newline at end of file
+  return chunks
+
+
+# Deterministic ID of a chunk, so re-indexing the same text upserts instead of duplicating
+def make_chunk_id(chunk):
+  key = f"{chunk.metadata['book_name']}\x00{chunk.metadata['page']}\x00{chunk.page_content}"
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def assign_chunk_ids(chunks):
+
+  for chunk in chunks:
+    chunk.id = make_chunk_id(chunk)
+
+  return chunks
+
+
+# Stream chunks with IDs in fixed-size batches from a stream of page batches
+def iter_chunks(document_batches, batch_size = chunk_batch_size, chunk_size = chunk_size, chunk_overlap = chunk_overlap):
+  from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+  text_splitter = RecursiveCharacterTextSplitter(chunk_size = chunk_size, chunk_overlap = chunk_overlap)
+
+  batch = []
+  for documents in document_batches:
+    # Pages are split independently, so splitting batch by batch gives the same chunks
+    for chunk in assign_chunk_ids(text_splitter.split_documents(documents)):
+      batch.append(chunk)
+      if len(batch) >= batch_size:
+        yield batch
+        batch = []
+
+  if batch:
+    yield batch
@@ -1,14 +1,142 @@
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
+import argparse
+import hashlib
+import json
+import os
+from src.clients import get_cached_embeddings, get_index, get_vector_store
 from src.helpers import create_vectorstore, load_config
-from src.data_ingestion import load_and_filter_documents
-from src.data_chunking import split_text_into_chunks
+from src.cache import bump_index_version
+from src.retriever import clear_retrieval_cache
+from src.chunk_store import get_chunk_store
+from src.lexical import build_lexical_index, get_index_path
+from src.data_ingestion import get_book_name, iter_documents, list_pdf_files
+from src.data_chunking import iter_chunks
 from dotenv import load_dotenv
 
 
-def main():
+# Pinecone accepts at most 1000 IDs per delete request
+DELETE_BATCH_SIZE = 1000
+
+chunk_batch_size = load_config()['indexing']['chunk_batch_size']
+
+
+def file_sha256(file_path):
+    """Content hash of a file, used to detect new and changed books."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """Loads the manifest of indexed files: {file: {'sha256': ..., 'chunk_ids': [...]}}."""
+    if not os.path.exists(manifest_path):
+        return {'files': {}}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def get_run_key(config, to_process, hashes, full):
+    """Identifies one indexing job, so a checkpoint is only resumed by the same job."""
+    job = {
+        'files': [(file_path, hashes[file_path]) for file_path in to_process],
+        'full': full,
+        'chunk': config['chunk'],
+        'chunk_batch_size': config['indexing']['chunk_batch_size'],
+    }
+    return hashlib.sha256(json.dumps(job, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_checkpoint(checkpoint_path, run_key):
+    """Number of chunk batches already upserted by an interrupted run of this job."""
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, 'r') as f:
+        checkpoint = json.load(f)
+    return checkpoint['batches_done'] if checkpoint['run_key'] == run_key else 0
+
+
+def save_checkpoint(checkpoint_path, run_key, batches_done):
+    save_manifest({'run_key': run_key, 'batches_done': batches_done}, checkpoint_path)
+
+
+def iter_new_chunk_batches(data_path, to_process, previous, manifest, full, stats):
+    """Streams batches of chunks that are not in the index yet, recording every chunk ID in the manifest."""
+    # Book names are paths relative to the data folder, so they only collide for aliased paths
+    book_to_file = {}
+    for file_path in to_process:
+        book_name = get_book_name(file_path, data_path)
+        if book_name in book_to_file:
+            raise ValueError(f"{file_path} and {book_to_file[book_name]} are both indexed as book {book_name}")
+        book_to_file[book_name] = file_path
+    old_ids = {file_path: set() if full else set(previous.get(file_path, {}).get('chunk_ids', [])) for file_path in to_process}
+    seen_ids = {file_path: set() for file_path in to_process}
+
+    batch = []
+    for chunks in iter_chunks(iter_documents(data_path, files=to_process)):
+        for chunk in chunks:
+            file_path = book_to_file[chunk.metadata['book_name']]
+
+            # The same text on the same page maps to one vector
+            if chunk.id in seen_ids[file_path]:
+                continue
+            seen_ids[file_path].add(chunk.id)
+            manifest['files'][file_path]['chunk_ids'].append(chunk.id)
+
+            if chunk.id in old_ids[file_path]:
+                stats['unchanged'] += 1
+                continue
+            batch.append(chunk)
+            if len(batch) >= chunk_batch_size:
+                yield batch
+                batch = []
+
+    if batch:
+        yield batch
+
+
+def upsert_chunk_batches(batches, batches_done, chunk_store, vector_store, checkpoint_path, run_key):
+    """Upserts the batches after the first `batches_done`, checkpointing after each one.
+
+    Returns the number of chunks upserted by this run and the number skipped
+    because an interrupted run of the same job had already upserted them.
+    """
+    upserted = 0
+    resumed = 0
+    for batch_number, batch in enumerate(batches):
+        # Skipped batches are still drawn from `batches`, so the manifest records their chunk IDs
+        if batch_number < batches_done:
+            resumed += len(batch)
+            continue
+
+        # # Add the new chunks to the vector store.
+        chunk_store.add_documents(batch)
+        vector_store.add_documents(batch, ids=[chunk.id for chunk in batch])
+        upserted += len(batch)
+        save_checkpoint(checkpoint_path, run_key, batch_number + 1)
+    return upserted, resumed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index the PDFs in the data folder into the vector store.")
+    parser.add_argument('--full', action='store_true', help="Re-embed every file instead of only new or changed ones.")
+    parser.add_argument('--reset', action='store_true', help="Delete every vector in the index before a full rebuild.")
+    parser.add_argument('--backend', choices=['pinecone', 'local'], default=None,
+                        help="Vector store to fill; 'local' exports the chunks into the local memory-mapped store.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     load_dotenv()
+    args = parse_args(argv)
 
     # Loading the configuration values of the model
     config = load_config()
@@ -17,32 +145,107 @@ def main():
     embedding_model = config['embeddings']['name']
     dimensions = config['embeddings']['dimensions']
     data_path = config['paths']['data_path']
+    backend = args.backend or config['vector_store']['backend']
+    manifest_path = config['indexing']['manifest_path'].format(backend=backend)
+    checkpoint_path = config['indexing']['checkpoint_path'].format(backend=backend)
+    full = args.full or args.reset or config['indexing']['mode'] == 'full'
 
-    # Load and filter the documents from the data folder
-    documents = load_and_filter_documents(data_path)
+    # Compare the files on disk with the ones indexed last time
+    previous = load_manifest(manifest_path)['files']
+    manifest = {'files': {}}
+    hashes = {file_path: file_sha256(file_path) for file_path in list_pdf_files(data_path)}
 
-    # Split the documents into chunks
-    chunks = split_text_into_chunks(documents)
+    to_process = [f for f in hashes if full or previous.get(f, {}).get('sha256') != hashes[f]]
+    removed_files = [f for f in previous if f not in hashes]
 
-    # Creating the object of the Embeddings model
-    embedding_model = OpenAIEmbeddings(model = embedding_model, dimensions= dimensions)
+    # Creating the object of the Embeddings model, backed by the embedding cache
+    embedding_model = get_cached_embeddings(embedding_model, dimensions)
 
     # # Set the name of the index
     index_name = config['index_name']
 
     # # Create the vector store
-    create_vectorstore(index_name=index_name)
+    if backend == 'pinecone':
+        create_vectorstore(index_name=index_name)
+
+    # A crashed run of the same job resumes after its last upserted batch
+    run_key = get_run_key(config, to_process, hashes, full)
+    batches_done = load_checkpoint(checkpoint_path, run_key)
+    if batches_done:
+        print(f"Resuming: {batches_done} chunk batches were already upserted")
+
+    # # Pass the embedding_model to the vector store of the chosen backend
+    vector_store = get_vector_store(embedding_model, backend=backend)
+
+    # Chunk texts are also kept locally for the BM25 index and lexical-only hits
+    chunk_store = get_chunk_store(backend)
+    if args.reset:
+        if not batches_done:
+            if backend == 'pinecone':
+                get_index(index_name).delete(delete_all=True)
+            else:
+                vector_store.reset()
+            chunk_store.clear()
+        previous = {}
+
+    for file_path in to_process:
+        manifest['files'][file_path] = {'sha256': hashes[file_path], 'chunk_ids': []}
+
+    # Stream pages -> chunks -> upserts batch by batch, checkpointing after every upsert
+    stats = {'unchanged': 0}
+    batches = iter_new_chunk_batches(data_path, to_process, previous, manifest, full, stats)
+    upserted, resumed = upsert_chunk_batches(batches, batches_done, chunk_store, vector_store, checkpoint_path, run_key)
+    unchanged = stats['unchanged']
+
+    # Chunks upserted before a resume changed the index just as much as this run's
+    changed = bool(upserted or resumed)
+
+    # Unchanged files keep their entries when running incrementally
+    for file_path in hashes:
+        if file_path not in manifest['files']:
+            manifest['files'][file_path] = previous[file_path]
+
+    # Delete vectors that no current file produces any more
+    current_ids = {chunk_id for entry in manifest['files'].values() for chunk_id in entry['chunk_ids']}
+    previous_ids = {chunk_id for entry in previous.values() for chunk_id in entry['chunk_ids']}
+    stale_ids = sorted(previous_ids - current_ids)
+    for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+        vector_store.delete(ids=stale_ids[start:start + DELETE_BATCH_SIZE])
+    chunk_store.delete(stale_ids)
+
+    save_manifest(manifest, manifest_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    # Reclaim the rows tombstoned by re-indexed and deleted chunks
+    reclaimed = 0
+    if backend == 'local' and vector_store.deleted_ratio >= config['vector_store']['local']['compact_ratio']:
+        reclaimed = vector_store.compact()
+        print(f"Compacted the local store: {reclaimed} deleted rows reclaimed")
+
+    # Re-cluster the approximate index over the new rows
+    if (backend == 'local' and vector_store.index_type == 'ivf' and vector_store.count
+            and (changed or stale_ids or reclaimed)):
+        vector_store.build_ivf()
 
-    # # Get the index
-    pc = Pinecone()
-    index = pc.Index(index_name)
+    # Rebuild the BM25 index over every chunk, in-process and without API calls
+    if changed or stale_ids or args.reset or not os.path.exists(get_index_path(backend)):
+        lexical_index = build_lexical_index(chunk_store, backend)
+        print(f"Built BM25 index over {len(lexical_index.chunk_ids)} chunks ({len(lexical_index.terms)} terms)")
 
-    # # Pass the index and embedding_model to the Pinecone Vector store
-    vector_store = PineconeVectorStore(index = index, embedding = embedding_model)
+    if changed or stale_ids or args.reset:
+        # The index changed, so cached retrieval results are stale everywhere.
+        bump_index_version()
+        clear_retrieval_cache()
 
-    # # Add the chunks to the vector store.
-    vector_store.add_documents(chunks)
+    new_files = [f for f in to_process if f not in previous]
+    print("Indexing summary:")
+    print(f"  Files: {len(new_files)} new, {len(to_process) - len(new_files)} re-indexed, "
+          f"{len(hashes) - len(to_process)} unchanged, {len(removed_files)} removed")
+    print(f"  Chunks: {upserted} embedded and upserted, {resumed} upserted before resuming, "
+          f"{unchanged} already indexed, {len(stale_ids)} deleted")
+    print(f"  Embedding cache: {embedding_model.hits} hits, {embedding_model.misses} API embeddings")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,30 +1,121 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from pypdf import PdfReader
+from src.helpers import load_config
+import logging
+import os
+import time
 
+config = load_config()
 
+logger = logging.getLogger(__name__)
 
-def load_and_filter_documents(data_path):
+parallel = config['ingestion']['parallel']
+workers = config['ingestion']['workers']
+pages_per_task = config['ingestion']['pages_per_task']
+page_batch_size = config['indexing']['page_batch_size']
 
-  # Creating the Directory Loader
-  loader = DirectoryLoader(
-      path = data_path,
-      glob = "**/*.pdf",
-      loader_cls=PyPDFLoader
-    )
 
-  # Loading the documents
-  docs = loader.load()
 
-  # FIltering the documents => Removing unnecessary metadata
-  filtered_documents = []
+def list_pdf_files(data_path):
+  """Returns the PDF files under data_path in the order DirectoryLoader visits them."""
+  root = Path(data_path)
+  return [
+      str(path) for path in root.glob("**/*.pdf")
+      if path.is_file() and not any(part.startswith('.') for part in path.relative_to(root).parts)
+  ]
+
+
+def get_book_name(source, data_path):
+  # Path of the book relative to the data folder, e.g. 'data/anatomy.pdf' -> 'anatomy.pdf'
+  return Path(os.path.relpath(source, data_path)).as_posix()
+
+
+def _parse_pages(task):
+  """Worker: parses pages [start, stop) of one PDF into filtered Documents.
+
+  Text extraction matches PyPDFLoader's default page mode (`extract_text()`
+  with surrounding whitespace stripped), so output is identical to the loader.
+  """
+  file_path, book_name, start, stop = task
+  reader = PdfReader(file_path)
+
+  return [
+      Document(page_content = reader.pages[page].extract_text().strip(), metadata = {'book_name' : book_name, 'page' : page})
+      for page in range(start, stop)
+  ]
+
+
+def _iter_parallel(data_path, files):
+
+  # Split every PDF into page ranges so one large book is spread over all workers
+  def iter_tasks():
+    for file_path in files:
+      num_pages = len(PdfReader(file_path).pages)
+      book_name = get_book_name(file_path, data_path)
+      for start in range(0, num_pages, pages_per_task):
+        yield (file_path, book_name, start, min(start + pages_per_task, num_pages))
+
+  # Only a bounded window of page ranges is in flight, and results are yielded in
+  # task order, so pages come back in the same order as the sequential loader
+  with ProcessPoolExecutor(max_workers = workers) as executor:
+    window = (workers or os.cpu_count() or 1) * 2
+    pending = deque()
+    for task in iter_tasks():
+      pending.append(executor.submit(_parse_pages, task))
+      if len(pending) >= window:
+        yield from pending.popleft().result()
+    while pending:
+      yield from pending.popleft().result()
+
 
-  for doc in docs:
-    metadata = {
-        'book_name' : doc.metadata['source'].strip('data/'),
-        'page' : doc.metadata['page']
+def _iter_sequential(data_path, files):
 
-    }
-    filtered_document = Document(page_content = doc.page_content, metadata = metadata)
-    filtered_documents.append(filtered_document)
+  # One lazy loader per file, so only the current page is held in memory
+  for file_path in files:
+    for doc in PyPDFLoader(file_path).lazy_load():
+
+      # FIltering the documents => Removing unnecessary metadata
+      metadata = {
+          'book_name' : get_book_name(doc.metadata['source'], data_path),
+          'page' : doc.metadata['page']
+
+      }
+      yield Document(page_content = doc.page_content, metadata = metadata)
+
+
+def iter_documents(data_path, files = None, batch_size = page_batch_size):
+  """Streams the filtered pages of the PDFs in batches of `batch_size` pages."""
+
+  files = list_pdf_files(data_path) if files is None else files
+  pages = _iter_parallel(data_path, files) if parallel else _iter_sequential(data_path, files)
+
+  start_time = time.perf_counter()
+  num_pages = 0
+  batch = []
+  for page in pages:
+    batch.append(page)
+    if len(batch) >= batch_size:
+      num_pages += len(batch)
+      yield batch
+      batch = []
+  if batch:
+    num_pages += len(batch)
+    yield batch
+
+  elapsed = time.perf_counter() - start_time
+  pages_per_sec = num_pages / elapsed if elapsed else 0.0
+  logger.info(f"Loaded {num_pages} pages in {elapsed:.1f}s ({pages_per_sec:.1f} pages/sec)")
+
+
+def load_and_filter_documents(data_path, files = None):
+
+  # Loading every page at once; iter_documents streams them instead
+  filtered_documents = []
+  for batch in iter_documents(data_path, files):
+    filtered_documents.extend(batch)
 
-  return filtered_documents
\ No newline at end of file
+  return filtered_documents
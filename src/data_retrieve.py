@@ -1,14 +1,14 @@
-from src.agent import get_agent, get_thread_id, logger
+from src.agent import get_run_config, get_shared_agent, get_thread_id, logger, stream_response
 
 def main():
     """Main function to run the command-line chatbot interface."""
 
     # Get the agent loaded with the System Prompt
-    agent = get_agent()
+    agent = get_shared_agent()
 
     # Get the current Thread id
     thread_id = get_thread_id()
-    config = {"configurable": {"thread_id": thread_id}}
+    config = get_run_config(thread_id)
 
     print("Medical Chatbot Ready. Type 'exit' to quit.\n")
 
@@ -29,9 +29,7 @@ def main():
                 continue
 
             # Using streaming mode for messages and retrieval
-            for stream_mode, chunk in agent.stream({
-                "messages": [{"role": "user", "content": query}]
-            }, config=config, stream_mode=["messages", "custom"]):
+            for stream_mode, chunk in stream_response(agent, query, config):
                 
                 if stream_mode == "custom":
                     print(chunk)
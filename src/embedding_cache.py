@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.helpers import load_config
+
+config = load_config()
+
+cache_path = config['embedding_cache']['path']
+batch_size = config['embedding_cache']['batch_size']
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """Disk-backed float32 vectors keyed on (model, dimensions, text hash)."""
+
+    def __init__(self, path=cache_path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT,
+                dimensions INTEGER,
+                text_hash TEXT,
+                vector BLOB,
+                last_used REAL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, model, dimensions, hashes):
+        """Returns {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    (model, dimensions, *batch),
+                ).fetchall()
+                found.update((h, np.frombuffer(blob, dtype=np.float32).tolist()) for h, blob in rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                    [(now, model, dimensions, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model, dimensions, items):
+        """Stores (text_hash, vector) pairs."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model, dimensions, h, np.asarray(vector, dtype=np.float32).tobytes(), now) for h, vector in items],
+            )
+            self._conn.commit()
+
+    def compact(self, max_age_days=None):
+        """Drops vectors unused for `max_age_days` and reclaims the file space."""
+        removed = 0
+        with self._lock:
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 24 * 3600
+                removed = self._conn.execute("DELETE FROM embeddings WHERE last_used < ?", (cutoff,)).rowcount
+                self._conn.commit()
+            self._conn.execute("VACUUM")
+        return removed
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an `OpenAIEmbeddings` so only texts missing from the store are sent to the API."""
+
+    def __init__(self, embeddings, store=None, batch_size=batch_size):
+        self.embeddings = embeddings
+        self.store = store or EmbeddingStore()
+        self.batch_size = batch_size
+        self.model = embeddings.model
+        self.dimensions = embeddings.dimensions
+        self.hits = 0
+        self.misses = 0
+        # Concurrent callers (e.g. sweep workers) share the counters
+        self._counts_lock = threading.Lock()
+
+    def _count(self, hits, misses):
+        with self._counts_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        found = self.store.get_many(self.model, self.dimensions, list(set(hashes)))
+
+        # Embed each missing text once, in API-sized batches
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, text)
+        missing_hashes = list(missing)
+        for start in range(0, len(missing_hashes), self.batch_size):
+            batch = missing_hashes[start:start + self.batch_size]
+            vectors = self.embeddings.embed_documents([missing[h] for h in batch])
+            self.store.put_many(self.model, self.dimensions, zip(batch, vectors))
+            found.update(zip(batch, vectors))
+
+        self._count(len(texts) - len(missing), len(missing))
+        return [list(found[h]) for h in hashes]
+
+    def embed_query(self, text):
+        h = text_hash(text)
+        found = self.store.get_many(self.model, self.dimensions, [h])
+        if h in found:
+            self._count(1, 0)
+            return found[h]
+
+        self._count(0, 1)
+        vector = self.embeddings.embed_query(text)
+        self.store.put_many(self.model, self.dimensions, [(h, vector)])
+        return vector
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the embedding cache.")
+    parser.add_argument('command', choices=['compact', 'stats'])
+    parser.add_argument('--max-age-days', type=float, default=None, help="Drop vectors unused for this many days.")
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore()
+    if args.command == 'compact':
+        removed = store.compact(args.max_age_days)
+        print(f"Removed {removed} vectors, {store.count()} remain in {store.path}")
+    else:
+        print(f"{store.count()} vectors in {store.path} ({os.path.getsize(store.path) / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import contextlib
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.cache import get_index_version
+from src.helpers import load_config
+
+config = load_config()
+
+evaluation_config = config['evaluation']
+
+
+def question_key(index, question):
+    """Stable id of a test question, so a resumed run can skip what it already answered."""
+    return f"{index}:{hashlib.sha1(question.encode('utf-8')).hexdigest()[:16]}"
+
+
+def get_retrieval_fingerprint():
+    """Short hash of the config that decides what gets retrieved: chunking, embeddings and retrieval settings."""
+    settings = {section: config[section] for section in ('chunk', 'embeddings', 'retrieval', 'rerank', 'vector_store')}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+
+def get_results_path(run_name, results_dir=evaluation_config['results_dir']):
+    """Results file of a run; a rebuilt index or changed retrieval config starts a new file instead of resuming."""
+    return os.path.join(results_dir, f"{run_name}_index{get_index_version()[:12]}_{get_retrieval_fingerprint()}.jsonl")
+
+
+class EvaluationRunner:
+    """Runs a per-question pipeline over a thread pool, checkpointing each answer to JSONL.
+
+    `process(test_question)` returns a JSON-serializable dict. Every completed
+    question is appended to `results_path` as soon as it finishes, so an
+    interrupted run resumes with only the missing questions. Failed questions
+    are not recorded and are retried on the next run.
+    """
+
+    def __init__(self, process, results_path, max_concurrency=evaluation_config['max_concurrency']):
+        self.process = process
+        self.results_path = results_path
+        self.max_concurrency = max_concurrency
+
+    def load_completed(self):
+        """Records already on disk, by question key; a line cut short by a crash is ignored."""
+        completed = {}
+        if not os.path.exists(self.results_path):
+            return completed
+        with open(self.results_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                completed[record['key']] = record
+        return completed
+
+    def _end_partial_line(self):
+        """Terminates a line cut short by a crash, so the next record starts on its own line."""
+        if not os.path.exists(self.results_path) or os.path.getsize(self.results_path) == 0:
+            return
+        with open(self.results_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _append(self, f, record):
+        # Only the collecting thread writes, one whole line per record
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+
+    def _run_one(self, key, test_question):
+        start = time.perf_counter()
+        record = self.process(test_question)
+        return {**record, 'key': key, 'latency': time.perf_counter() - start}
+
+    def run(self, test_questions, progress=None):
+        """Answers every question not answered yet; returns (records in question order, report).
+
+        `progress` is an optional bar factory such as `tqdm`, called with the
+        question total and `initial` set to the number of resumed questions.
+        """
+        completed = self.load_completed()
+        keys = [question_key(i, test_question['question']) for i, test_question in enumerate(test_questions)]
+        todo = [(key, test_question) for key, test_question in zip(keys, test_questions) if key not in completed]
+
+        os.makedirs(os.path.dirname(self.results_path) or '.', exist_ok=True)
+        self._end_partial_line()
+        errors = []
+        latencies = []
+        start = time.perf_counter()
+        bar = progress(total=len(test_questions), initial=len(test_questions) - len(todo)) if progress else None
+        with (open(self.results_path, 'a') as f, ThreadPoolExecutor(max_workers=self.max_concurrency) as executor,
+              bar or contextlib.nullcontext()):
+            futures = {executor.submit(self._run_one, key, test_question): test_question for key, test_question in todo}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    errors.append((futures[future]['question'], str(e)))
+                    print(f"\nError processing question: {e}")
+                else:
+                    completed[record['key']] = record
+                    latencies.append(record['latency'])
+                    self._append(f, record)
+                if bar is not None:
+                    bar.update(1)
+        wall_time = time.perf_counter() - start
+
+        report = {
+            'total': len(test_questions),
+            'resumed': len(test_questions) - len(todo),
+            'answered': len(latencies),
+            'failed': len(errors),
+            'wall_time': wall_time,
+            'sequential_time': sum(latencies),
+            'speedup': sum(latencies) / wall_time if latencies and wall_time > 0 else None,
+        }
+        return [completed[key] for key in keys if key in completed], report
+
+
+def print_report(report):
+    print(f"\nAnswered {report['answered']} questions, resumed {report['resumed']}, "
+          f"failed {report['failed']} (of {report['total']})")
+    if report['speedup'] is not None:
+        print(f"Wall time: {report['wall_time']:.1f}s vs {report['sequential_time']:.1f}s of per-question latency "
+              f"(~{report['speedup']:.1f}x faster than one at a time)")
@@ -0,0 +1,156 @@
+import argparse
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+from src.helpers import load_config
+
+config = load_config()
+
+gating_config = config['gating']
+ground_truths_pattern = os.path.join(config['paths']['ground_truths'], '*.json')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GateResult:
+    """Retrieved docs split by similarity score; each list keeps retrieval-rank order."""
+    accepted: list = field(default_factory=list)
+    ambiguous: list = field(default_factory=list)
+    rejected: list = field(default_factory=list)
+
+
+class ScoreGate:
+    """Decides from similarity scores which docs need an LLM relevance check.
+
+    Docs scoring at least `accept_above` are accepted and docs below
+    `reject_below` are dropped without a call; only the band in between (and
+    docs without a dense score, e.g. lexical-only hybrid hits) is sent to the
+    validator. An adaptive cutoff also drops every doc scoring below the first
+    drop of more than `max_gap` between consecutive scores, taken in score order.
+    """
+
+    def __init__(self, accept_above=gating_config['accept_above'], reject_below=gating_config['reject_below'],
+                 max_gap=gating_config['max_gap']):
+        self.accept_above = accept_above
+        self.reject_below = reject_below
+        self.max_gap = max_gap
+
+    def _cut_ids(self, docs):
+        """Ids of the scored docs that come after the first gap larger than `max_gap`, in score order.
+
+        Hybrid results are in fused rank order, where a lexical hit with a low
+        dense score can come before higher-scoring docs, so the gap is measured
+        on the scores sorted rather than on retrieval order.
+        """
+        if self.max_gap is None:
+            return set()
+        scored = sorted((doc for doc in docs if doc.metadata.get('score') is not None),
+                        key=lambda doc: doc.metadata['score'], reverse=True)
+        for i in range(1, len(scored)):
+            if scored[i - 1].metadata['score'] - scored[i].metadata['score'] > self.max_gap:
+                return {id(doc) for doc in scored[i:]}
+        return set()
+
+    def split(self, docs):
+        result = GateResult()
+        cut = self._cut_ids(docs)
+        for doc in docs:
+            score = doc.metadata.get('score')
+            if score is None:
+                result.ambiguous.append(doc)
+            elif id(doc) in cut or score < self.reject_below:
+                result.rejected.append(doc)
+            elif score >= self.accept_above:
+                result.accepted.append(doc)
+            else:
+                result.ambiguous.append(doc)
+        return result
+
+
+def log_savings(query, num_docs, gate_result, llm_calls):
+    """Logs how many LLM validation calls score gating saved for one query."""
+    if not gating_config['log_savings']:
+        return
+    saved = num_docs - llm_calls
+    logger.info(
+        f"Score gating for '{query[:80]}': {len(gate_result.accepted)} accepted, "
+        f"{len(gate_result.rejected)} rejected, {len(gate_result.ambiguous)} ambiguous | "
+        f"{llm_calls} LLM validation calls, {saved} of {num_docs} saved"
+    )
+
+
+# ============= THRESHOLD TUNING =============
+
+def tune(retriever, questions, accept_grid, reject_grid, max_gap):
+    """Scores every (accept_above, reject_below) pair against ground-truth sources.
+
+    A retrieved doc counts as relevant when its `book_name` is the question's
+    `source` book. For each pair this reports the share of validation calls
+    saved, the precision of auto-accepted docs and the share of relevant docs
+    that were auto-rejected.
+    """
+    retrieved = []
+    for question in questions:
+        docs = retriever.invoke(question['question'])
+        retrieved.append([(doc, doc.metadata.get('book_name') == question['source']) for doc in docs])
+
+    rows = []
+    for accept_above in accept_grid:
+        for reject_below in reject_grid:
+            if reject_below > accept_above:
+                continue
+            gate = ScoreGate(accept_above, reject_below, max_gap)
+            total = saved = accepted = accepted_relevant = relevant = relevant_rejected = 0
+            for docs in retrieved:
+                relevance = {id(doc): is_relevant for doc, is_relevant in docs}
+                result = gate.split([doc for doc, _ in docs])
+                total += len(docs)
+                saved += len(result.accepted) + len(result.rejected)
+                accepted += len(result.accepted)
+                accepted_relevant += sum(relevance[id(doc)] for doc in result.accepted)
+                relevant += sum(relevance.values())
+                relevant_rejected += sum(relevance[id(doc)] for doc in result.rejected)
+            rows.append({
+                'accept_above': accept_above,
+                'reject_below': reject_below,
+                'calls_saved': saved / total if total else 0.0,
+                'accept_precision': accepted_relevant / accepted if accepted else 0.0,
+                'relevant_rejected': relevant_rejected / relevant if relevant else 0.0,
+            })
+    return rows
+
+
+def main(argv=None):
+    from glob import glob
+
+    from dotenv import load_dotenv
+
+    from src.clients import get_embeddings, get_vector_store
+    from src.retriever import build_retriever
+
+    parser = argparse.ArgumentParser(description="Tune the score gating thresholds against ground_truths/.")
+    parser.add_argument('--accept', type=float, nargs='+', default=[0.5, 0.55, 0.6, 0.65, 0.7])
+    parser.add_argument('--reject', type=float, nargs='+', default=[0.2, 0.25, 0.3, 0.35, 0.4])
+    parser.add_argument('--max-gap', type=float, default=gating_config['max_gap'])
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    questions = []
+    for file_name in sorted(glob(ground_truths_pattern)):
+        with open(file_name, 'r') as f:
+            questions.extend(json.load(f))
+
+    retriever = build_retriever(get_vector_store(get_embeddings()))
+    rows = tune(retriever, questions, args.accept, args.reject, args.max_gap)
+
+    print(f"{'accept':>8} {'reject':>8} {'saved':>8} {'acc prec':>9} {'rel lost':>9}")
+    for row in rows:
+        print(f"{row['accept_above']:>8.2f} {row['reject_below']:>8.2f} {row['calls_saved']:>8.1%} "
+              f"{row['accept_precision']:>9.1%} {row['relevant_rejected']:>9.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,93 @@
-from pinecone import Pinecone
-from pinecone import ServerlessSpec
+import functools
+import os
+
 import yaml
 
-# Used to reuse the loading config file.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sections every entry point relies on
+REQUIRED_KEYS = {
+  'model': ['name', 'temperature'],
+  'embeddings': ['name', 'dimensions'],
+  'chunk': ['chunk_size', 'chunk_overlap'],
+  'retrieval': ['search_type', 'k'],
+  'rerank': ['k'],
+  'index_name': [],
+  'vector_store': ['backend'],
+  'rate_limiting': ['max_requests', 'time_window'],
+  'logging': ['file'],
+}
+
+# Configured files and directories; relative ones are resolved against ROOT_DIR
+PATH_KEYS = [
+  ('paths', 'data_path'),
+  ('paths', 'ground_truths'),
+  ('lexical', 'index_path'),
+  ('chunk_store', 'path'),
+  ('indexing', 'manifest_path'),
+  ('indexing', 'checkpoint_path'),
+  ('vector_store', 'local', 'path'),
+  ('rate_limiting', 'db_path'),
+  ('checkpointer', 'path'),
+  ('cache', 'index_version_file'),
+  ('cache', 'retrieval', 'sqlite_path'),
+  ('embedding_cache', 'path'),
+  ('cassette', 'path'),
+  ('retrieval_benchmark', 'output'),
+  ('sweep', 'dir'),
+  ('sweep', 'output'),
+  ('evaluation', 'results_dir'),
+  ('answer_cache', 'sqlite_path'),
+  ('logging', 'file'),
+]
+
+
+def get_config_path():
+  """`MEDBOT_CONFIG` if set, else config/config.yaml in the repository, whatever the working directory."""
+  return os.environ.get('MEDBOT_CONFIG') or os.path.join(ROOT_DIR, 'config', 'config.yaml')
+
+
+def validate_config(config):
+  missing = []
+  for section, keys in REQUIRED_KEYS.items():
+    if section not in config:
+      missing.append(section)
+      continue
+    missing.extend(f"{section}.{key}" for key in keys if key not in (config[section] or {}))
+  if missing:
+    raise ValueError(f"{get_config_path()} is missing required keys: {', '.join(missing)}")
+  return config
+
+
+def resolve_path(path):
+  """`path` relative to the repository root, so the app finds its files from any working directory."""
+  if path is None or os.path.isabs(path):
+    return path
+  return os.path.normpath(os.path.join(ROOT_DIR, path))
+
+
+def resolve_paths(config):
+  for *sections, key in PATH_KEYS:
+    section = config
+    for name in sections:
+      section = (section or {}).get(name)
+    if section and key in section:
+      section[key] = resolve_path(section[key])
+  return config
+
+
+# Used to reuse the loading config file. Parsed once per process; treat the result as read-only.
+@functools.lru_cache(maxsize=None)
 def load_config():
-    with open('config/config.yaml', 'r') as f:
-        return yaml.safe_load(f)
+  with open(get_config_path(), 'r') as f:
+    return resolve_paths(validate_config(yaml.safe_load(f)))
+
 
 def create_vectorstore(index_name):
-  pc = Pinecone()
+  from pinecone import ServerlessSpec
+  from src.clients import get_pinecone
+
+  pc = get_pinecone()
   if not pc.has_index(index_name):
     pc.create_index(
         name = index_name,
@@ -26,4 +105,4 @@ def extract_context(docs):
   for doc in docs:
     context += doc.page_content + " \n"
 
-  return context
\ No newline at end of file
+  return context
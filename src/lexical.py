@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+from src.helpers import load_config
+
+config = load_config()
+
+lexical_config = config['lexical']
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how in into is it its
+of on or that the their there these this to was were what when where which who why will with
+""".split())
+
+
+def tokenize(text):
+    """Lowercased alphanumeric terms without stopwords, e.g. 'Acid phosphatase test' -> [acid, phosphatase, test]."""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return [token for token in re.findall(r'[a-z0-9]+', text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over the indexed chunks with array-backed postings.
+
+    The postings of term `t` are `doc_ids[offsets[t]:offsets[t + 1]]` with the
+    matching term frequencies in `tfs`. The index is saved as one `.npz` file of
+    arrays plus a JSON file with the vocabulary and chunk IDs.
+    """
+
+    def __init__(self, terms, chunk_ids, doc_lengths, offsets, doc_ids, tfs, k1=lexical_config['k1'], b=lexical_config['b']):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.chunk_ids = chunk_ids
+        self.doc_lengths = doc_lengths
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.k1 = k1
+        self.b = b
+
+        num_docs = len(chunk_ids)
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if num_docs else 0.0
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, items, **kwargs):
+        """Builds the index from an iterable of (chunk_id, text) pairs."""
+        chunk_ids = []
+        doc_lengths = array('i')
+        postings = {}
+        for doc, (chunk_id, text) in enumerate(items):
+            tokens = tokenize(text)
+            chunk_ids.append(chunk_id)
+            doc_lengths.append(len(tokens))
+
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                docs_tfs = postings.get(token)
+                if docs_tfs is None:
+                    docs_tfs = postings[token] = (array('i'), array('H'))
+                docs_tfs[0].append(doc)
+                docs_tfs[1].append(min(tf, 65535))
+
+        terms = sorted(postings)
+        lengths = [len(postings[term][0]) for term in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            docs, term_tfs = postings.pop(term)
+            doc_ids[offsets[i]:offsets[i + 1]] = np.frombuffer(docs, dtype=np.int32)
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(term_tfs, dtype=np.uint16)
+
+        return cls(terms, chunk_ids, np.frombuffer(doc_lengths, dtype=np.int32).copy(), offsets, doc_ids, tfs, **kwargs)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, 'postings.npz'),
+                 doc_lengths=self.doc_lengths, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs)
+        with open(os.path.join(path, 'vocab.json'), 'w') as f:
+            json.dump({'terms': self.terms, 'chunk_ids': self.chunk_ids}, f)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        arrays = np.load(os.path.join(path, 'postings.npz'))
+        with open(os.path.join(path, 'vocab.json'), 'r') as f:
+            vocab = json.load(f)
+        return cls(vocab['terms'], vocab['chunk_ids'], arrays['doc_lengths'], arrays['offsets'],
+                   arrays['doc_ids'], arrays['tfs'], **kwargs)
+
+    def search(self, query, k=10):
+        """Top-k (chunk_id, score) pairs for the query, best first."""
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.term_ids.get(token)
+            if term is None:
+                continue
+            start, stop = self.offsets[term], self.offsets[term + 1]
+            docs = self.doc_ids[start:stop]
+            tf = self.tfs[start:stop].astype(np.float32)
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[doc], float(scores[doc])) for doc in top]
+
+
+def get_index_path(backend):
+    return lexical_config['index_path'].format(backend=backend)
+
+
+def build_lexical_index(chunk_store, backend):
+    """Rebuilds the BM25 index from every chunk in the chunk store and saves it."""
+    index = BM25Index.build(chunk_store.iter_texts())
+    index.save(get_index_path(backend))
+    return index
@@ -0,0 +1,513 @@
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections import namedtuple
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from src.helpers import load_config
+
+config = load_config()
+
+local_config = config['vector_store']['local']
+
+DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+
+# Rows scored per matrix product, to bound temporary memory on large indexes
+SCAN_BLOCK_SIZE = 65536
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+# The arrays a search scans, taken under the lock so the scan itself can run outside it
+_Snapshot = namedtuple('_Snapshot', ['matrix', 'scales', 'count', 'ivf', 'deleted_rows', 'generation'])
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _connect_meta(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rows (
+            row INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            text TEXT,
+            metadata TEXT
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def _write_state(path, state):
+    tmp_path = os.path.join(path, 'state.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(path, 'state.json'))
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store on a memory-mapped embedding matrix.
+
+    Layout of the store directory:
+
+    * `vectors.bin`: unit-normalized rows in `dtype` (float32, float16 or int8,
+      the latter with a per-row scale in `scales.bin`), appended in row order.
+    * `meta.db`: SQLite table of `(row, id, text, metadata)`. Only the IDs are
+      kept in memory; texts and metadata are read for the rows a search returns.
+    * `state.json`: row count, dtype and deleted rows. It is written last, so a
+      crash mid-append leaves the previous state intact.
+    * `ivf.npz`: optional inverted-file index (k-means lists) for approximate search.
+
+    Scores are cosine similarities, higher is better, as with the Pinecone index.
+    Upserting an existing ID tombstones the old row and appends a new one;
+    `compact` rewrites the store without its tombstoned rows.
+    """
+
+    def __init__(self, embedding: Embeddings, path=local_config['path'], dtype=local_config['dtype'],
+                 index_type=local_config['index_type'], nprobe=local_config['nprobe']):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown local store dtype: {dtype}")
+        self._embedding = embedding
+        self.path = path
+        self.dtype = dtype
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._state_mtime = None
+        self._meta = None
+        # Bumped whenever rows may be renumbered (reload, compaction, reset)
+        self._generation = 0
+        self._recover_compaction()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ============= STORAGE =============
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """(Re)opens the store from disk."""
+        state_path = self._file('state.json')
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            self._state_mtime = os.stat(state_path).st_mtime_ns
+        else:
+            state = {'count': 0, 'dimensions': None, 'dtype': self.dtype, 'deleted': []}
+
+        if state['count'] and state['dtype'] != self.dtype:
+            raise ValueError(f"Store at {self.path} holds {state['dtype']} vectors, not {self.dtype}")
+
+        self._generation += 1
+        self.count = state['count']
+        self.dimensions = state['dimensions']
+        self.deleted = set(state['deleted'])
+
+        self._open_meta()
+        self.ids = [doc_id for (doc_id,) in
+                    self._meta.execute("SELECT id FROM rows WHERE row < ? ORDER BY row", (self.count,))]
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids) if row not in self.deleted}
+        self._open_matrix()
+
+        self.ivf = None
+        ivf_path = self._file('ivf.npz')
+        if self.index_type == 'ivf' and os.path.exists(ivf_path):
+            self.ivf = dict(np.load(ivf_path))
+
+    def _open_meta(self):
+        if self._meta is not None:
+            self._meta.close()
+        self._meta = _connect_meta(self._file('meta.db'))
+
+    def _open_matrix(self):
+        self.deleted_rows = np.fromiter(sorted(self.deleted), dtype=np.int64, count=len(self.deleted))
+        self.matrix = None
+        self.scales = None
+        if self.count:
+            self.matrix = np.memmap(self._file('vectors.bin'), dtype=DTYPES[self.dtype], mode='r',
+                                    shape=(self.count, self.dimensions))
+            if self.dtype == 'int8':
+                self.scales = np.memmap(self._file('scales.bin'), dtype=np.float32, mode='r', shape=(self.count,))
+
+    def _save_state(self):
+        _write_state(self.path, {'count': self.count, 'dimensions': self.dimensions, 'dtype': self.dtype,
+                                 'deleted': sorted(self.deleted)})
+        self._state_mtime = os.stat(self._file('state.json')).st_mtime_ns
+
+    def _refresh(self):
+        """Picks up rows written by another process, e.g. a re-index."""
+        try:
+            mtime = os.stat(self._file('state.json')).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._state_mtime:
+            self._load()
+
+    def _truncate_to_state(self):
+        """Drops bytes appended by a write that crashed before its state was saved."""
+        itemsize = np.dtype(DTYPES[self.dtype]).itemsize
+        sizes = {
+            'vectors.bin': self.count * (self.dimensions or 0) * itemsize,
+            'scales.bin': self.count * 4,
+        }
+        for name, size in sizes.items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        self._meta.execute("DELETE FROM rows WHERE row >= ?", (self.count,))
+        self._meta.commit()
+
+    def _encode(self, vectors):
+        if self.dtype == 'int8':
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(DTYPES[self.dtype]), None
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        """Appends pre-computed embeddings; existing IDs are replaced."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        vectors = _normalize(embeddings)
+
+        with self._lock:
+            self._refresh()
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+            elif vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Expected {self.dimensions}-dim vectors, got {vectors.shape[1]}")
+
+            for doc_id in ids:
+                if doc_id in self.id_to_row:
+                    self.deleted.add(self.id_to_row.pop(doc_id))
+
+            self._truncate_to_state()
+            rows, scales = self._encode(vectors)
+            with open(self._file('vectors.bin'), 'ab') as f:
+                f.write(rows.tobytes())
+            if scales is not None:
+                with open(self._file('scales.bin'), 'ab') as f:
+                    f.write(scales.tobytes())
+            self._meta.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                [(row, doc_id, text, json.dumps(metadata))
+                 for row, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas), start=self.count)],
+            )
+            self._meta.commit()
+
+            for row, doc_id in enumerate(ids, start=self.count):
+                self.ids.append(doc_id)
+                self.id_to_row[doc_id] = row
+            self.count += len(texts)
+            self._save_state()
+            self._open_matrix()
+        return ids
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            self._refresh()
+            for doc_id in ids or []:
+                if doc_id in self.id_to_row:
+                    self.deleted.add(self.id_to_row.pop(doc_id))
+            self._save_state()
+            self._open_matrix()
+        return True
+
+    def reset(self):
+        """Removes every row."""
+        with self._lock:
+            self._meta.close()
+            self._meta = None
+            for name in ('vectors.bin', 'scales.bin', 'meta.db', 'meta.db-wal', 'meta.db-shm',
+                         'ivf.npz', 'state.json'):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.dimensions = None
+            self._load()
+
+    # ============= COMPACTION =============
+
+    def _compaction_path(self):
+        return os.path.normpath(self.path) + '.compact'
+
+    def _recover_compaction(self):
+        """Finishes or discards a compaction that crashed before it replaced the store."""
+        compacted = self._compaction_path()
+        if not os.path.exists(compacted):
+            return
+        if not os.path.exists(self.path) and os.path.exists(os.path.join(compacted, 'state.json')):
+            os.replace(compacted, self.path)
+        else:
+            shutil.rmtree(compacted)
+        shutil.rmtree(os.path.normpath(self.path) + '.old', ignore_errors=True)
+
+    @property
+    def deleted_ratio(self):
+        return len(self.deleted) / self.count if self.count else 0.0
+
+    def compact(self):
+        """Rewrites the store without its tombstoned rows and returns how many were reclaimed.
+
+        The live rows are copied, in order, into a sibling directory that then
+        replaces the store, so a crash leaves either the old or the new store.
+        Row numbers change, so the IVF lists are dropped; rebuild them with
+        `build_ivf`.
+        """
+        with self._lock:
+            self._refresh()
+            if not self.deleted:
+                return 0
+
+            live = np.array(sorted(self.id_to_row.values()), dtype=np.int64)
+            compacted = self._compaction_path()
+            shutil.rmtree(compacted, ignore_errors=True)
+            os.makedirs(compacted)
+
+            for name, source in (('vectors.bin', self.matrix), ('scales.bin', self.scales)):
+                if source is None:
+                    continue
+                with open(os.path.join(compacted, name), 'wb') as f:
+                    for start in range(0, len(live), SCAN_BLOCK_SIZE):
+                        f.write(np.ascontiguousarray(source[live[start:start + SCAN_BLOCK_SIZE]]).tobytes())
+
+            new_rows = {int(old_row): new_row for new_row, old_row in enumerate(live)}
+            meta = _connect_meta(os.path.join(compacted, 'meta.db'))
+            try:
+                meta.executemany(
+                    "INSERT INTO rows (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                    ((new_rows[row], doc_id, text, metadata) for row, doc_id, text, metadata in self._meta.execute(
+                        "SELECT row, id, text, metadata FROM rows WHERE row < ? ORDER BY row", (self.count,))
+                     if row in new_rows),
+                )
+                meta.commit()
+            finally:
+                meta.close()
+            # Written last: only a complete copy has a state file
+            _write_state(compacted, {'count': len(live), 'dimensions': self.dimensions, 'dtype': self.dtype,
+                                     'deleted': []})
+
+            self._meta.close()
+            self._meta = None
+            old = os.path.normpath(self.path) + '.old'
+            os.replace(self.path, old)
+            os.replace(compacted, self.path)
+            shutil.rmtree(old)
+            reclaimed = self.count - len(live)
+            self._load()
+            return reclaimed
+
+    # ============= APPROXIMATE INDEX =============
+
+    def build_ivf(self, nlist=local_config['nlist'], iterations=10, sample_size=50000, seed=0):
+        """Clusters the rows with spherical k-means into `nlist` inverted lists."""
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                raise ValueError(f"Cannot build an IVF index for the empty store at {self.path}")
+            snapshot = self._snapshot()
+            rng = np.random.default_rng(seed)
+            nlist = min(nlist, self.count)
+            sample_rows = np.sort(rng.choice(self.count, size=min(sample_size, self.count), replace=False))
+            sample = self._rows(snapshot, sample_rows)
+
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                empty = np.bincount(assignment, minlength=nlist) == 0
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            assignment = np.empty(self.count, dtype=np.int32)
+            for start in range(0, self.count, SCAN_BLOCK_SIZE):
+                block = self._rows(snapshot, np.arange(start, min(start + SCAN_BLOCK_SIZE, self.count)))
+                assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            order = np.argsort(assignment, kind='stable').astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+            np.savez(self._file('ivf.npz'), centroids=centroids, order=order, offsets=offsets,
+                     built_count=np.int64(self.count))
+            self._load()
+
+    def _candidate_rows(self, snapshot, query):
+        """Rows in the `nprobe` nearest lists, plus rows added since the lists were built."""
+        ivf = snapshot.ivf
+        probes = np.argsort(-(ivf['centroids'] @ query))[:self.nprobe]
+        rows = [ivf['order'][ivf['offsets'][p]:ivf['offsets'][p + 1]] for p in probes]
+        rows.append(np.arange(int(ivf['built_count']), snapshot.count))
+        return np.sort(np.concatenate(rows))
+
+    # ============= SEARCH =============
+
+    def _snapshot(self):
+        return _Snapshot(self.matrix, self.scales, self.count, self.ivf, self.deleted_rows, self._generation)
+
+    @staticmethod
+    def _rows(snapshot, rows):
+        vectors = np.asarray(snapshot.matrix[rows], dtype=np.float32)
+        if snapshot.scales is not None:
+            vectors *= snapshot.scales[rows][:, None]
+        return vectors
+
+    def _scan(self, snapshot, query):
+        """Cosine scores of `query` against the IVF candidates, or every row without an IVF index."""
+        if snapshot.ivf is not None:
+            rows = self._candidate_rows(snapshot, query)
+            return rows, self._rows(snapshot, rows) @ query
+
+        scores = np.empty(snapshot.count, dtype=np.float32)
+        for start in range(0, snapshot.count, SCAN_BLOCK_SIZE):
+            stop = min(start + SCAN_BLOCK_SIZE, snapshot.count)
+            block = np.asarray(snapshot.matrix[start:stop], dtype=np.float32) @ query
+            if snapshot.scales is not None:
+                block *= snapshot.scales[start:stop]
+            scores[start:stop] = block
+        return np.arange(snapshot.count), scores
+
+    def _top_rows(self, embedding, k):
+        """Best `k` rows and their scores, with the snapshot they were scanned on.
+
+        Only taking the snapshot holds the lock: the memmaps it references stay
+        valid after an append or compaction replaces them, so concurrent searches
+        and writes do not queue behind a full scan.
+        """
+        with self._lock:
+            self._refresh()
+            snapshot = self._snapshot()
+        if not snapshot.count:
+            return [], [], snapshot
+
+        rows, scores = self._scan(snapshot, _normalize(embedding))
+        if len(snapshot.deleted_rows):
+            scores = np.where(np.isin(rows, snapshot.deleted_rows), -np.inf, scores)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return [], [], snapshot
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top], snapshot
+
+    def _documents(self, rows):
+        """Documents for `rows`, in order, with their text and metadata read from `meta.db`."""
+        rows = [int(row) for row in rows]
+        found = {}
+        for start in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            batch = rows[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            found.update((row, (text, metadata)) for row, text, metadata in self._meta.execute(
+                f"SELECT row, text, metadata FROM rows WHERE row IN ({placeholders})", batch))
+        return [Document(id=self.ids[row], page_content=found[row][0], metadata=json.loads(found[row][1]))
+                for row in rows]
+
+    def _search(self, embedding, k, select=None):
+        """Runs `_top_rows`, then `select` on its rows and scores, and returns `(document, score)` pairs.
+
+        The documents are read under the lock. If the rows were renumbered since
+        the snapshot, the search is repeated once, and then entirely under the lock.
+        Rows deleted during the scan are dropped.
+        """
+        for attempt in range(2):
+            with (self._lock if attempt else contextlib.nullcontext()):
+                rows, scores, snapshot = self._top_rows(embedding, k)
+                if select is not None and len(rows):
+                    rows, scores = select(snapshot, rows, scores)
+                with self._lock:
+                    if snapshot.generation != self._generation:
+                        continue
+                    hits = [(row, score) for row, score in zip(rows, scores) if int(row) not in self.deleted]
+                    docs = self._documents([row for row, _ in hits])
+                return [(doc, float(score)) for doc, (_, score) in zip(docs, hits)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        return self._search(embedding, k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        def select(snapshot, rows, scores):
+            selected = maximal_marginal_relevance(_normalize(embedding), self._rows(snapshot, rows),
+                                                  lambda_mult=lambda_mult, k=k)
+            return [rows[i] for i in selected], [scores[i] for i in selected]
+
+        return [doc for doc, _ in self._search(embedding, fetch_k, select)]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(self._embedding.embed_query(query), k, fetch_k, lambda_mult)
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    # ============= VECTORSTORE INTERFACE =============
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None,
+                  *, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def get_by_ids(self, ids):
+        with self._lock:
+            self._refresh()
+            return self._documents([self.id_to_row[doc_id] for doc_id in ids if doc_id in self.id_to_row])
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, **kwargs):
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+def main(argv=None):
+    from src.clients import get_embeddings
+
+    parser = argparse.ArgumentParser(description="Maintain the local vector store.")
+    parser.add_argument('command', choices=['build-ivf', 'compact', 'stats'])
+    parser.add_argument('--nlist', type=int, default=local_config['nlist'])
+    args = parser.parse_args(argv)
+
+    store = LocalVectorStore(embedding=get_embeddings())
+    if args.command == 'build-ivf':
+        store.build_ivf(nlist=args.nlist)
+        print(f"Built {args.nlist} inverted lists over {store.count} rows in {store.path}")
+    elif args.command == 'compact':
+        reclaimed = store.compact()
+        print(f"Reclaimed {reclaimed} deleted rows, {store.count} rows left in {store.path}")
+        if reclaimed and store.index_type == 'ivf':
+            store.build_ivf(nlist=args.nlist)
+            print(f"Rebuilt {args.nlist} inverted lists")
+    else:
+        print(f"{store.count - len(store.deleted)} live rows ({len(store.deleted)} deleted), "
+              f"{store.dimensions} dims, {store.dtype}, ivf={'yes' if store.ivf is not None else 'no'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import functools
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from src.helpers import load_config
+
+config = load_config()
+
+metering_config = config['metering']
+
+logger = logging.getLogger('medbot.metering')
+
+
+@dataclass
+class Usage:
+    """Tokens and cost of one or more chat model calls."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    calls: int = 0
+    estimated_calls: int = 0  # calls whose tokens were counted with tiktoken because the API reported none
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other):
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.calls += other.calls
+        self.estimated_calls += other.estimated_calls
+        self.cost += other.cost
+        return self
+
+
+def get_price(model_name, pricing=metering_config['pricing']):
+    """(input, output) USD per 1M tokens for a model; the longest configured prefix wins, unknown models are free."""
+    matches = [name for name in pricing if model_name and model_name.startswith(name)]
+    if not matches:
+        return 0.0, 0.0
+    price = pricing[max(matches, key=len)]
+    return price['input'], price['output']
+
+
+def get_cost(model_name, input_tokens, output_tokens):
+    input_price, output_price = get_price(model_name)
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+# ============= TOKEN ESTIMATES =============
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model_name):
+    """tiktoken encoding for a model, or None when tiktoken or its BPE file is unavailable."""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        logger.warning(f"No tiktoken encoding for {model_name!r}, estimating 4 characters per token: {e}")
+        return None
+
+
+def count_tokens(text, model_name=None):
+    encoding = _get_encoding(model_name or config['model']['name'])
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_content_tokens(message, model_name=None):
+    """Tokens of a message's content and tool call arguments."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    total = count_tokens(content, model_name)
+    for tool_call in getattr(message, 'tool_calls', None) or []:
+        total += count_tokens(json.dumps(tool_call.get('args', {})), model_name)
+    return total
+
+
+def count_message_tokens(messages, model_name=None):
+    """Prompt tokens of a chat request, with OpenAI's per-message and reply-priming overhead."""
+    return 3 + sum(4 + count_content_tokens(message, model_name) for message in messages)
+
+
+# ============= TOTALS =============
+
+class Meter:
+    """Running usage totals per stage, per thread and per IP for this process.
+
+    Stages are kept for the life of the process; threads and IPs are kept for
+    the `max_tracked` most recently active of each. `totals('ip', ip)` is what
+    a token-based rate limit would read.
+    """
+
+    def __init__(self, max_tracked=metering_config['max_tracked']):
+        self.max_tracked = max_tracked
+        self._totals = {'stage': {}, 'thread': OrderedDict(), 'ip': OrderedDict()}
+        self._lock = threading.Lock()
+
+    def _add(self, kind, key, usage):
+        totals = self._totals[kind]
+        current = totals.get(key)
+        if current is None:
+            current = totals[key] = Usage()
+        current.add(usage)
+        if isinstance(totals, OrderedDict):
+            totals.move_to_end(key)
+            while len(totals) > self.max_tracked:
+                totals.popitem(last=False)
+
+    def record(self, usage, stage, thread_id=None, ip=None):
+        with self._lock:
+            self._add('stage', stage, usage)
+            if thread_id is not None:
+                self._add('thread', thread_id, usage)
+            if ip is not None:
+                self._add('ip', ip, usage)
+
+    def totals(self, kind, key):
+        with self._lock:
+            return Usage().add(self._totals[kind].get(key, Usage()))
+
+    def snapshot(self, kind='stage'):
+        with self._lock:
+            return {key: asdict(usage) for key, usage in self._totals[kind].items()}
+
+
+meter = Meter()
+
+
+def is_enabled():
+    return metering_config['enabled']
+
+
+# ============= PER-REQUEST METERING =============
+
+def get_stage(tags, metadata):
+    """Pipeline stage of a chat model call: a `stage:<name>` tag, else the graph node that made it."""
+    for tag in tags or []:
+        if tag.startswith('stage:'):
+            return tag[len('stage:'):]
+    node = (metadata or {}).get('langgraph_node', 'chat_model')
+    return 'summarize' if 'Summarization' in node else node
+
+
+class RequestMeter:
+    """Usage of one request, by stage; every call is also added to the process-wide `meter`."""
+
+    def __init__(self, thread_id=None, ip=None, meter=meter):
+        self.thread_id = thread_id
+        self.ip = ip
+        self.meter = meter
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._handler = None
+
+    def record(self, stage, model_name, input_tokens, output_tokens, estimated=False):
+        usage = Usage(input_tokens, output_tokens, calls=1, estimated_calls=int(estimated),
+                      cost=get_cost(model_name, input_tokens, output_tokens))
+        with self._lock:
+            self.stages.setdefault(stage, Usage()).add(usage)
+        self.meter.record(usage, stage, self.thread_id, self.ip)
+
+    @property
+    def total(self):
+        with self._lock:
+            total = Usage()
+            for usage in self.stages.values():
+                total.add(usage)
+            return total
+
+    def callback(self):
+        """Callback handler that records every chat model call of the run it is attached to."""
+        if self._handler is None:
+            self._handler = _handler_class()(self)
+        return self._handler
+
+    def log(self, **attributes):
+        """Logs the request's tokens and cost as one JSON record and returns it."""
+        total = self.total
+        with self._lock:
+            stages = {stage: asdict(usage) for stage, usage in self.stages.items()}
+        record = {'thread_id': self.thread_id, 'ip': self.ip, 'input_tokens': total.input_tokens,
+                  'output_tokens': total.output_tokens, 'cost_usd': round(total.cost, 6),
+                  'estimated_calls': total.estimated_calls, 'stages': stages, **attributes}
+        logger.info(json.dumps(record, default=str))
+        return record
+
+
+@functools.lru_cache(maxsize=None)
+def _handler_class():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCallbackHandler(BaseCallbackHandler):
+        """Reads `usage_metadata` off each chat model response, or estimates it with tiktoken."""
+
+        def __init__(self, request_meter):
+            self.request_meter = request_meter
+            self._runs = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, metadata=None,
+                                invocation_params=None, **kwargs):
+            model_name = ((metadata or {}).get('ls_model_name')
+                          or (invocation_params or {}).get('model')
+                          or (invocation_params or {}).get('model_name'))
+            self._runs[run_id] = (get_stage(tags, metadata), model_name, messages[0] if messages else [])
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            stage, model_name, prompt = run
+            generations = [generation for batch in response.generations for generation in batch]
+            usage = [getattr(getattr(g, 'message', None), 'usage_metadata', None) for g in generations]
+            if generations and all(usage):
+                self.request_meter.record(stage, model_name, sum(u['input_tokens'] for u in usage),
+                                          sum(u['output_tokens'] for u in usage))
+                return
+            output_tokens = sum(
+                count_content_tokens(g.message, model_name) if hasattr(g, 'message')
+                else count_tokens(g.text, model_name)
+                for g in generations
+            )
+            self.request_meter.record(stage, model_name, count_message_tokens(prompt, model_name),
+                                      output_tokens, estimated=True)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._runs.pop(run_id, None)
+
+    return UsageCallbackHandler
@@ -0,0 +1,312 @@
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from langchain.agents.middleware import AgentMiddleware, SummarizationMiddleware
+from langchain_core.messages import HumanMessage, RemoveMessage, ToolMessage, get_buffer_string
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src import metering, tracing
+from src.context_packing import citation
+from src.data_chunking import make_chunk_id
+
+logger = logging.getLogger(__name__)
+
+
+class TracingMiddleware(AgentMiddleware):
+    """Times every model call as the `model` span and every tool call as `tool.<name>`."""
+
+    def wrap_model_call(self, request, handler):
+        with tracing.span('model', messages=len(request.messages)):
+            return handler(request)
+
+    async def awrap_model_call(self, request, handler):
+        with tracing.span('model', messages=len(request.messages)):
+            return await handler(request)
+
+    def wrap_tool_call(self, request, handler):
+        with tracing.span(f"tool.{request.tool_call['name']}"):
+            return handler(request)
+
+    async def awrap_tool_call(self, request, handler):
+        with tracing.span(f"tool.{request.tool_call['name']}"):
+            return await handler(request)
+
+
+class TracedSummarizationMiddleware(SummarizationMiddleware):
+    """SummarizationMiddleware whose history check and summary call are timed as the `summarize` span."""
+
+    def before_model(self, state, runtime):
+        with tracing.span('summarize', messages=len(state['messages'])):
+            return super().before_model(state, runtime)
+
+    async def abefore_model(self, state, runtime):
+        with tracing.span('summarize', messages=len(state['messages'])):
+            return await super().abefore_model(state, runtime)
+
+
+def compact_refs(docs, snippet_chars):
+    """Compact references to the passages a tool returned: chunk IDs, citations and a short snippet."""
+    refs = []
+    for doc in docs:
+        snippet = " ".join(doc.page_content.split())
+        refs.append({
+            'ids': doc.metadata.get('chunk_ids') or [doc.id or make_chunk_id(doc)],
+            'citations': doc.metadata.get('citations') or [citation(doc)],
+            'snippet': snippet if len(snippet) <= snippet_chars else snippet[:snippet_chars].rsplit(' ', 1)[0] + "...",
+        })
+    return refs
+
+
+def format_refs(refs, rehydrate_tool):
+    lines = [f"Context retrieved in an earlier turn, compacted. Call {rehydrate_tool} with the ids to read the full text."]
+    for ref in refs:
+        lines.append(f"[ids: {', '.join(ref['ids'])}] {'; '.join(ref['citations'])}: {ref['snippet']}")
+    return "\n".join(lines)
+
+
+class CompactToolResultsMiddleware(AgentMiddleware):
+    """Replaces retrieval tool results with compact references once the turn that used them ends.
+
+    The model sees the full context only in the turn that retrieved it. At the
+    end of the turn each of those ToolMessages is rewritten in place (same
+    message id) to a list of chunk IDs, citations and snippets, and its
+    Document artifact is dropped, so the checkpointed history and every later
+    prompt carry only the references. `rehydrate_tool` reads the full text back
+    from the chunk store when a later turn needs it.
+
+    With `resolve` (chunk IDs -> Documents), a message is only compacted when
+    every one of its IDs resolves; otherwise its full text stays in the history.
+    """
+
+    def __init__(self, tool_names=('retrieve_context',), rehydrate_tool='rehydrate_context', snippet_chars=160,
+                 resolve=None):
+        super().__init__()
+        self.tool_names = set(tool_names)
+        self.rehydrate_tool = rehydrate_tool
+        self.snippet_chars = snippet_chars
+        self.resolve = resolve
+
+    def _resolvable(self, refs):
+        ids = {doc_id for ref in refs for doc_id in ref['ids']}
+        try:
+            return ids <= {doc.id for doc in self.resolve(list(ids))}
+        except Exception as e:
+            logger.warning(f"Could not check that compacted context can be rehydrated: {e}")
+            return False
+
+    def _compact(self, message):
+        refs = compact_refs(message.artifact, self.snippet_chars)
+        if self.resolve is not None and not self._resolvable(refs):
+            # Kept in full, and marked so later turns do not check it again
+            return message.model_copy(update={'response_metadata': {**message.response_metadata, 'compacted': False}})
+        return message.model_copy(update={
+            'content': format_refs(refs, self.rehydrate_tool),
+            'artifact': refs,
+            'response_metadata': {**message.response_metadata, 'compacted': True},
+        })
+
+    def after_agent(self, state, runtime):
+        with tracing.span('compact'):
+            compacted = [
+                self._compact(message) for message in state['messages']
+                if isinstance(message, ToolMessage) and message.name in self.tool_names and message.artifact
+                and 'compacted' not in message.response_metadata
+            ]
+        return {'messages': compacted} if compacted else None
+
+    async def aafter_agent(self, state, runtime):
+        return self.after_agent(state, runtime)
+
+
+SUMMARY_PROMPT = """Summarize the conversation below so it can replace the messages in the assistant's history.
+Keep every medical fact, the sources cited for it and anything the user said about themselves; drop small talk.
+Respond ONLY with the summary.
+
+<messages>
+{messages}
+</messages>"""
+
+
+ROLLING_SUMMARY_PROMPT = """Below is the summary of a conversation so far, followed by the messages that came after it.
+Update the summary so it also covers the new messages. Keep every medical fact, the sources cited for it and
+anything the user said about themselves; drop small talk. Respond ONLY with the updated summary.
+
+<summary>
+{summary}
+</summary>
+
+<messages>
+{messages}
+</messages>"""
+
+
+@dataclass
+class PendingSummary:
+    """A finished background summary waiting to replace `message_ids` at the thread's next turn."""
+    summary: str
+    message_ids: list
+    tokens_saved: int
+    seconds: float
+
+
+class BackgroundSummarizationMiddleware(AgentMiddleware):
+    """Summarizes old history between turns so no model call waits on the summarizer.
+
+    At the end of a turn the history is measured with tiktoken. Past `trigger_tokens`,
+    the messages before the `keep_tokens` cutoff go to a background worker, which
+    folds them into the rolling summary (the previous summary plus the messages since).
+    The next turn's `before_agent` replaces those messages with the summary in a
+    single state update, provided they are all still in the history; otherwise the
+    summary is discarded and the next turn starts a new one.
+
+    Only the public `before_agent` / `after_agent` hooks are used, so the
+    summarization policy (trigger, cutoff, trimming) lives here rather than in
+    langchain's SummarizationMiddleware internals.
+    """
+
+    def __init__(self, model, *, trigger_tokens, keep_tokens, max_workers=2, max_pending=1000, model_name=None,
+                 trim_tokens=4000, summary_prompt=SUMMARY_PROMPT):
+        super().__init__()
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.keep_tokens = keep_tokens
+        self.trim_tokens = trim_tokens
+        self.summary_prompt = summary_prompt
+        self.token_counter = functools.partial(metering.count_message_tokens, model_name=model_name)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+        self._jobs = OrderedDict()  # thread_id -> Future of a PendingSummary, oldest first
+        self._lock = threading.Lock()
+        self.counts = {'started': 0, 'swapped': 0, 'discarded': 0, 'failed': 0, 'tokens_saved': 0}
+
+    @staticmethod
+    def _is_summary(message):
+        return bool(message.response_metadata.get('summary'))
+
+    def _cutoff_index(self, messages):
+        """Index of the first message kept verbatim: the newest ones within `keep_tokens`.
+
+        A ToolMessage is never the first kept message, so a tool call and its
+        result are summarized or kept together. 0 means there is nothing to summarize.
+        """
+        kept = 0
+        cutoff = len(messages)
+        while cutoff > 0:
+            kept += self.token_counter([messages[cutoff - 1]])
+            if kept > self.keep_tokens:
+                break
+            cutoff -= 1
+        while cutoff < len(messages) and isinstance(messages[cutoff], ToolMessage):
+            cutoff += 1
+        # A lone previous summary is not worth summarizing again
+        if cutoff == 1 and self._is_summary(messages[0]):
+            return 0
+        return cutoff
+
+    def _trim(self, messages):
+        """The newest messages that fit `trim_tokens`, as text for the summary prompt."""
+        trimmed, used = [], 0
+        for message in reversed(messages):
+            used += self.token_counter([message])
+            if used > self.trim_tokens and trimmed:
+                break
+            trimmed.append(message)
+        return get_buffer_string(trimmed[::-1])
+
+    @staticmethod
+    def _thread_id():
+        from langgraph.config import get_config
+
+        return get_config().get('configurable', {}).get('thread_id')
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+        tracing.increment(f"summarize.{name}", value)
+
+    def _summarize(self, thread_id, messages):
+        start = time.perf_counter()
+        previous = messages[0] if self._is_summary(messages[0]) else None
+        trimmed = self._trim(messages[1:] if previous else messages)
+        if previous is not None:
+            prompt = ROLLING_SUMMARY_PROMPT.format(summary=previous.content, messages=trimmed)
+        else:
+            prompt = self.summary_prompt.format(messages=trimmed)
+
+        # A fresh run config: the turn that triggered this summary has already finished streaming
+        callbacks = [metering.RequestMeter(thread_id).callback()] if metering.is_enabled() else []
+        response = self.model.invoke(prompt, config={'tags': ['stage:summarize'], 'callbacks': callbacks})
+        summary = response.text.strip()
+
+        tokens_saved = self.token_counter(messages) - self.token_counter(self._build_new_messages(summary))
+        seconds = time.perf_counter() - start
+        tracing.observe('summarize.background', seconds, thread_id=thread_id, messages=len(messages),
+                        tokens_saved=tokens_saved)
+        return PendingSummary(summary, [message.id for message in messages], tokens_saved, seconds)
+
+    def _build_new_messages(self, summary):
+        return [HumanMessage(content=f"Here is a summary of the conversation to date:\n\n{summary}",
+                             id=str(uuid.uuid4()), response_metadata={'summary': True})]
+
+    def after_agent(self, state, runtime):
+        thread_id = self._thread_id()
+        messages = state['messages']
+        with self._lock:
+            if thread_id is None or thread_id in self._jobs:
+                return None
+
+        if self.token_counter(messages) < self.trigger_tokens:
+            return None
+        cutoff_index = self._cutoff_index(messages)
+        if cutoff_index <= 0:
+            return None
+
+        with self._lock:
+            self._jobs[thread_id] = self._executor.submit(self._summarize, thread_id, list(messages[:cutoff_index]))
+            while len(self._jobs) > self.max_pending:
+                self._jobs.popitem(last=False)
+        self._count('started')
+        return None
+
+    async def aafter_agent(self, state, runtime):
+        return self.after_agent(state, runtime)
+
+    def before_agent(self, state, runtime):
+        thread_id = self._thread_id()
+        with self._lock:
+            future = self._jobs.get(thread_id)
+            if future is None or not future.done():
+                return None
+            del self._jobs[thread_id]
+
+        try:
+            pending = future.result()
+        except Exception as e:
+            logger.warning(f"Background summary failed for thread {thread_id}: {e}")
+            self._count('failed')
+            return None
+
+        messages = state['messages']
+        summarized = set(pending.message_ids)
+        if not summarized <= {message.id for message in messages}:
+            self._count('discarded')
+            return None
+
+        self._count('swapped')
+        self._count('tokens_saved', pending.tokens_saved)
+        return {
+            'messages': [
+                RemoveMessage(id=REMOVE_ALL_MESSAGES),
+                *self._build_new_messages(pending.summary),
+                *[message for message in messages if message.id not in summarized],
+            ]
+        }
+
+    async def abefore_agent(self, state, runtime):
+        return self.before_agent(state, runtime)
@@ -0,0 +1,163 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Literal
+
+from pydantic import BaseModel
+
+from src import tracing
+from src.clients import get_structured_model
+from src.helpers import load_config
+
+config = load_config()
+
+model = config['model']['name']
+temperature = config['model']['temperature']
+rerank_k = config['rerank']['k']
+validation_mode = config['validation']['mode']
+max_concurrency = config['validation']['max_concurrency']
+
+logger = logging.getLogger(__name__)
+
+
+class RelevanceOutput(BaseModel):
+    output: Literal["yes", "no"]
+
+
+class BatchRelevanceOutput(BaseModel):
+    relevant: list[int]
+
+
+@dataclass
+class DocTiming:
+    """Grading outcome and latency of a single retrieved document."""
+    rank: int
+    relevant: bool
+    seconds: float
+
+
+class RelevanceValidator:
+    """Grades retrieved documents against a query with an LLM.
+
+    `concurrent` mode sends one yes/no call per document with at most
+    `max_concurrency` calls in flight; `batch` mode scores the whole list in a
+    single call. Accepted documents are yielded in retrieval-rank order and
+    grading stops once `limit` relevant documents have been found.
+    """
+
+    def __init__(self, mode=validation_mode, max_concurrency=max_concurrency, limit=rerank_k):
+        if mode not in ('concurrent', 'batch'):
+            raise ValueError(f"Unknown validation mode: {mode}")
+        self.mode = mode
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = limit
+        self.timings = []
+
+    def _grade_prompt(self, query, doc):
+        return f"""Rate if this document is relevant to the query (yes/no) only:
+            Query : {query}
+            Document : {doc.page_content}
+            Answer :
+        """
+
+    def _batch_prompt(self, query, docs):
+        documents = "\n\n".join(f"[{i}] {doc.page_content}" for i, doc in enumerate(docs))
+        return f"""For each numbered document, decide if it is relevant to the query.
+            Return the numbers of the relevant documents only.
+            Query : {query}
+            Documents :
+            {documents}
+            Relevant :
+        """
+
+    def _grade(self, checker, query, rank, doc):
+        start = time.perf_counter()
+        response = checker.invoke(self._grade_prompt(query, doc), config={'tags': ['stage:validate']})
+        seconds = time.perf_counter() - start
+        tracing.observe('validate.call', seconds, rank=rank)
+        return DocTiming(rank=rank, relevant=response.output == 'yes', seconds=seconds)
+
+    def _iter_concurrent(self, query, docs):
+        checker = get_structured_model(RelevanceOutput, model, temperature)
+
+        accepted = 0
+        pending = {}
+        next_rank = 0
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        try:
+            for rank in range(len(docs)):
+                # Keep at most `max_concurrency` calls in flight, so an early stop
+                # never pays for documents that were not needed.
+                while next_rank < len(docs) and len(pending) < self.max_concurrency:
+                    # Each call runs in a copy of this context, so its spans keep the request's trace id
+                    pending[next_rank] = executor.submit(contextvars.copy_context().run, self._grade, checker,
+                                                         query, next_rank, docs[next_rank])
+                    next_rank += 1
+
+                timing = pending.pop(rank).result()
+                self.timings.append(timing)
+                if timing.relevant:
+                    yield docs[rank]
+                    accepted += 1
+                    if self.limit and accepted >= self.limit:
+                        break
+        finally:
+            # Runs on an early stop, when the caller closes the generator (GeneratorExit at the
+            # yield) and when a call raises. Calls already in flight finish in the background;
+            # the caller does not wait for them and queued ones never start.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_batch(self, query, docs):
+        checker = get_structured_model(BatchRelevanceOutput, model, temperature)
+
+        start = time.perf_counter()
+        response = checker.invoke(self._batch_prompt(query, docs), config={'tags': ['stage:validate']})
+        elapsed = time.perf_counter() - start
+        tracing.observe('validate.batch', elapsed, docs=len(docs))
+
+        relevant = {i for i in response.relevant if 0 <= i < len(docs)}
+        accepted = 0
+        for rank, doc in enumerate(docs):
+            # A single call grades every document, so each one carries its share.
+            self.timings.append(DocTiming(rank=rank, relevant=rank in relevant, seconds=elapsed / len(docs)))
+            if rank in relevant:
+                yield doc
+                accepted += 1
+                if self.limit and accepted >= self.limit:
+                    break
+
+    @property
+    def llm_calls(self):
+        """LLM calls made by the last `iter_relevant` run."""
+        if self.mode == 'batch':
+            return 1 if self.timings else 0
+        return len(self.timings)
+
+    def iter_relevant(self, query, docs):
+        """Yield relevant docs in rank order as soon as each one is graded."""
+        self.timings = []
+        if not docs:
+            return
+
+        start = time.perf_counter()
+        try:
+            if self.mode == 'batch':
+                yield from self._iter_batch(query, docs)
+            else:
+                yield from self._iter_concurrent(query, docs)
+        finally:
+            # Also logged when the caller stops iterating early
+            self._log_timings(time.perf_counter() - start)
+
+    def _log_timings(self, wall_time):
+        graded = sum(timing.seconds for timing in self.timings)
+        speedup = graded / wall_time if wall_time else 0.0
+        per_doc = ", ".join(
+            f"#{timing.rank}={'yes' if timing.relevant else 'no'}/{timing.seconds:.2f}s" for timing in self.timings
+        )
+        logger.info(
+            f"Relevance validation ({self.mode}) graded {len(self.timings)} docs in {wall_time:.2f}s "
+            f"(sequential {graded:.2f}s, speedup {speedup:.1f}x) | {per_doc}"
+        )
@@ -0,0 +1,97 @@
+import math
+import time
+
+from src.helpers import load_config
+
+config = load_config()
+
+rendering_config = config['rendering']
+
+
+class ThrottledPlaceholder:
+    """Markdown placeholder that is re-rendered at most once per `interval` seconds.
+
+    Every render re-sends the whole text, so writes in between only replace the
+    pending text. A write renders at once when `interval` has passed since the
+    last render, or when at least `max_pending_chars` characters have been added
+    since then; otherwise it waits for a later write, `flush_if_due` or `flush`.
+    """
+
+    def __init__(self, placeholder, interval=rendering_config['interval'],
+                 max_pending_chars=rendering_config['max_pending_chars'], clock=time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending_chars = max_pending_chars
+        self.clock = clock
+        self.renders = 0
+        self._text = None
+        self._rendered = None
+        self._pending_chars = 0
+        self._rendered_at = -math.inf
+
+    def write(self, text, added_chars=0):
+        self._text = text
+        self._pending_chars += added_chars
+        if self._pending_chars >= self.max_pending_chars:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        if self._text != self._rendered and self.clock() - self._rendered_at >= self.interval:
+            self.flush()
+
+    def flush(self, text=None):
+        if text is not None:
+            self._text = text
+        if self._text is None or self._text == self._rendered:
+            return
+        self.placeholder.markdown(self._text)
+        self.renders += 1
+        self._rendered = self._text
+        self._pending_chars = 0
+        self._rendered_at = self.clock()
+
+
+class StreamRenderer:
+    """Renders an agent stream of `["messages", "custom"]` chunks into two placeholders.
+
+    Tokens from the `model` node are appended to the answer; tokens from any
+    other node (tool results, the summarizer) are skipped. Custom status
+    updates replace one another, so a burst of them renders only the latest.
+    Both placeholders are throttled, and `close` renders the final answer
+    without the cursor.
+    """
+
+    def __init__(self, status_placeholder, answer_placeholder, interval=rendering_config['interval'],
+                 max_pending_chars=rendering_config['max_pending_chars'], cursor=rendering_config['cursor'],
+                 clock=time.monotonic):
+        self.status = ThrottledPlaceholder(status_placeholder, interval, max_pending_chars, clock)
+        self.answer = ThrottledPlaceholder(answer_placeholder, interval, max_pending_chars, clock)
+        self.cursor = cursor
+        self.response = ""
+        self.updates = []
+
+    def handle(self, stream_mode, chunk):
+        """Takes one stream item and returns the answer text it added ('' for anything else)."""
+        text = ""
+        if stream_mode == "custom":
+            self.updates.append(chunk)
+            self.status.write(f"*{chunk}*")
+        elif stream_mode == "messages":
+            token, metadata = chunk
+            if metadata.get('langgraph_node') == "model" and isinstance(token.content, str) and token.content:
+                text = token.content
+                self.response += text
+                self.answer.write(self.response + self.cursor, len(text))
+        self.status.flush_if_due()
+        return text
+
+    def close(self):
+        self.status.flush()
+        self.answer.flush(self.response)
+        return self.response
+
+    @property
+    def renders(self):
+        return self.status.renders + self.answer.renders
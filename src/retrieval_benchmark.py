@@ -0,0 +1,205 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import numpy as np
+
+from src.helpers import load_config
+from src.lexical import tokenize
+
+config = load_config()
+
+search_type = config['retrieval']['search_type']
+benchmark_config = config['retrieval_benchmark']
+ground_truths_pattern = os.path.join(config['paths']['ground_truths'], '*.json')
+
+STAGES = ('rewrite', 'retrieve', 'rerank', 'total')
+
+
+def load_questions(pattern=ground_truths_pattern):
+    questions = []
+    for file_name in sorted(glob(pattern)):
+        with open(file_name, 'r') as f:
+            questions.extend(json.load(f))
+    return questions
+
+
+def is_relevant(doc, question, match='book', min_overlap=0.5):
+    """Whether a retrieved doc counts as relevant to a ground-truth question.
+
+    'book': the doc comes from the question's `source` book.
+    'answer': it comes from that book and contains at least `min_overlap` of
+    the reference answer's terms.
+    """
+    if doc.metadata.get('book_name') != question['source']:
+        return False
+    if match == 'book':
+        return True
+    answer_terms = set(tokenize(question['answer']))
+    if not answer_terms:
+        return False
+    return len(answer_terms & set(tokenize(doc.page_content))) / len(answer_terms) >= min_overlap
+
+
+def rank_metrics(relevance, ks):
+    """Hit rate, recall, MRR and nDCG at each k from one ranked list of relevance flags.
+
+    The relevant set is pooled from the full (max-k) list, so recall@k is the
+    share of the relevant docs found at max k that are already in the top k.
+    """
+    pooled = sum(relevance)
+    first = next((rank for rank, relevant in enumerate(relevance, start=1) if relevant), None)
+    metrics = {}
+    for k in ks:
+        top = relevance[:k]
+        found = sum(top)
+        dcg = sum(1.0 / math.log2(rank + 1) for rank, relevant in enumerate(top, start=1) if relevant)
+        idcg = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(pooled, k) + 1))
+        metrics[k] = {
+            'hit_rate': float(found > 0),
+            'recall': found / pooled if pooled else 0.0,
+            'mrr': 1.0 / first if first is not None and first <= k else 0.0,
+            'ndcg': dcg / idcg if idcg else 0.0,
+        }
+    return metrics
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+class RetrievalBenchmark:
+    """Runs only the retrieval side of the pipeline over the ground-truth questions.
+
+    Each question is retrieved once at the largest k (optionally after a query
+    rewrite and before a rerank), and every smaller k is scored by slicing that
+    list. Latency is recorded per stage.
+    """
+
+    def __init__(self, retriever, ks, rewrite=None, reranker=None, match='book', min_overlap=0.5):
+        self.retriever = retriever
+        self.ks = sorted(set(ks))
+        self.rewrite = rewrite
+        self.reranker = reranker
+        self.match = match
+        self.min_overlap = min_overlap
+
+    def run_one(self, question):
+        timings = {}
+        start = time.perf_counter()
+        query = question['question']
+        if self.rewrite is not None:
+            query = self.rewrite(query)
+            timings['rewrite'] = time.perf_counter() - start
+
+        stage_start = time.perf_counter()
+        docs = self.retriever.invoke(query)
+        timings['retrieve'] = time.perf_counter() - stage_start
+
+        if self.reranker is not None:
+            stage_start = time.perf_counter()
+            docs = list(self.reranker.compress_documents(docs, question['question']))
+            timings['rerank'] = time.perf_counter() - stage_start
+        timings['total'] = time.perf_counter() - start
+
+        relevance = [is_relevant(doc, question, self.match, self.min_overlap) for doc in docs[:self.ks[-1]]]
+        return rank_metrics(relevance, self.ks), timings
+
+    def run(self, questions, workers=1):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(self.run_one, questions))
+
+        metrics = {}
+        for k in self.ks:
+            per_question = [result[k] for result, _ in results]
+            metrics[k] = {name: float(np.mean([row[name] for row in per_question])) for name in per_question[0]}
+
+        latency = {}
+        for stage in STAGES:
+            values = [timings[stage] for _, timings in results if stage in timings]
+            if values:
+                latency[stage] = percentiles(values)
+
+        return {
+            'questions': len(questions),
+            'match': self.match,
+            'metrics': {str(k): values for k, values in metrics.items()},
+            'latency': latency,
+        }
+
+
+def print_table(report):
+    print(f"\n{report['questions']} questions, relevance by {report['match']}")
+    print(f"{'k':>4} {'hit rate':>9} {'recall':>8} {'MRR':>7} {'nDCG':>7}")
+    for k, row in report['metrics'].items():
+        print(f"{k:>4} {row['hit_rate']:>9.3f} {row['recall']:>8.3f} {row['mrr']:>7.3f} {row['ndcg']:>7.3f}")
+
+    print(f"\n{'stage':<10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for stage, row in report['latency'].items():
+        print(f"{stage:<10} {row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}")
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    from src.clients import get_embeddings, get_reranker, get_vector_store
+    from src.retriever import build_retriever
+
+    parser = argparse.ArgumentParser(description="Retrieval-only benchmark against ground_truths/.")
+    parser.add_argument('--k', type=int, nargs='+', default=benchmark_config['ks'], help="k values to score.")
+    parser.add_argument('--search-type', choices=['similarity', 'mmr', 'hybrid'], default=search_type)
+    parser.add_argument('--rewrite', action='store_true', help="Rewrite each query with the LLM first.")
+    parser.add_argument('--rerank', action='store_true', help="Rerank the candidates with Cohere.")
+    parser.add_argument('--candidates', type=int, default=None,
+                        help="Docs retrieved before reranking (default: the largest k).")
+    parser.add_argument('--match', choices=['book', 'answer'], default=benchmark_config['match'])
+    parser.add_argument('--min-overlap', type=float, default=benchmark_config['min_overlap'])
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the retrieval caches.")
+    parser.add_argument('--workers', type=int, default=1, help="Questions in flight (1 gives clean latencies).")
+    parser.add_argument('--output', default=benchmark_config['output'])
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    max_k = max(args.k)
+    candidates = max(args.candidates or max_k, max_k)
+    retriever = build_retriever(get_vector_store(get_embeddings()), search_type=args.search_type,
+                                k=candidates, use_cache=not args.no_cache)
+
+    rewrite = None
+    if args.rewrite:
+        from src.agent import rewrite_query
+        rewrite = rewrite_query
+
+    benchmark = RetrievalBenchmark(
+        retriever,
+        args.k,
+        rewrite=rewrite,
+        reranker=get_reranker(max_k) if args.rerank else None,
+        match=args.match,
+        min_overlap=args.min_overlap,
+    )
+    report = benchmark.run(load_questions(), workers=args.workers)
+    report['config'] = {
+        'search_type': args.search_type,
+        'rewrite': args.rewrite,
+        'rerank': args.rerank,
+        'candidates': candidates,
+        'cache': not args.no_cache,
+    }
+    print_table(report)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
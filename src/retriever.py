@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import PrivateAttr
+
+from src import tracing
+from src.cache import LRUCache, get_index_version, normalize_text
+from src.chunk_store import get_chunk_store, get_chunk_store_path
+from src.helpers import load_config
+from src.lexical import BM25Index, get_index_path
+
+config = load_config()
+
+embedding_model_name = config['embeddings']['name']
+dimensions = config['embeddings']['dimensions']
+retrieval_cache_config = config['cache']['retrieval']
+backend = config['vector_store']['backend']
+search_type = config['retrieval']['search_type']
+k = config['retrieval']['k']
+hybrid_config = config['retrieval']['hybrid']
+
+logger = logging.getLogger(__name__)
+
+
+def get_retrieval_caches():
+    """Builds the (query -> embedding, embedding -> results) cache pair from config."""
+    if not retrieval_cache_config['enabled']:
+        return None, None
+
+    def build(namespace):
+        return LRUCache(
+            namespace=namespace,
+            max_entries=retrieval_cache_config['max_entries'],
+            max_bytes=retrieval_cache_config['max_bytes'],
+            ttl=retrieval_cache_config['ttl'],
+            sqlite_path=retrieval_cache_config['sqlite_path'],
+        )
+
+    return build('query_embedding'), build('retrieval_results')
+
+
+def clear_retrieval_cache():
+    """Drops the on-disk retrieval results, called after the index is rebuilt."""
+    _, result_cache = get_retrieval_caches()
+    if result_cache is not None:
+        result_cache.clear()
+
+
+class CachedRetriever(BaseRetriever):
+    """Vector store retriever with a two-level cache in front of it.
+
+    Level one maps the query text (exact or normalized) to its embedding, which
+    skips the embedding call. Level two maps the embedding to the top-k results,
+    which skips the vector store query. Level-two keys carry the index version,
+    so results are invalidated whenever the index is rebuilt.
+    """
+
+    vector_store: VectorStore
+    search_type: str = 'similarity'
+    search_kwargs: dict = {}
+    key_mode: str = 'normalized'
+    embedding_cache: Optional[Any] = None
+    result_cache: Optional[Any] = None
+
+    def _query_key(self, query):
+        text = normalize_text(query) if self.key_mode == 'normalized' else query
+        return f"{embedding_model_name}:{dimensions}:{text}"
+
+    def _result_key(self, embedding):
+        digest = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        params = ",".join(f"{key}={value}" for key, value in sorted(self.search_kwargs.items()))
+        return f"{get_index_version()}:{self.search_type}:{params}:{digest}"
+
+    def embed_query(self, query):
+        if self.embedding_cache is None:
+            with tracing.span('retrieve.embed'):
+                return self.vector_store.embeddings.embed_query(query)
+
+        key = self._query_key(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            with tracing.span('retrieve.embed'):
+                embedding = self.vector_store.embeddings.embed_query(query)
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    def search_by_vector(self, embedding):
+        with tracing.span('retrieve.search', search_type=self.search_type):
+            if self.search_type == 'mmr':
+                return self.vector_store.max_marginal_relevance_search_by_vector(embedding, **self.search_kwargs)
+            results = self.vector_store.similarity_search_by_vector_with_score(embedding, **self.search_kwargs)
+
+        # Keep the similarity score on each doc, so callers can gate on it
+        docs = []
+        for doc, score in results:
+            doc.metadata = {**doc.metadata, 'score': float(score)}
+            docs.append(doc)
+        return docs
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        embedding = self.embed_query(query)
+        if self.result_cache is None:
+            return self.search_by_vector(embedding)
+
+        key = self._result_key(embedding)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return [Document(id=doc_id, page_content=text, metadata=metadata) for doc_id, text, metadata in cached]
+
+        docs = self.search_by_vector(embedding)
+        self.result_cache.set(key, [(doc.id, doc.page_content, doc.metadata) for doc in docs])
+        return docs
+
+    def cache_stats(self):
+        return [cache.stats() for cache in (self.embedding_cache, self.result_cache) if cache is not None]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses dense results with in-process BM25 results by reciprocal rank fusion.
+
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    Lexical-only hits are resolved to Documents from the chunk store. The BM25
+    index is reloaded when a re-index rewrites it.
+    """
+
+    dense: BaseRetriever
+    chunk_store: Any
+    lexical_path: str
+    k: int = 10
+    lexical_k: int = 10
+    rrf_k: int = 60
+
+    _lexical: Optional[Any] = PrivateAttr(default=None)
+    _lexical_mtime: Optional[int] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_lexical(self):
+        try:
+            mtime = os.stat(os.path.join(self.lexical_path, 'vocab.json')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._lexical_mtime:
+                self._lexical = BM25Index.load(self.lexical_path)
+                self._lexical_mtime = mtime
+            return self._lexical
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        dense_docs = self.dense.invoke(query, config={"callbacks": run_manager.get_child()})
+        with tracing.span('retrieve.lexical'):
+            lexical = self._get_lexical()
+            lexical_hits = lexical.search(query, self.lexical_k) if lexical is not None else []
+
+        fused = {}
+        docs = {}
+        for rank, doc in enumerate(dense_docs):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            docs[doc.id] = doc
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        missing = [chunk_id for chunk_id, _ in lexical_hits if chunk_id not in docs]
+        docs.update((doc.id, doc) for doc in self.chunk_store.get_by_ids(missing))
+
+        ranked = sorted((doc_id for doc_id in fused if doc_id in docs), key=lambda doc_id: -fused[doc_id])
+        results = []
+        for doc_id in ranked[:self.k]:
+            doc = docs[doc_id]
+            doc.metadata = {**doc.metadata, 'rrf_score': fused[doc_id]}
+            results.append(doc)
+        return results
+
+    def cache_stats(self):
+        return self.dense.cache_stats()
+
+
+def get_missing_hybrid_artifacts(backend=backend):
+    """Paths of the hybrid retrieval artifacts (BM25 index, chunk store) that have not been built."""
+    lexical_path = get_index_path(backend)
+    chunk_path = get_chunk_store_path(backend)
+    missing = []
+    if not os.path.exists(os.path.join(lexical_path, 'vocab.json')):
+        missing.append(lexical_path)
+    if not os.path.exists(chunk_path):
+        missing.append(chunk_path)
+    return missing
+
+
+def check_hybrid_artifacts(backend=backend, require=hybrid_config['require_artifacts']):
+    """Fails (or, with `require=False`, warns) when hybrid retrieval would run without its lexical side.
+
+    The BM25 index and chunk store are written by `python -m src.data_indexing`
+    and are not part of the Docker image; without them every query silently
+    falls back to dense-only results.
+    """
+    missing = get_missing_hybrid_artifacts(backend)
+    if not missing:
+        return
+    message = (f"Hybrid retrieval needs {', '.join(missing)}; build them with `python -m src.data_indexing` "
+               f"and ship them with the app")
+    if require:
+        raise FileNotFoundError(message)
+    logger.warning(f"{message}. Serving dense-only results until they exist.")
+
+
+def build_retriever(vector_store, search_type=search_type, k=k, use_cache=True):
+    """Retriever for `retrieval.search_type`: 'similarity', 'mmr' or 'hybrid' (dense + BM25).
+
+    `use_cache=False` skips the retrieval caches, e.g. to measure uncached latency.
+    """
+    embedding_cache, result_cache = get_retrieval_caches() if use_cache else (None, None)
+
+    def dense(dense_search_type, dense_k):
+        return CachedRetriever(
+            vector_store=vector_store,
+            search_type=dense_search_type,
+            search_kwargs={"k": dense_k},
+            key_mode=retrieval_cache_config['key'],
+            embedding_cache=embedding_cache,
+            result_cache=result_cache,
+        )
+
+    if search_type != 'hybrid':
+        return dense(search_type, k)
+
+    check_hybrid_artifacts(backend)
+
+    return HybridRetriever(
+        dense=dense('similarity', hybrid_config['dense_k']),
+        chunk_store=get_chunk_store(backend),
+        lexical_path=get_index_path(backend),
+        k=k,
+        lexical_k=hybrid_config['lexical_k'],
+        rrf_k=hybrid_config['rrf_k'],
+    )
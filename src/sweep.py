@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+from src.helpers import load_config
+
+config = load_config()
+
+data_path = config['paths']['data_path']
+search_type = config['retrieval']['search_type']
+chunk_batch_size = config['indexing']['chunk_batch_size']
+sweep_config = config['sweep']
+hybrid_config = config['retrieval']['hybrid']
+
+logger = logging.getLogger(__name__)
+
+
+def get_pages_key(data_path, files):
+    """Hash of the PDFs' relative paths and contents; parsed pages are reused while it is unchanged."""
+    from src.data_indexing import file_sha256
+
+    digest = hashlib.sha256()
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, data_path).encode('utf-8'))
+        digest.update(file_sha256(file_path).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def load_pages(data_path=data_path, sweep_dir=sweep_config['dir']):
+    """Parsed pages as lists of page batches, parsed once and cached per data set."""
+    from src.data_ingestion import iter_documents, list_pdf_files
+
+    files = list_pdf_files(data_path)
+    pages_key = get_pages_key(data_path, files)
+    cache_path = os.path.join(sweep_dir, f"pages_{pages_key}.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return pages_key, pickle.load(f)
+
+    page_batches = list(iter_documents(data_path, files))
+    os.makedirs(sweep_dir, exist_ok=True)
+    with open(cache_path + '.tmp', 'wb') as f:
+        pickle.dump(page_batches, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_path + '.tmp', cache_path)
+    return pages_key, page_batches
+
+
+def index_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def get_variant_artifact_paths(path):
+    """Chunk store and BM25 index of a variant, used by hybrid retrieval."""
+    return os.path.join(path, 'chunks.db'), os.path.join(path, 'bm25')
+
+
+def get_missing_variant_artifacts(path):
+    chunk_path, lexical_path = get_variant_artifact_paths(path)
+    return [p for p in (chunk_path, os.path.join(lexical_path, 'vocab.json')) if not os.path.exists(p)]
+
+
+def build_variant(page_batches, pages_key, embeddings, chunk_size, chunk_overlap, sweep_dir=sweep_config['dir']):
+    """Local index of the pages chunked with (chunk_size, chunk_overlap), reused when already built.
+
+    Chunks already embedded by any earlier variant or indexing run come from
+    the embedding cache, so only new chunk texts are sent to the API. Each
+    variant also gets its own chunk store and BM25 index for hybrid retrieval.
+    """
+    from src.chunk_store import ChunkStore
+    from src.data_chunking import iter_chunks
+    from src.lexical import BM25Index
+    from src.local_store import LocalVectorStore
+
+    path = os.path.join(sweep_dir, f"index_cs{chunk_size}_ov{chunk_overlap}")
+    marker_path = os.path.join(path, 'variant.json')
+    marker = {'pages_key': pages_key, 'model': embeddings.model, 'dimensions': embeddings.dimensions, 'lexical': True}
+
+    store = LocalVectorStore(embedding=embeddings, path=path, index_type='exact')
+    if os.path.exists(marker_path):
+        with open(marker_path, 'r') as f:
+            if json.load(f) == marker:
+                return store
+
+    store.reset()
+    chunk_path, lexical_path = get_variant_artifact_paths(path)
+    chunk_store = ChunkStore(chunk_path)
+    chunk_store.clear()
+    for chunks in iter_chunks(page_batches, batch_size=chunk_batch_size, chunk_size=chunk_size,
+                              chunk_overlap=chunk_overlap):
+        texts = [chunk.page_content for chunk in chunks]
+        store.add_embeddings(texts, embeddings.embed_documents(texts), [chunk.metadata for chunk in chunks],
+                             [chunk.id for chunk in chunks])
+        chunk_store.add_documents(chunks)
+    BM25Index.build(chunk_store.iter_texts()).save(lexical_path)
+    with open(marker_path, 'w') as f:
+        json.dump(marker, f)
+    return store
+
+
+def build_variant_retriever(store, search_type, k):
+    """Retriever over one variant; hybrid fuses its dense results with the variant's own BM25 index."""
+    from src.chunk_store import ChunkStore
+    from src.retriever import HybridRetriever, build_retriever
+
+    if search_type != 'hybrid':
+        return build_retriever(store, search_type=search_type, k=k, use_cache=False)
+
+    chunk_path, lexical_path = get_variant_artifact_paths(store.path)
+    return HybridRetriever(
+        dense=build_retriever(store, search_type='similarity', k=hybrid_config['dense_k'], use_cache=False),
+        chunk_store=ChunkStore(chunk_path),
+        lexical_path=lexical_path,
+        k=k,
+        lexical_k=hybrid_config['lexical_k'],
+        rrf_k=hybrid_config['rrf_k'],
+    )
+
+
+def run_variant(page_batches, pages_key, embeddings, questions, chunk_size, chunk_overlap, ks, search_type):
+    """Builds (or reuses) one variant and scores it at every k from a single max-k retrieval.
+
+    A hybrid variant without its BM25 index or chunk store is skipped with a
+    warning rather than scored as dense-only under the hybrid label.
+    """
+    from src.retrieval_benchmark import RetrievalBenchmark
+
+    store = build_variant(page_batches, pages_key, embeddings, chunk_size, chunk_overlap)
+    if search_type == 'hybrid':
+        missing = get_missing_variant_artifacts(store.path)
+        if missing:
+            logger.warning(f"Skipping hybrid variant chunk_size={chunk_size}, chunk_overlap={chunk_overlap}: "
+                           f"missing {', '.join(missing)}")
+            return []
+
+    retriever = build_variant_retriever(store, search_type, max(ks))
+    report = RetrievalBenchmark(retriever, ks).run(questions)
+
+    rows = []
+    for k, metrics in report['metrics'].items():
+        rows.append({
+            'search_type': search_type,
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'k': int(k),
+            **metrics,
+            'chunks': store.count - len(store.deleted),
+            'index_mb': index_size(store.path) / 1e6,
+            'retrieve_p50_ms': report['latency']['retrieve']['p50'] * 1000,
+            'retrieve_p95_ms': report['latency']['retrieve']['p95'] * 1000,
+        })
+    return rows
+
+
+def print_leaderboard(rows):
+    print(f"{'size':>6} {'overlap':>8} {'k':>4} {'hit':>6} {'recall':>7} {'MRR':>6} {'nDCG':>6} "
+          f"{'chunks':>8} {'MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['chunk_size']:>6} {row['chunk_overlap']:>8} {row['k']:>4} {row['hit_rate']:>6.3f} "
+              f"{row['recall']:>7.3f} {row['mrr']:>6.3f} {row['ndcg']:>6.3f} {row['chunks']:>8} "
+              f"{row['index_mb']:>8.1f} {row['retrieve_p50_ms']:>8.1f} {row['retrieve_p95_ms']:>8.1f}")
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    from src.clients import get_cached_embeddings
+    from src.retrieval_benchmark import load_questions
+
+    parser = argparse.ArgumentParser(description="Sweep chunk_size / chunk_overlap / k on local indexes.")
+    parser.add_argument('--chunk-size', type=int, nargs='+', default=sweep_config['chunk_sizes'])
+    parser.add_argument('--chunk-overlap', type=int, nargs='+', default=sweep_config['chunk_overlaps'])
+    parser.add_argument('--k', type=int, nargs='+', default=sweep_config['ks'])
+    parser.add_argument('--search-type', choices=['similarity', 'mmr', 'hybrid'], default=search_type)
+    parser.add_argument('--workers', type=int, default=sweep_config['workers'], help="Variants built and scored at once.")
+    parser.add_argument('--sort', choices=['ndcg', 'mrr', 'recall', 'hit_rate'], default='ndcg')
+    parser.add_argument('--output', default=sweep_config['output'])
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    grid = [(size, overlap) for size, overlap in itertools.product(args.chunk_size, args.chunk_overlap)
+            if overlap < size]
+    pages_key, page_batches = load_pages()
+    embeddings = get_cached_embeddings()
+    questions = load_questions()
+    print(f"Sweeping {len(grid)} chunk variants x k={args.k} over {sum(map(len, page_batches))} pages")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(run_variant, page_batches, pages_key, embeddings, questions, size, overlap, args.k,
+                            args.search_type)
+            for size, overlap in grid
+        ]
+        results = [future.result() for future in futures]
+    rows = [row for result in results for row in result]
+    skipped = sum(1 for result in results if not result)
+
+    rows.sort(key=lambda row: (-row[args.sort], row['index_mb'], row['retrieve_p50_ms']))
+    print_leaderboard(rows)
+    if skipped:
+        print(f"\nSkipped {skipped} of {len(grid)} variants; see the warnings above")
+    print(f"\nEmbedding cache: {embeddings.hits} hits, {embeddings.misses} API embeddings")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'search_type': args.search_type, 'pages_key': pages_key, 'leaderboard': rows}, f, indent=2)
+    print(f"Leaderboard saved to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from src.helpers import load_config
+
+config = load_config()
+
+tracing_config = config['tracing']
+
+logger = logging.getLogger('medbot.tracing')
+
+_trace_id = contextvars.ContextVar('medbot_trace_id', default=None)
+_parent = contextvars.ContextVar('medbot_span_parent', default=None)
+
+
+class Histogram:
+    """Latency samples for one stage: exact count and sum, plus a window of recent samples for percentiles."""
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        summary = {'count': self.count, 'sum': self.total}
+        for name, q in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            # Nearest-rank percentile over the recent samples
+            summary[name] = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+        return summary
+
+
+class Registry:
+    """In-process histograms keyed by stage name, plus counters for non-latency totals."""
+
+    def __init__(self, max_samples=tracing_config['max_samples']):
+        self.max_samples = max_samples
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.max_samples)
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+    def counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def render_text(self):
+        """Prometheus text exposition of every stage's count, sum and quantiles, in seconds."""
+        lines = [
+            "# HELP medbot_stage_seconds Latency of each pipeline stage.",
+            "# TYPE medbot_stage_seconds summary",
+        ]
+        for name, summary in self.snapshot().items():
+            for quantile in ('p50', 'p95', 'p99'):
+                lines.append(f'medbot_stage_seconds{{stage="{name}",quantile="0.{quantile[1:]}"}} {summary[quantile]:.6f}')
+            lines.append(f'medbot_stage_seconds_sum{{stage="{name}"}} {summary["sum"]:.6f}')
+            lines.append(f'medbot_stage_seconds_count{{stage="{name}"}} {summary["count"]}')
+        lines += [
+            "# HELP medbot_events_total Running totals such as summaries made or tokens saved.",
+            "# TYPE medbot_events_total counter",
+        ]
+        for name, value in self.counters().items():
+            lines.append(f'medbot_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def is_enabled():
+    return tracing_config['enabled']
+
+
+def observe(name, seconds, **attributes):
+    """Records one measurement of a stage as a histogram sample and a structured log record."""
+    if not tracing_config['enabled']:
+        return
+    registry.observe(name, seconds)
+    if tracing_config['log_spans']:
+        record = {'span': name, 'duration_ms': round(seconds * 1000, 3), 'trace_id': _trace_id.get(),
+                  'parent': _parent.get(), **attributes}
+        logger.info(json.dumps(record, default=str))
+
+
+def increment(name, value=1):
+    """Adds `value` to the counter `name` (exported as medbot_events_total)."""
+    if tracing_config['enabled']:
+        registry.increment(name, value)
+
+
+@contextlib.contextmanager
+def _span(name, attributes):
+    token = _parent.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _parent.reset(token)
+        observe(name, time.perf_counter() - start, **attributes)
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def span(name, **attributes):
+    """Times the enclosed block as stage `name`; a shared no-op when tracing is off."""
+    if not tracing_config['enabled']:
+        return _NOOP
+    return _span(name, attributes)
+
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """Groups the spans of one request under a trace id."""
+    token = _trace_id.set(trace_id or uuid.uuid4().hex)
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+def get_callbacks():
+    """Callback handlers to put in a run config: time-to-first-token per model call when tracing is on."""
+    if not tracing_config['enabled']:
+        return []
+    return [_get_ttft_handler()]
+
+
+_ttft_handler = None
+
+
+def _get_ttft_handler():
+    global _ttft_handler
+    if _ttft_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TimeToFirstTokenHandler(BaseCallbackHandler):
+            """Observes `<node>.ttft` when a streamed chat model call yields its first token."""
+
+            def __init__(self):
+                self._started = {}
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+                node = (metadata or {}).get('langgraph_node', 'chat_model')
+                self._started[run_id] = (time.perf_counter(), node)
+
+            def on_llm_new_token(self, token, *, run_id, **kwargs):
+                started = self._started.pop(run_id, None)
+                if started is not None:
+                    observe(f"{started[1]}.ttft", time.perf_counter() - started[0])
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                self._started.pop(run_id, None)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._started.pop(run_id, None)
+
+        _ttft_handler = TimeToFirstTokenHandler()
+    return _ttft_handler
+
+
+# ============= METRICS ENDPOINT =============
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host=tracing_config['endpoint']['host'], port=tracing_config['endpoint']['port']):
+    """Serves `registry.render_text()` at /metrics from a daemon thread; started at most once per process."""
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
+
+
+def start_from_config():
+    """Starts the metrics endpoint if tracing and `tracing.endpoint.enabled` are on."""
+    if tracing_config['enabled'] and tracing_config['endpoint']['enabled']:
+        start_metrics_server()
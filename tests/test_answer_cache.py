@@ -0,0 +1,129 @@
+import pytest
+from langchain.agents import create_agent
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src import agent as agent_module
+from src.answer_cache import AnswerCache, load_faq, replay_chunks
+
+
+@pytest.fixture
+def answer_cache(tmp_path):
+    return AnswerCache(sqlite_path=str(tmp_path / 'answers.db'), model_name='test-model')
+
+
+def test_lookup_ignores_case_and_whitespace(answer_cache):
+    answer_cache.set("What is asthma?", "A lung disease.", ["book.pdf (Page: 3)"])
+
+    cached = answer_cache.get("  what is ASTHMA? ")
+    assert (cached.answer, cached.citations) == ("A lung disease.", ["book.pdf (Page: 3)"])
+    assert answer_cache.get("What is diabetes?") is None
+
+
+def test_keys_depend_on_model_and_index_version(answer_cache, tmp_path, monkeypatch):
+    other_model = AnswerCache(sqlite_path=str(tmp_path / 'answers.db'), model_name='other-model')
+    answer_cache.set("What is asthma?", "A lung disease.", [])
+    assert other_model.get("What is asthma?") is None
+
+    monkeypatch.setattr('src.answer_cache.get_index_version', lambda: 'rebuilt')
+    assert answer_cache.get("What is asthma?") is None
+
+
+def test_entries_persist_in_sqlite(answer_cache, tmp_path):
+    answer_cache.set("What is asthma?", "A lung disease.", [])
+    reopened = AnswerCache(sqlite_path=str(tmp_path / 'answers.db'), model_name='test-model')
+    assert reopened.get("What is asthma?").answer == "A lung disease."
+
+
+def test_replay_chunks_rebuild_the_answer_at_word_boundaries():
+    text = "Hypertension is persistently raised arterial blood pressure."
+    pieces = replay_chunks(text, size=10)
+
+    assert "".join(pieces) == text
+    assert all(piece.endswith(" ") for piece in pieces[:-1])
+
+
+def test_load_faq_reads_json_and_text(tmp_path):
+    (tmp_path / 'faq.json').write_text('["What is asthma?", {"question": "What is gout?"}]')
+    (tmp_path / 'faq.txt').write_text("# comment\nWhat is acne?\n\n")
+
+    assert load_faq(str(tmp_path / 'faq.json')) == ["What is asthma?", "What is gout?"]
+    assert load_faq(str(tmp_path / 'faq.txt')) == ["What is acne?"]
+
+
+# ============= stream_response =============
+
+class ScriptedModel(BaseChatModel):
+    """Says something, calls retrieve_context, then answers; counts its calls."""
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if messages[-1].type == 'human':
+            message = AIMessage("Let me look that up.",
+                                tool_calls=[{'name': 'retrieve_context', 'args': {'query': 'q'}, 'id': f"call{self.calls}"}])
+        else:
+            message = AIMessage("Asthma is a chronic lung disease.")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    @property
+    def _llm_type(self):
+        return 'scripted'
+
+
+@tool(response_format='content_and_artifact')
+def retrieve_context(query: str):
+    """Retrieves context."""
+    return "Asthma narrows the airways.", [Document("Asthma narrows the airways.",
+                                                    metadata={'book_name': 'book.pdf', 'page': 3})]
+
+
+@pytest.fixture
+def scripted_agent(answer_cache, monkeypatch):
+    monkeypatch.setattr(agent_module, 'get_answer_cache', lambda: answer_cache)
+    model = ScriptedModel()
+    return model, create_agent(model, [retrieve_context], checkpointer=InMemorySaver())
+
+
+def stream(agent, question, thread_id):
+    return list(agent_module.stream_response(agent, question, {'configurable': {'thread_id': thread_id}}))
+
+
+def test_first_turn_caches_only_the_final_answer(scripted_agent, answer_cache):
+    model, agent = scripted_agent
+    stream(agent, "What is asthma?", 'a')
+
+    cached = answer_cache.get("What is asthma?")
+    assert cached.answer == "Asthma is a chronic lung disease."
+    assert cached.citations == ["book.pdf (Page: 3)"]
+
+
+def test_cache_hit_replays_without_calling_the_model(scripted_agent):
+    model, agent = scripted_agent
+    stream(agent, "What is asthma?", 'a')
+    calls = model.calls
+
+    chunks = stream(agent, "what is asthma", 'b')
+    assert model.calls == calls
+    assert ("custom", "Source: book.pdf (Page: 3)") in chunks
+    replayed = "".join(token.content for mode, (token, *_) in chunks if mode == "messages")
+    assert replayed == "Asthma is a chronic lung disease."
+
+    # The replayed turn is in the thread, so the conversation can go on
+    messages = agent.get_state({'configurable': {'thread_id': 'b'}}).values['messages']
+    assert [message.content for message in messages] == ["what is asthma", "Asthma is a chronic lung disease."]
+
+
+def test_later_turns_bypass_the_cache(scripted_agent, answer_cache):
+    model, agent = scripted_agent
+    stream(agent, "What is gout?", 'a')
+    stream(agent, "What is asthma?", 'a')
+
+    assert answer_cache.get("What is asthma?") is None
@@ -0,0 +1,100 @@
+import pytest
+
+from src import cache as cache_module
+from src.cache import LRUCache, bump_index_version, get_index_version, normalize_text
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def test_get_returns_stored_value_and_counts_hits_and_misses():
+    cache = LRUCache('test')
+    cache.set('a', {'value': [1, 2]})
+
+    assert cache.get('a') == {'value': [1, 2]}
+    assert cache.get('b', 'default') == 'default'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_evicts_least_recently_used_entry():
+    cache = LRUCache('test', max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache('test', ttl=10)
+    cache.set('a', 1)
+
+    clock[0] += 10
+    assert cache.get('a') == 1
+    clock[0] += 1
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_byte_bound_evicts_until_under_limit():
+    cache = LRUCache('test', max_entries=100, max_bytes=2500)
+    for key in 'abc':
+        cache.set(key, 'x' * 1000)
+
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['bytes'] <= 2500
+    assert cache.get('a') is None
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    LRUCache('test', sqlite_path=path).set('a', [1, 2, 3])
+
+    cache = LRUCache('test', sqlite_path=path)
+    assert cache.get('a') == [1, 2, 3]
+    assert cache.get('a') == [1, 2, 3]
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['hits']) == (1, 1)
+
+
+def test_sqlite_tier_is_split_by_namespace_and_cleared_per_namespace(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = LRUCache('first', sqlite_path=path)
+    second = LRUCache('second', sqlite_path=path)
+    first.set('a', 1)
+    second.set('a', 2)
+
+    first.clear()
+    assert LRUCache('first', sqlite_path=path).get('a') is None
+    assert LRUCache('second', sqlite_path=path).get('a') == 2
+
+
+def test_expired_disk_entries_are_dropped(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    LRUCache('test', ttl=10, sqlite_path=path).set('a', 1)
+
+    clock[0] += 11
+    assert LRUCache('test', ttl=10, sqlite_path=path).get('a') is None
+
+
+def test_index_version_changes_on_bump(tmp_path):
+    path = str(tmp_path / 'index_version')
+    assert get_index_version(path) == 'unversioned'
+
+    version = bump_index_version(path)
+    assert get_index_version(path) == version
+    assert bump_index_version(path) != version
+
+
+def test_normalize_text_ignores_case_whitespace_and_punctuation():
+    assert normalize_text("  What is  Diabetes? ") == normalize_text("what is diabetes")
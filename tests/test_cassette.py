@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.cassette import (Cassette, CassetteChatModel, CassetteEmbeddings, CassetteMiss, CassetteReranker,
+                          CassetteVectorStore)
+from src.local_store import LocalVectorStore
+
+GRADE_SCHEMA = {'title': 'Grade', 'type': 'object', 'properties': {'binary_score': {'type': 'string'}}}
+
+
+class FakeChatModel(BaseChatModel):
+    """Echoes the last message; with a `response_format`, answers in JSON like a json_schema request."""
+
+    fail: bool = False
+    calls: list = []
+
+    @property
+    def _llm_type(self):
+        return 'fake'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.fail:
+            raise RuntimeError("the API was called during replay")
+        self.calls.append(kwargs)
+        content = json.dumps({'binary_score': 'yes'}) if 'response_format' in kwargs else f"echo: {messages[-1].content}"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content))])
+
+    def with_structured_output(self, schema, **kwargs):
+        # Like ChatOpenAI's default json_schema method, not function calling
+        return self.bind(response_format=schema) | JsonOutputParser()
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.inner = DeterministicFakeEmbedding(size=8)
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("the API was called during replay")
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class ReversingReranker(BaseDocumentCompressor):
+    def compress_documents(self, documents, query, callbacks=None):
+        return list(reversed(documents))
+
+
+def unavailable():
+    raise RuntimeError("the wrapped client was built during replay")
+
+
+@pytest.fixture
+def cassettes(tmp_path):
+    path = str(tmp_path / 'cassette.db')
+    return lambda mode: Cassette(mode=mode, path=path, replay_latency=0)
+
+
+def test_chat_responses_round_trip(cassettes):
+    recorder = CassetteChatModel(model=FakeChatModel(calls=[]), cassette=cassettes('record'))
+    assert recorder.invoke("hello").content == "echo: hello"
+    assert "".join(chunk.content for chunk in recorder.stream("stream me")) == "echo: stream me"
+
+    replay = cassettes('replay')
+    player = CassetteChatModel(model=FakeChatModel(fail=True), cassette=replay)
+    assert player.invoke("hello").content == "echo: hello"
+    assert "".join(chunk.content for chunk in player.stream("stream me")) == "echo: stream me"
+    assert replay.stats['replayed'] == 2
+    with pytest.raises(CassetteMiss):
+        player.invoke("never recorded")
+
+
+def test_structured_output_uses_the_wrapped_models_method_and_is_recorded(cassettes):
+    wrapped = FakeChatModel(calls=[])
+    recorder = CassetteChatModel(model=wrapped, cassette=cassettes('record'))
+    assert recorder.with_structured_output(GRADE_SCHEMA).invoke("Is it relevant?") == {'binary_score': 'yes'}
+    assert wrapped.calls == [{'response_format': GRADE_SCHEMA}]
+
+    player = CassetteChatModel(model=FakeChatModel(fail=True), cassette=cassettes('replay'))
+    assert player.with_structured_output(GRADE_SCHEMA).invoke("Is it relevant?") == {'binary_score': 'yes'}
+
+
+def test_embeddings_round_trip(cassettes):
+    texts = ["heart", "liver"]
+    recorded = CassetteEmbeddings(FakeEmbeddings(), cassettes('record')).embed_documents(texts)
+
+    player = CassetteEmbeddings(FakeEmbeddings(fail=True), cassettes('replay'))
+    assert player.embed_documents(texts) == recorded
+    assert player.embed_query("liver") == recorded[1]
+
+
+def test_vector_store_searches_round_trip(cassettes, tmp_path):
+    embeddings = FakeEmbeddings()
+    store = LocalVectorStore(embeddings, path=str(tmp_path / 'index'), index_type='exact')
+    store.add_texts(["heart", "liver", "kidney"], ids=['a', 'b', 'c'])
+    recorder = CassetteVectorStore(lambda: store, embeddings, 'local', cassettes('record'))
+    recorded = recorder.similarity_search_with_score("liver", k=2)
+
+    player = CassetteVectorStore(unavailable, embeddings, 'local', cassettes('replay'))
+    assert player.similarity_search_with_score("liver", k=2) == recorded
+    assert recorded[0][0].id == 'b'
+
+
+def test_reranker_round_trip(cassettes):
+    docs = [Document(id='a', page_content="heart"), Document(id='b', page_content="liver")]
+    recorded = CassetteReranker(factory=ReversingReranker, name='fake',
+                                cassette=cassettes('record')).compress_documents(docs, "liver")
+
+    player = CassetteReranker(factory=unavailable, name='fake', cassette=cassettes('replay'))
+    assert [doc.id for doc in player.compress_documents(docs, "liver")] == [doc.id for doc in recorded] == ['b', 'a']
@@ -0,0 +1,99 @@
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from src.checkpoint import BoundedSaver
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def build_graph(saver):
+    graph = StateGraph(State)
+    graph.add_node('echo', lambda state: {'messages': [AIMessage(f"echo: {state['messages'][-1].content}")]})
+    graph.add_edge(START, 'echo')
+    graph.add_edge('echo', END)
+    return graph.compile(checkpointer=saver)
+
+
+def run(graph, thread_id, text):
+    config = {'configurable': {'thread_id': thread_id}}
+    return graph.invoke({'messages': [{'role': 'user', 'content': text}]}, config)['messages']
+
+
+def history(graph, thread_id):
+    state = graph.get_state({'configurable': {'thread_id': thread_id}})
+    return [message.content for message in state.values.get('messages', [])]
+
+
+@pytest.fixture
+def make_saver(tmp_path):
+    savers = []
+
+    def make(**kwargs):
+        saver = BoundedSaver(path=str(tmp_path / 'checkpoints.db'), flush_interval=3600, **kwargs)
+        savers.append(saver)
+        return saver
+
+    yield make
+    for saver in savers:
+        saver.close()
+
+
+def test_evicted_thread_is_loaded_back_with_its_history(make_saver):
+    saver = make_saver(max_hot_threads=1, idle_ttl=3600, keep_checkpoints=None)
+    graph = build_graph(saver)
+
+    run(graph, 'a', 'hi')
+    run(graph, 'b', 'hello')
+    assert saver.stats()['hot_threads'] == 1
+    assert saver.evictions >= 1
+
+    run(graph, 'a', 'again')
+    assert history(graph, 'a') == ['hi', 'echo: hi', 'again', 'echo: again']
+    assert saver.loads >= 1
+
+
+def test_threads_survive_a_restart(make_saver):
+    saver = make_saver(max_hot_threads=8, idle_ttl=3600, keep_checkpoints=None)
+    run(build_graph(saver), 'a', 'hi')
+    saver.close()
+
+    assert history(build_graph(make_saver()), 'a') == ['hi', 'echo: hi']
+
+
+def test_idle_threads_are_evicted(make_saver):
+    saver = make_saver(max_hot_threads=8, idle_ttl=0, keep_checkpoints=None)
+    graph = build_graph(saver)
+    run(graph, 'a', 'hi')
+
+    saver.evict_idle()
+    stats = saver.stats()
+    assert (stats['hot_threads'], stats['stored_threads']) == (0, 1)
+    assert history(graph, 'a') == ['hi', 'echo: hi']
+
+
+def test_keeps_only_the_last_checkpoints(make_saver):
+    saver = make_saver(max_hot_threads=8, idle_ttl=3600, keep_checkpoints=2)
+    graph = build_graph(saver)
+    for text in ['one', 'two', 'three']:
+        run(graph, 'a', text)
+
+    assert len(saver.storage['a']['']) == 2
+    assert history(graph, 'a')[-1] == 'echo: three'
+    assert len(history(graph, 'a')) == 6
+
+
+def test_delete_thread_removes_memory_and_disk(make_saver):
+    saver = make_saver(max_hot_threads=8, idle_ttl=3600, keep_checkpoints=None)
+    graph = build_graph(saver)
+    run(graph, 'a', 'hi')
+    saver.flush()
+
+    saver.delete_thread('a')
+    assert saver.stats()['stored_threads'] == 0
+    assert history(graph, 'a') == []
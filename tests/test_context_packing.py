@@ -0,0 +1,74 @@
+from langchain_core.documents import Document
+
+from src.context_packing import ContextPacker, citation, format_passage, jaccard, overlap_length
+from src.data_chunking import make_chunk_id
+
+
+def chunk(text, book='book.pdf', page=1):
+    return Document(page_content=text, metadata={'book_name': book, 'page': page})
+
+
+def packer(max_tokens=1000):
+    return ContextPacker(max_tokens=max_tokens, duplicate_threshold=0.8, min_overlap=5, max_overlap=50)
+
+
+def test_overlap_length_finds_the_longest_suffix_prefix_match():
+    assert overlap_length("the heart pumps blood", "pumps blood around", 5, 50) == len("pumps blood")
+    assert overlap_length("abc", "abd", 1, 50) == 0
+    assert overlap_length("xx the", "the yy", 5, 50) == 0
+
+
+def test_jaccard():
+    assert jaccard({'a', 'b'}, {'b', 'c'}) == 1 / 3
+    assert jaccard(set(), set()) == 1.0
+
+
+def test_near_duplicates_are_dropped_and_their_citation_kept():
+    text = "Aspirin inhibits platelet aggregation and reduces fever and pain in adults"
+    packed = packer().pack([chunk(text), chunk(text + " today", book='other.pdf', page=9)])
+
+    assert len(packed.docs) == 1
+    assert packed.docs[0].metadata['citations'] == ["book.pdf (Page: 1)", "other.pdf (Page: 9)"]
+    assert packed.stats['chunks'] == 2
+
+
+def test_neighbouring_chunks_of_a_page_are_merged_on_their_overlap():
+    first = chunk("Insulin is produced by the pancreas. It lowers blood glucose")
+    second = chunk("lowers blood glucose by moving it into cells.")
+    packed = packer().pack([first, second])
+
+    assert [doc.page_content for doc in packed.docs] == [
+        "Insulin is produced by the pancreas. It lowers blood glucose by moving it into cells."
+    ]
+    assert packed.docs[0].metadata['chunk_ids'] == [make_chunk_id(first), make_chunk_id(second)]
+
+
+def test_passages_keep_rank_order_and_fit_the_budget():
+    docs = [chunk(f"Passage {i} " + "about anatomy " * 30, page=i) for i in range(10)]
+    small = packer(max_tokens=200)
+    packed = small.pack(docs)
+
+    assert 0 < len(packed.docs) < 10
+    assert [doc.metadata['page'] for doc in packed.docs] == list(range(len(packed.docs)))
+    assert packed.tokens <= 200
+    assert small._count(packed.text) <= 200
+    assert packed.stats['unpacked_tokens'] > packed.tokens
+
+
+def test_a_first_passage_over_budget_is_truncated():
+    packed = packer(max_tokens=40).pack([chunk("word " * 500)])
+
+    assert len(packed.docs) == 1
+    assert packed.docs[0].page_content.endswith(" ...")
+    assert packed.tokens <= 40
+
+
+def test_text_cites_every_source():
+    packed = packer().pack([chunk("Asthma narrows the airways", page=3)])
+    assert packed.text == format_passage(packed.docs[0])
+    assert packed.text.startswith(f"Source: {citation(packed.docs[0])}\n")
+
+
+def test_empty_input_packs_nothing():
+    packed = packer().pack([])
+    assert (packed.text, packed.docs, packed.tokens) == ("", [], 0)
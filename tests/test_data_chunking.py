@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+
+from src.data_chunking import assign_chunk_ids, iter_chunks, make_chunk_id
+
+
+def chunk(text, book='book.pdf', page=1):
+    return Document(page_content=text, metadata={'book_name': book, 'page': page})
+
+
+def test_chunk_id_is_deterministic():
+    assert make_chunk_id(chunk("Aspirin")) == make_chunk_id(chunk("Aspirin"))
+    assert len(make_chunk_id(chunk("Aspirin"))) == 32
+
+
+def test_chunk_id_depends_on_book_page_and_text():
+    ids = {
+        make_chunk_id(chunk("Aspirin")),
+        make_chunk_id(chunk("Aspirin", book='other.pdf')),
+        make_chunk_id(chunk("Aspirin", page=2)),
+        make_chunk_id(chunk("Ibuprofen")),
+    }
+    assert len(ids) == 4
+
+
+def test_chunk_id_ignores_other_metadata():
+    tagged = chunk("Aspirin")
+    tagged.metadata['source'] = '/tmp/book.pdf'
+    assert make_chunk_id(tagged) == make_chunk_id(chunk("Aspirin"))
+
+
+def test_assign_chunk_ids_sets_document_ids():
+    chunks = assign_chunk_ids([chunk("a"), chunk("b")])
+    assert [c.id for c in chunks] == [make_chunk_id(chunk("a")), make_chunk_id(chunk("b"))]
+
+
+def test_iter_chunks_yields_bounded_batches_with_stable_ids():
+    pages = [[chunk(f"page {i} " + "word " * 50, page=i) for i in range(5)]]
+
+    batches = list(iter_chunks(pages, batch_size=3, chunk_size=100, chunk_overlap=0))
+    again = list(iter_chunks(pages, batch_size=3, chunk_size=100, chunk_overlap=0))
+
+    assert all(len(batch) <= 3 for batch in batches)
+    assert [c.id for batch in batches for c in batch] == [c.id for batch in again for c in batch]
+    assert all(c.id == make_chunk_id(c) for batch in batches for c in batch)
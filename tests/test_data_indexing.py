@@ -0,0 +1,76 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import data_indexing
+from src.chunk_store import ChunkStore
+from src.local_store import LocalVectorStore
+
+FILE = 'data/anatomy.pdf'
+CHUNKS = [Document(id=f"c{i}", page_content=f"chunk {i}", metadata={'book_name': 'anatomy.pdf', 'page': i})
+          for i in range(5)]
+
+
+class CrashingStore(LocalVectorStore):
+    """Fails the upsert after `crash_after` successful ones."""
+
+    def __init__(self, *args, crash_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crash_after = crash_after
+
+    def add_documents(self, documents, **kwargs):
+        if self.crash_after is not None:
+            if not self.crash_after:
+                raise RuntimeError("upsert failed")
+            self.crash_after -= 1
+        return super().add_documents(documents, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def chunked_book(monkeypatch):
+    monkeypatch.setattr(data_indexing, 'chunk_batch_size', 2)
+    monkeypatch.setattr(data_indexing, 'iter_documents', lambda data_path, files: None)
+    monkeypatch.setattr(data_indexing, 'iter_chunks', lambda documents: iter([CHUNKS]))
+
+
+def index(tmp_path, vector_store):
+    manifest = {'files': {FILE: {'sha256': 'abc', 'chunk_ids': []}}}
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    batches = data_indexing.iter_new_chunk_batches('data', [FILE], {}, manifest, True, {'unchanged': 0})
+    counts = data_indexing.upsert_chunk_batches(batches, data_indexing.load_checkpoint(checkpoint_path, 'run'),
+                                                ChunkStore(str(tmp_path / 'chunks.db')), vector_store,
+                                                checkpoint_path, 'run')
+    return counts, manifest
+
+
+def test_resume_counts_only_the_batches_it_upserts(tmp_path):
+    path = str(tmp_path / 'index')
+    crashing = CrashingStore(DeterministicFakeEmbedding(size=8), path=path, index_type='exact', crash_after=1)
+    with pytest.raises(RuntimeError):
+        index(tmp_path, crashing)
+    assert data_indexing.load_checkpoint(str(tmp_path / 'checkpoint.json'), 'run') == 1
+
+    store = LocalVectorStore(DeterministicFakeEmbedding(size=8), path=path, index_type='exact')
+    (upserted, resumed), manifest = index(tmp_path, store)
+
+    assert (upserted, resumed) == (3, 2)
+    assert manifest['files'][FILE]['chunk_ids'] == [chunk.id for chunk in CHUNKS]
+    assert store.count == 5
+
+
+
+def test_book_names_resolve_to_their_own_files(tmp_path):
+    nested = 'data/volume2/anatomy.pdf'
+    manifest = {'files': {FILE: {'sha256': 'a', 'chunk_ids': []}, nested: {'sha256': 'b', 'chunk_ids': []}}}
+    batches = data_indexing.iter_new_chunk_batches('data', [FILE, nested], {}, manifest, True, {'unchanged': 0})
+    list(batches)
+
+    assert manifest['files'][FILE]['chunk_ids'] == [chunk.id for chunk in CHUNKS]
+    assert manifest['files'][nested]['chunk_ids'] == []
+
+
+def test_duplicate_book_names_are_rejected():
+    batches = data_indexing.iter_new_chunk_batches('data', [FILE, 'data/./anatomy.pdf'], {}, {'files': {}}, True,
+                                                   {'unchanged': 0})
+    with pytest.raises(ValueError, match="anatomy.pdf"):
+        list(batches)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.embedding_cache import CachedEmbeddings, EmbeddingStore
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    model: str = 'text-embedding-3-small'
+    dimensions: int = 8
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return super().embed_query(text)
+
+
+def assert_vectors(actual, expected):
+    # The store keeps float32 vectors
+    np.testing.assert_allclose(np.array(actual), np.array(expected), rtol=1e-6)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / 'embeddings.db'))
+
+
+def make(store, **kwargs):
+    return CachedEmbeddings(CountingEmbeddings(size=8, calls=[], **kwargs), store=store)
+
+
+def test_a_hit_skips_the_underlying_call(store):
+    first = make(store)
+    vectors = first.embed_documents(["heart", "liver"])
+
+    second = make(store)
+    assert_vectors(second.embed_documents(["liver", "heart"]), [vectors[1], vectors[0]])
+    assert_vectors(second.embed_query("heart"), vectors[0])
+    assert second.embeddings.calls == []
+    assert (second.hits, second.misses) == (3, 0)
+
+
+def test_mixed_batches_keep_input_order_and_embed_each_miss_once(store):
+    embeddings = make(store)
+    cached = embeddings.embed_documents(["b"])[0]
+
+    vectors = embeddings.embed_documents(["a", "b", "c", "a"])
+
+    assert embeddings.embeddings.calls[-1] == ["a", "c"]
+    expected = embeddings.embeddings.embed_documents(["a", "c"])
+    assert_vectors(vectors, [expected[0], cached, expected[1], expected[0]])
+    assert (embeddings.hits, embeddings.misses) == (2, 3)
+
+
+def test_misses_are_sent_in_batches(store):
+    embeddings = CachedEmbeddings(CountingEmbeddings(size=8, calls=[]), store=store, batch_size=2)
+    embeddings.embed_documents(["a", "b", "c"])
+    assert embeddings.embeddings.calls == [["a", "b"], ["c"]]
+
+
+def test_another_model_uses_separate_keys(store):
+    make(store).embed_documents(["heart"])
+
+    other = make(store, model='text-embedding-3-large')
+    other.embed_documents(["heart"])
+    resized = make(store, dimensions=16)
+    resized.embed_documents(["heart"])
+
+    assert other.embeddings.calls == [["heart"]]
+    assert resized.embeddings.calls == [["heart"]]
+    assert store.count() == 3
@@ -0,0 +1,64 @@
+from src.evaluation import EvaluationRunner
+
+QUESTIONS = [{'question': f"question {i}"} for i in range(4)]
+
+
+class FakeBar:
+    """Records the arguments a tqdm bar is created with and its updates."""
+
+    def __init__(self, total, initial=0):
+        self.total = total
+        self.initial = initial
+        self.n = initial
+
+    def update(self, n):
+        self.n += n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def test_resume_answers_only_the_missing_questions_and_starts_the_bar_after_them(tmp_path):
+    results_path = str(tmp_path / 'results.jsonl')
+    failing = {"question 2"}
+    calls = []
+
+    def process(test_question):
+        calls.append(test_question['question'])
+        if test_question['question'] in failing:
+            raise RuntimeError("timeout")
+        return {'answer': test_question['question'].upper()}
+
+    _, report = EvaluationRunner(process, results_path).run(QUESTIONS)
+    assert (report['answered'], report['failed']) == (3, 1)
+
+    failing.clear()
+    calls.clear()
+    bars = []
+
+    def progress(**kwargs):
+        bars.append(FakeBar(**kwargs))
+        return bars[-1]
+
+    records, report = EvaluationRunner(process, results_path).run(QUESTIONS, progress=progress)
+
+    assert calls == ["question 2"]
+    assert (report['resumed'], report['answered']) == (3, 1)
+    assert [record['answer'] for record in records] == ["QUESTION 0", "QUESTION 1", "QUESTION 2", "QUESTION 3"]
+    assert [(bar.total, bar.initial, bar.n) for bar in bars] == [(4, 3, 4)]
+
+
+def test_a_line_cut_short_by_a_crash_is_ignored(tmp_path):
+    results_path = tmp_path / 'results.jsonl'
+    runner = EvaluationRunner(lambda test_question: {'answer': 'a'}, str(results_path))
+    runner.run(QUESTIONS[:1])
+    with open(results_path, 'a') as f:
+        f.write('{"key": "trunc')
+
+    records, report = runner.run(QUESTIONS[:2])
+    assert (report['resumed'], report['answered']) == (1, 1)
+    assert len(records) == 2
+    assert len(runner.load_completed()) == 2
@@ -0,0 +1,47 @@
+from langchain_core.documents import Document
+
+from src.gating import ScoreGate
+
+
+def doc(name, score=None):
+    return Document(page_content=name, metadata={} if score is None else {'score': score})
+
+
+def names(docs):
+    return [d.page_content for d in docs]
+
+
+def test_splits_on_thresholds_and_keeps_rank_order():
+    gate = ScoreGate(accept_above=0.6, reject_below=0.3, max_gap=None)
+    result = gate.split([doc('a', 0.9), doc('b', 0.5), doc('c', 0.2), doc('d', 0.7), doc('e', 0.4)])
+
+    assert names(result.accepted) == ['a', 'd']
+    assert names(result.ambiguous) == ['b', 'e']
+    assert names(result.rejected) == ['c']
+
+
+def test_docs_without_a_dense_score_are_ambiguous():
+    result = ScoreGate(0.6, 0.3, 0.15).split([doc('lexical'), doc('dense', 0.9)])
+    assert names(result.ambiguous) == ['lexical']
+    assert names(result.accepted) == ['dense']
+
+
+def test_max_gap_rejects_everything_below_the_gap():
+    result = ScoreGate(0.6, 0.1, 0.15).split([doc('a', 0.9), doc('b', 0.85), doc('c', 0.5), doc('d', 0.45)])
+    assert names(result.accepted) == ['a', 'b']
+    assert names(result.rejected) == ['c', 'd']
+
+
+def test_max_gap_is_measured_in_score_order_not_rank_order():
+    # Fused hybrid order: a low-scoring lexical hit ranks ahead of higher-scoring dense docs
+    docs = [doc('lexical', 0.2), doc('unscored'), doc('a', 0.8), doc('b', 0.5), doc('c', 0.75)]
+    result = ScoreGate(0.6, 0.1, 0.15).split(docs)
+
+    assert names(result.accepted) == ['a', 'c']
+    assert names(result.ambiguous) == ['unscored']
+    assert names(result.rejected) == ['lexical', 'b']
+
+
+def test_no_gap_cut_when_scores_are_close():
+    result = ScoreGate(0.6, 0.1, 0.15).split([doc('a', 0.7), doc('b', 0.6), doc('c', 0.5), doc('d', 0.4)])
+    assert result.rejected == []
@@ -0,0 +1,50 @@
+import pytest
+
+from src.lexical import BM25Index, tokenize
+
+CHUNKS = [
+    ('hypertension', "Hypertension is high blood pressure treated with diuretics."),
+    ('diabetes', "Diabetes mellitus raises blood glucose; insulin lowers it."),
+    ('asthma', "Asthma narrows the airways; inhalers relieve the symptoms."),
+    ('pressure', "Blood pressure is measured with a cuff. Blood pressure varies."),
+]
+
+
+@pytest.fixture
+def index():
+    return BM25Index.build(CHUNKS)
+
+
+def test_tokenize_lowercases_and_drops_stopwords():
+    assert tokenize("What is the Acid phosphatase test?") == ['acid', 'phosphatase', 'test']
+
+
+def test_search_ranks_matching_chunks_first(index):
+    results = index.search("insulin glucose", k=3)
+    assert [chunk_id for chunk_id, _ in results] == ['diabetes']
+
+
+def test_search_scores_term_frequency_and_rarity(index):
+    ids = [chunk_id for chunk_id, _ in index.search("blood pressure", k=4)]
+    assert ids[0] == 'pressure'
+    assert set(ids) == {'pressure', 'hypertension', 'diabetes'}
+
+
+def test_search_returns_at_most_k_results_best_first(index):
+    results = index.search("blood", k=2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+
+
+def test_unknown_terms_match_nothing(index):
+    assert index.search("zzz unknown") == []
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("blood pressure", k=4) == index.search("blood pressure", k=4)
+
+
+def test_empty_index_matches_nothing():
+    assert BM25Index.build([]).search("blood") == []
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.local_store import LocalVectorStore
+
+EMBEDDING = DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture(params=['float32', 'int8'])
+def store(request, tmp_path):
+    store = LocalVectorStore(EMBEDDING, path=str(tmp_path / 'index'), dtype=request.param, index_type='exact')
+    store.add_texts([f"text {i}" for i in range(20)], [{'i': i} for i in range(20)], ids=[f"id{i}" for i in range(20)])
+    return store
+
+
+def test_search_returns_the_matching_text_first(store):
+    doc, score = store.similarity_search_with_score("text 7", k=1)[0]
+    assert (doc.id, doc.page_content, doc.metadata) == ('id7', "text 7", {'i': 7})
+    assert score == pytest.approx(1.0, abs=0.02)
+
+
+def test_upsert_replaces_and_delete_hides_rows(store):
+    store.add_texts(["text 3 revised"], [{'i': 'revised'}], ids=['id3'])
+    store.delete(ids=['id4'])
+
+    assert [doc.page_content for doc in store.get_by_ids(['id3', 'id4'])] == ["text 3 revised"]
+    assert 'id4' not in [doc.id for doc in store.similarity_search("text 4", k=20)]
+    assert len(store.deleted) == 2
+
+
+def test_reopened_store_reads_rows_from_disk(store):
+    reopened = LocalVectorStore(EMBEDDING, path=store.path, dtype=store.dtype, index_type='exact')
+    assert reopened.get_by_ids(['id0', 'id19'])[1].metadata == {'i': 19}
+
+
+def test_compact_reclaims_deleted_rows_and_keeps_results(store):
+    store.add_texts(["text 3 revised"], ids=['id3'])
+    store.delete(ids=[f"id{i}" for i in range(10, 15)])
+    before = [(doc.id, round(score, 4)) for doc, score in store.similarity_search_with_score("text 12", k=5)]
+
+    assert store.compact() == 6
+    assert (store.count, len(store.deleted)) == (15, 0)
+    assert [(doc.id, round(score, 4)) for doc, score in store.similarity_search_with_score("text 12", k=5)] == before
+    assert store.get_by_ids(['id3'])[0].page_content == "text 3 revised"
+    assert not os.path.exists(store.path + '.compact')
+
+
+def test_compact_without_deleted_rows_is_a_no_op(store):
+    assert store.compact() == 0
+    assert store.count == 20
+
+
+def test_interrupted_compaction_is_completed_on_open(store):
+    store.delete(ids=['id0'])
+    store.compact()
+    os.replace(store.path, store.path + '.compact')
+
+    reopened = LocalVectorStore(EMBEDDING, path=store.path, dtype=store.dtype, index_type='exact')
+    assert reopened.count == 19
+
+
+def test_build_ivf_on_an_empty_store_raises(tmp_path):
+    store = LocalVectorStore(EMBEDDING, path=str(tmp_path / 'empty'), index_type='ivf')
+    with pytest.raises(ValueError, match="empty store"):
+        store.build_ivf()
+
+
+def test_ivf_search_finds_probed_and_newly_added_rows(tmp_path):
+    store = LocalVectorStore(EMBEDDING, path=str(tmp_path / 'index'), index_type='ivf', nprobe=4)
+    store.add_texts([f"text {i}" for i in range(20)], ids=[f"id{i}" for i in range(20)])
+    store.build_ivf(nlist=4)
+    store.add_texts(["text new"], ids=['new'])
+
+    assert store.similarity_search("text 7", k=1)[0].id == 'id7'
+    assert store.similarity_search("text new", k=1)[0].id == 'new'
+
+
+def test_search_repeats_when_rows_are_renumbered_mid_scan(store, monkeypatch):
+    store.delete(ids=['id0'])
+    scan = store._scan
+    compacted = []
+
+    def scan_then_compact(snapshot, query):
+        result = scan(snapshot, query)
+        if not compacted:
+            compacted.append(store.compact())
+        return result
+
+    monkeypatch.setattr(store, '_scan', scan_then_compact)
+    doc, _ = store.similarity_search_with_score("text 7", k=1)[0]
+    assert compacted == [1]
+    assert (doc.id, doc.page_content) == ('id7', "text 7")
+
+
+def test_search_drops_rows_deleted_mid_scan(store, monkeypatch):
+    scan = store._scan
+
+    def scan_then_delete(snapshot, query):
+        result = scan(snapshot, query)
+        store.delete(ids=['id7'])
+        return result
+
+    monkeypatch.setattr(store, '_scan', scan_then_delete)
+    assert 'id7' not in [doc.id for doc in store.similarity_search("text 7", k=3)]
+
+
+def test_mmr_search_returns_distinct_rows(store):
+    docs = store.max_marginal_relevance_search("text 7", k=3, fetch_k=10)
+    assert docs[0].id == 'id7'
+    assert len({doc.id for doc in docs}) == 3
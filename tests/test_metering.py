@@ -0,0 +1,73 @@
+import pytest
+import tiktoken
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src import metering
+
+
+class WordEncoding:
+    """Stands in for a tiktoken encoding: one token per whitespace-separated word."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def encode(self, text, **kwargs):
+        self.calls.append(kwargs)
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def fresh_encodings():
+    metering._get_encoding.cache_clear()
+    yield
+    metering._get_encoding.cache_clear()
+
+
+@pytest.fixture
+def encodings(monkeypatch):
+    created = {}
+
+    def encoding_for_model(model_name):
+        if not model_name.startswith('gpt-'):
+            raise KeyError(model_name)
+        return created.setdefault(model_name, WordEncoding(model_name))
+
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', encoding_for_model)
+    monkeypatch.setattr(tiktoken, 'get_encoding', lambda name: created.setdefault(name, WordEncoding(name)))
+    return created
+
+
+def test_counts_with_the_models_tiktoken_encoding(encodings):
+    assert metering.count_tokens("what causes a fever", model_name='gpt-4o-mini') == 4
+    # Special-token text in user input is counted, not rejected
+    assert encodings['gpt-4o-mini'].calls == [{'disallowed_special': ()}]
+
+
+def test_unknown_models_use_o200k_base(encodings):
+    assert metering.count_tokens("one two three", model_name='local-model') == 3
+    assert list(encodings) == ['o200k_base']
+
+
+def test_encodings_are_loaded_once_per_model(encodings, monkeypatch):
+    metering.count_tokens("a", model_name='gpt-4o')
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', lambda model_name: pytest.fail("encoding loaded twice"))
+    assert metering.count_tokens("a b", model_name='gpt-4o') == 2
+
+
+@pytest.mark.parametrize('text, expected', [("", 0), ("abc", 1), ("abcd", 1), ("abcde", 2), ("a" * 400, 100)])
+def test_falls_back_to_four_characters_per_token(monkeypatch, text, expected):
+    def offline(model_name):
+        raise ConnectionError("cannot download the BPE file")
+
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', offline)
+    assert metering.count_tokens(text, model_name='gpt-4o-mini') == expected
+
+
+def test_message_tokens_add_the_chat_overhead(encodings):
+    messages = [
+        HumanMessage("what causes a fever"),
+        AIMessage("", tool_calls=[{'name': 'retrieve_context', 'args': {'query': 'fever'}, 'id': '1'}]),
+    ]
+    # 3 reply-priming tokens, 4 per message, then content and tool call arguments ('{"query":', '"fever"}')
+    assert metering.count_message_tokens(messages, model_name='gpt-4o-mini') == 3 + (4 + 4) + (4 + 0 + 2)
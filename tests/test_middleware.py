@@ -0,0 +1,213 @@
+import threading
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, RemoveMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src import agent as agent_module
+from src.chunk_store import ChunkStore
+from src.local_store import LocalVectorStore
+from src.middleware import BackgroundSummarizationMiddleware, CompactToolResultsMiddleware
+
+
+class FakeChatModel(BaseChatModel):
+    """Replies with `reply`; optionally waits for `release` or raises."""
+    reply: str = "answer " * 10
+    fail: bool = False
+    release: object = None
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("summarizer down")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(self.reply.strip()))])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    @property
+    def _llm_type(self):
+        return 'fake'
+
+
+def count_words(messages):
+    return sum(len(str(message.content).split()) for message in messages)
+
+
+def make_agent(summarizer, trigger_tokens=15, keep_tokens=12):
+    middleware = BackgroundSummarizationMiddleware(summarizer, trigger_tokens=trigger_tokens,
+                                                   keep_tokens=keep_tokens, max_workers=1)
+    middleware.token_counter = count_words
+    agent = create_agent(FakeChatModel(), [], middleware=[middleware], checkpointer=InMemorySaver())
+    return agent, middleware
+
+
+CONFIG = {'configurable': {'thread_id': 't'}}
+
+
+def turn(agent, text):
+    return agent.invoke({'messages': [{'role': 'user', 'content': text}]}, CONFIG)['messages']
+
+
+def wait_for_summary(middleware, thread_id='t'):
+    return middleware._jobs[thread_id].exception(timeout=5)
+
+
+def test_summary_is_swapped_in_on_the_next_turn():
+    agent, middleware = make_agent(FakeChatModel(reply="SUMMARY of the first question"))
+    turn(agent, "first question " * 5)
+    wait_for_summary(middleware)
+
+    messages = turn(agent, "second question")
+    assert messages[0].response_metadata.get('summary')
+    assert "SUMMARY of the first question" in messages[0].content
+    assert "first question" not in " ".join(m.content for m in messages[1:])
+    assert [m.type for m in messages[1:]] == ['ai', 'human', 'ai']
+    assert middleware.counts['swapped'] == 1
+
+
+def test_stale_summary_is_discarded_when_the_thread_moved_on():
+    agent, middleware = make_agent(FakeChatModel(reply="SUMMARY"))
+    first = turn(agent, "first question " * 5)
+    wait_for_summary(middleware)
+    # The summarized message is no longer in the history
+    agent.update_state(CONFIG, {'messages': [RemoveMessage(id=first[0].id)]})
+
+    messages = turn(agent, "second question")
+    assert not any(m.response_metadata.get('summary') for m in messages)
+    assert middleware.counts['discarded'] == 1
+
+
+def test_failed_summary_leaves_the_history_unchanged():
+    agent, middleware = make_agent(FakeChatModel(fail=True))
+    first = turn(agent, "first question " * 5)
+    wait_for_summary(middleware)
+
+    messages = turn(agent, "second question")
+    assert [m.id for m in messages[:2]] == [m.id for m in first]
+    assert len(messages) == 4
+    assert middleware.counts['failed'] == 1
+
+
+def test_turns_do_not_wait_for_a_running_summary():
+    release = threading.Event()
+    summarizer = FakeChatModel(reply="SUMMARY", release=release)
+    agent, middleware = make_agent(summarizer)
+    try:
+        turn(agent, "first question " * 5)
+        messages = turn(agent, "second question")
+
+        # Both turns finished while the summarizer was still blocked
+        assert not middleware._jobs['t'].done()
+        assert len(messages) == 4
+        assert not any(m.response_metadata.get('summary') for m in messages)
+    finally:
+        release.set()
+
+    wait_for_summary(middleware)
+    messages = turn(agent, "third question")
+    assert messages[0].response_metadata.get('summary')
+    assert middleware.counts['swapped'] == 1
+
+
+def test_short_history_is_not_summarized():
+    agent, middleware = make_agent(FakeChatModel(), trigger_tokens=1000)
+    turn(agent, "hello")
+    assert middleware.counts['started'] == 0
+
+
+@pytest.mark.parametrize('keep_tokens, expected', [(100, 0), (12, 1), (0, 2)])
+def test_cutoff_keeps_the_newest_messages_within_keep_tokens(keep_tokens, expected):
+    middleware = BackgroundSummarizationMiddleware(FakeChatModel(), trigger_tokens=1, keep_tokens=keep_tokens)
+    middleware.token_counter = count_words
+    messages = [AIMessage("a " * 10, id='1'), AIMessage("b " * 10, id='2')]
+    assert middleware._cutoff_index(messages) == expected
+
+
+# ============= COMPACTION AND REHYDRATION =============
+
+CHUNKS = [
+    Document(id='chunk-a', page_content="Asthma narrows the airways and causes wheezing. " * 5,
+             metadata={'book_name': 'book.pdf', 'page': 3}),
+    Document(id='chunk-b', page_content="Gout is caused by uric acid crystals in the joints. " * 5,
+             metadata={'book_name': 'book.pdf', 'page': 7}),
+]
+
+
+class RetrievingModel(BaseChatModel):
+    """Calls retrieve_context on a user message, answers after the tool result."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if messages[-1].type == 'human':
+            message = AIMessage("", tool_calls=[{'name': 'retrieve_context', 'args': {'query': 'q'}, 'id': 'call-1'}])
+        else:
+            message = AIMessage("Asthma narrows the airways.")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    @property
+    def _llm_type(self):
+        return 'retrieving'
+
+
+@tool(response_format='content_and_artifact')
+def retrieve_context(query: str):
+    """Retrieves context."""
+    return "\n\n".join(doc.page_content for doc in CHUNKS), [doc.model_copy() for doc in CHUNKS]
+
+
+def run_compacting_agent(resolve):
+    middleware = CompactToolResultsMiddleware(resolve=resolve)
+    agent = create_agent(RetrievingModel(), [retrieve_context], middleware=[middleware], checkpointer=InMemorySaver())
+    agent.invoke({'messages': [{'role': 'user', 'content': "What is asthma?"}]}, CONFIG)
+    messages = agent.get_state(CONFIG).values['messages']
+    return next(m for m in messages if isinstance(m, ToolMessage))
+
+
+def test_tool_output_is_replaced_by_chunk_id_references_after_the_turn():
+    known = {doc.id: doc for doc in CHUNKS}
+    message = run_compacting_agent(lambda ids: [known[i] for i in ids if i in known])
+
+    assert message.response_metadata['compacted'] is True
+    assert CHUNKS[0].page_content not in message.content
+    assert "[ids: chunk-a]" in message.content and "[ids: chunk-b]" in message.content
+    assert [ref['ids'] for ref in message.artifact] == [['chunk-a'], ['chunk-b']]
+
+
+def test_unresolvable_ids_keep_the_original_text():
+    message = run_compacting_agent(lambda ids: [doc for doc in CHUNKS if doc.id == 'chunk-a'])
+
+    assert message.response_metadata['compacted'] is False
+    assert message.content == "\n\n".join(doc.page_content for doc in CHUNKS)
+    assert len(message.artifact) == 2
+
+
+def test_rehydration_restores_exact_chunk_text_from_chunk_and_vector_stores(tmp_path, monkeypatch):
+    # chunk-a is only in the local chunk store, chunk-b only in the vector store
+    chunk_store = ChunkStore(str(tmp_path / 'chunks.db'))
+    chunk_store.add_documents([CHUNKS[0]])
+    embeddings = DeterministicFakeEmbedding(size=8)
+    vector_store = LocalVectorStore(embeddings, path=str(tmp_path / 'index'), index_type='exact')
+    vector_store.add_documents([CHUNKS[1]], ids=[CHUNKS[1].id])
+
+    monkeypatch.setattr(agent_module, 'get_shared_chunk_store', lambda: chunk_store)
+    monkeypatch.setattr(agent_module, 'get_embeddings', lambda *args, **kwargs: embeddings)
+    monkeypatch.setattr(agent_module, 'get_vector_store', lambda *args, **kwargs: vector_store)
+
+    assert [doc.page_content for doc in agent_module.get_context_docs(['chunk-b', 'chunk-a', 'missing'])] == [
+        CHUNKS[1].page_content, CHUNKS[0].page_content]
+    text = agent_module.rehydrate_context(['chunk-a', 'chunk-b'])
+    assert CHUNKS[0].page_content in text
+    assert CHUNKS[1].page_content in text
+    assert agent_module.rehydrate_context(['missing']) == "No stored context found for these ids."
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=['immediate', 'batched'])
+def limiter(request, tmp_path, clock):
+    limiter = RateLimit(str(tmp_path / 'rate_limits.db'), write_mode=request.param, flush_interval=0.01)
+    yield limiter
+    limiter.close()
+
+
+def admit(limiter, clock, ip, times, max_requests=3, time_window=60):
+    results = []
+    for _ in range(times):
+        clock[0] += 1
+        results.append(limiter.is_allowed(ip, max_requests=max_requests, time_window=time_window))
+    return results
+
+
+def test_allows_up_to_the_limit_then_reports_the_wait(limiter, clock):
+    results = admit(limiter, clock, '1.1.1.1', 4)
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    # The first request (t+1) expires 60s after it was made; it is now t+4
+    assert results[-1][1] == 57
+
+
+def test_limits_are_per_ip(limiter, clock):
+    admit(limiter, clock, '1.1.1.1', 3)
+    assert admit(limiter, clock, '2.2.2.2', 1) == [(True, None)]
+
+
+def test_window_slides(limiter, clock):
+    admit(limiter, clock, '1.1.1.1', 3)
+    assert admit(limiter, clock, '1.1.1.1', 1)[0][0] is False
+
+    clock[0] += 60
+    assert admit(limiter, clock, '1.1.1.1', 1)[0][0] is True
+
+
+def test_admissions_are_shared_through_the_database(tmp_path, clock):
+    path = str(tmp_path / 'rate_limits.db')
+    first = RateLimit(path, write_mode='immediate')
+    second = RateLimit(path, write_mode='immediate')
+    try:
+        admit(first, clock, '1.1.1.1', 2)
+        assert [allowed for allowed, _ in admit(second, clock, '1.1.1.1', 2)] == [True, False]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_batched_writes_reach_the_database_on_flush(tmp_path, clock):
+    path = str(tmp_path / 'rate_limits.db')
+    limiter = RateLimit(path, write_mode='batched', flush_interval=60)
+    try:
+        admit(limiter, clock, '1.1.1.1', 2)
+        limiter.flush()
+        other = RateLimit(path, write_mode='immediate')
+        assert [allowed for allowed, _ in admit(other, clock, '1.1.1.1', 2)] == [True, False]
+        other.close()
+    finally:
+        limiter.close()
+
+
+def test_concurrent_requests_never_exceed_the_limit(tmp_path):
+    limiter = RateLimit(str(tmp_path / 'rate_limits.db'), write_mode='immediate')
+    allowed = []
+
+    def worker():
+        for _ in range(20):
+            allowed.append(limiter.is_allowed('1.1.1.1', max_requests=10, time_window=60)[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    limiter.close()
+
+    assert sum(allowed) == 10
+
+
+def test_sweep_deletes_expired_rows(tmp_path, clock):
+    limiter = RateLimit(str(tmp_path / 'rate_limits.db'), write_mode='immediate')
+    admit(limiter, clock, '1.1.1.1', 2, time_window=60)
+    clock[0] += limiter._max_window + 1
+    limiter.sweep()
+
+    assert limiter._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0] == 0
+    limiter.close()
+
+
+def test_rejects_unknown_write_mode(tmp_path):
+    with pytest.raises(ValueError):
+        RateLimit(str(tmp_path / 'rate_limits.db'), write_mode='eventual')
+
+
+def test_batched_mode_writes_concurrent_admissions_in_one_transaction(tmp_path):
+    limiter = RateLimit(str(tmp_path / 'rate_limits.db'), write_mode='batched', flush_interval=60)
+    statements = []
+    limiter._conn.set_trace_callback(statements.append)
+    allowed = []
+
+    def worker(ip):
+        for _ in range(5):
+            allowed.append(limiter.is_allowed(ip, max_requests=10, time_window=60)[0])
+
+    threads = [threading.Thread(target=worker, args=(f"10.0.0.{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    limiter.flush()
+
+    assert all(allowed)
+    assert [s for s in statements if s.startswith('BEGIN')] == ['BEGIN IMMEDIATE']
+    assert limiter._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0] == 20
+    limiter.close()
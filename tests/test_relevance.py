@@ -0,0 +1,92 @@
+import logging
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from src import relevance
+from src.relevance import RelevanceValidator
+
+
+class FakeChecker:
+    """Grades docs whose text reads `<name> <yes|no> <seconds>`, sleeping that long."""
+
+    def __init__(self):
+        self.graded = []
+
+    def invoke(self, prompt, config=None):
+        name, answer, seconds = re.search(r"Document : (\S+) (yes|no) ([\d.]+)", prompt).groups()
+        time.sleep(float(seconds))
+        self.graded.append(name)
+        return SimpleNamespace(output=answer)
+
+
+@pytest.fixture
+def checker(monkeypatch):
+    checker = FakeChecker()
+    monkeypatch.setattr(relevance, 'get_structured_model', lambda *args: checker)
+    return checker
+
+
+def docs(*specs):
+    return [Document(page_content=spec) for spec in specs]
+
+
+def names(result):
+    return [doc.page_content.split()[0] for doc in result]
+
+
+def test_results_keep_rank_order_when_later_calls_finish_first(checker):
+    validator = RelevanceValidator(mode='concurrent', max_concurrency=3, limit=None)
+    result = list(validator.iter_relevant('q', docs("a yes 0.1", "b no 0.05", "c yes 0")))
+
+    assert names(result) == ['a', 'c']
+    assert [timing.rank for timing in validator.timings] == [0, 1, 2]
+    assert validator.llm_calls == 3
+
+
+def test_stops_after_limit_relevant_docs(checker):
+    validator = RelevanceValidator(mode='concurrent', max_concurrency=1, limit=2)
+    result = list(validator.iter_relevant('q', docs("a yes 0", "b no 0", "c yes 0", "d yes 0", "e yes 0")))
+
+    assert names(result) == ['a', 'c']
+    assert checker.graded == ['a', 'b', 'c']
+
+
+def test_early_stop_does_not_wait_for_calls_in_flight(checker):
+    validator = RelevanceValidator(mode='concurrent', max_concurrency=3, limit=1)
+    start = time.perf_counter()
+    result = list(validator.iter_relevant('q', docs("a yes 0", "b yes 1", "c yes 1", "d yes 1")))
+
+    assert names(result) == ['a']
+    assert time.perf_counter() - start < 0.5
+    assert 'd' not in checker.graded
+
+
+def test_closing_the_generator_early_returns_at_once_and_logs_timings(checker, caplog):
+    validator = RelevanceValidator(mode='concurrent', max_concurrency=2, limit=None)
+    generator = validator.iter_relevant('q', docs("a yes 0", "b yes 1", "c yes 1"))
+
+    with caplog.at_level(logging.INFO, logger='src.relevance'):
+        assert names([next(generator)]) == ['a']
+        start = time.perf_counter()
+        generator.close()
+
+    assert time.perf_counter() - start < 0.5
+    assert "graded 1 docs" in caplog.text
+
+
+class FakeBatchChecker:
+    def invoke(self, prompt, config=None):
+        return SimpleNamespace(relevant=[2, 0, 7])
+
+
+def test_batch_mode_grades_in_one_call_and_respects_limit(monkeypatch):
+    monkeypatch.setattr(relevance, 'get_structured_model', lambda *args: FakeBatchChecker())
+    validator = RelevanceValidator(mode='batch', limit=1)
+    result = list(validator.iter_relevant('q', docs("a", "b", "c")))
+
+    assert names(result) == ['a']
+    assert validator.llm_calls == 1
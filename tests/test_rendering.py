@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+from src.rendering import StreamRenderer, ThrottledPlaceholder
+
+
+class Placeholder:
+    def __init__(self):
+        self.bodies = []
+
+    def markdown(self, body):
+        self.bodies.append(body)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_first_write_renders_and_later_writes_wait_for_the_interval():
+    placeholder, clock = Placeholder(), Clock()
+    throttled = ThrottledPlaceholder(placeholder, interval=0.1, max_pending_chars=1000, clock=clock)
+
+    throttled.write("a", 1)
+    throttled.write("ab", 1)
+    throttled.write("abc", 1)
+    assert placeholder.bodies == ["a"]
+
+    clock.now = 0.1
+    throttled.write("abcd", 1)
+    assert placeholder.bodies == ["a", "abcd"]
+
+
+def test_enough_pending_characters_render_early():
+    placeholder = Placeholder()
+    throttled = ThrottledPlaceholder(placeholder, interval=10, max_pending_chars=5, clock=Clock())
+
+    throttled.write("a", 1)
+    throttled.write("abc", 2)
+    throttled.write("abcdef", 3)
+    assert placeholder.bodies == ["a", "abcdef"]
+
+
+def test_flush_if_due_renders_pending_text_once_the_interval_passed():
+    placeholder, clock = Placeholder(), Clock()
+    throttled = ThrottledPlaceholder(placeholder, interval=0.1, max_pending_chars=1000, clock=clock)
+    throttled.write("a", 1)
+    throttled.write("ab", 1)
+
+    throttled.flush_if_due()
+    assert placeholder.bodies == ["a"]
+    clock.now = 0.2
+    throttled.flush_if_due()
+    throttled.flush_if_due()
+    assert placeholder.bodies == ["a", "ab"]
+
+
+def test_flush_skips_unchanged_text():
+    placeholder = Placeholder()
+    throttled = ThrottledPlaceholder(placeholder, interval=10, max_pending_chars=1000, clock=Clock())
+    throttled.flush("done")
+    throttled.flush("done")
+    throttled.flush()
+
+    assert placeholder.bodies == ["done"]
+    assert throttled.renders == 1
+
+
+def message(content, node='model'):
+    return "messages", (SimpleNamespace(content=content), {'langgraph_node': node})
+
+
+def test_stream_renderer_shows_only_model_tokens_and_the_final_answer():
+    status, answer, clock = Placeholder(), Placeholder(), Clock()
+    renderer = StreamRenderer(status, answer, interval=0.1, max_pending_chars=1000, cursor="|", clock=clock)
+
+    assert renderer.handle("custom", "Searching") == ""
+    assert renderer.handle(*message("tool output", node='tools')) == ""
+    added = [renderer.handle(*message(token)) for token in ["Hyper", "tension", " is"]]
+
+    assert added == ["Hyper", "tension", " is"]
+    assert renderer.close() == "Hypertension is"
+    assert answer.bodies == ["Hyper|", "Hypertension is"]
+    assert status.bodies == ["*Searching*"]
+    assert renderer.updates == ["Searching"]
+
+
+def test_status_bursts_render_only_the_latest_update():
+    status, answer, clock = Placeholder(), Placeholder(), Clock()
+    renderer = StreamRenderer(status, answer, interval=0.1, max_pending_chars=1000, clock=clock)
+    for i in range(5):
+        renderer.handle("custom", f"source {i}")
+    renderer.close()
+
+    assert status.bodies == ["*source 0*", "*source 4*"]
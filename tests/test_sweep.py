@@ -0,0 +1,69 @@
+import functools
+import logging
+import shutil
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import sweep
+from src.embedding_cache import CachedEmbeddings, EmbeddingStore
+
+PAGES = [[Document(page_content=f"The {organ} is described on page {page} of the atlas.",
+                   metadata={'book_name': 'atlas.pdf', 'page': page})
+          for page, organ in enumerate(['heart', 'liver', 'kidney', 'lung'])]]
+QUESTIONS = [{'question': "Where is the liver described?", 'source': 'atlas.pdf', 'answer': "page 1"}]
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    model: str = 'fake'
+    dimensions: int = 16
+
+
+@pytest.fixture
+def embeddings(tmp_path):
+    store = EmbeddingStore(str(tmp_path / 'embeddings.db'))
+    return CachedEmbeddings(FakeEmbeddings(size=16), store=store)
+
+
+@pytest.fixture
+def sweep_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / 'sweep')
+    monkeypatch.setattr(sweep, 'build_variant', functools.partial(sweep.build_variant, sweep_dir=path))
+    return path
+
+
+def run(embeddings, search_type):
+    return sweep.run_variant(PAGES, 'pages', embeddings, QUESTIONS, 200, 0, [1, 2], search_type)
+
+
+def test_hybrid_variant_is_scored_on_its_own_bm25_index(embeddings, sweep_dir):
+    rows = run(embeddings, 'hybrid')
+
+    assert [(row['search_type'], row['k']) for row in rows] == [('hybrid', 1), ('hybrid', 2)]
+    assert rows[0]['chunks'] == 4
+
+
+def test_hybrid_variant_without_artifacts_is_skipped_with_a_warning(embeddings, sweep_dir, caplog):
+    run(embeddings, 'similarity')
+    shutil.rmtree(sweep.get_variant_artifact_paths(f"{sweep_dir}/index_cs200_ov0")[1])
+
+    with caplog.at_level(logging.WARNING, logger='src.sweep'):
+        assert run(embeddings, 'hybrid') == []
+    assert "Skipping hybrid variant chunk_size=200" in caplog.text
+    assert run(embeddings, 'similarity')[0]['search_type'] == 'similarity'
+
+
+def test_embedding_counters_are_exact_under_concurrent_calls(embeddings):
+    def worker(i):
+        for j in range(20):
+            embeddings.embed_documents([f"text {i} {j}", "shared text"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert embeddings.hits + embeddings.misses == 8 * 20 * 2
@@ -0,0 +1,73 @@
+import urllib.request
+
+import pytest
+
+from src import tracing
+from src.tracing import Histogram, Registry
+
+
+@pytest.mark.parametrize('samples, expected', [
+    ([], {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}),
+    ([0.2], {'p50': 0.2, 'p95': 0.2, 'p99': 0.2}),
+    # Nearest rank: index int(q * n) of the sorted samples, capped at the last one
+    (list(range(1, 101)), {'p50': 51, 'p95': 96, 'p99': 100}),
+    ([4, 1, 3, 2], {'p50': 3, 'p95': 4, 'p99': 4}),
+])
+def test_percentiles_use_nearest_rank(samples, expected):
+    histogram = Histogram(max_samples=1000)
+    for sample in samples:
+        histogram.observe(sample)
+    summary = histogram.summary()
+    assert {name: summary[name] for name in expected} == expected
+    assert (summary['count'], summary['sum']) == (len(samples), sum(samples))
+
+
+def test_percentiles_cover_only_the_recent_window_but_totals_cover_everything():
+    histogram = Histogram(max_samples=3)
+    for sample in (100, 1, 2, 3):
+        histogram.observe(sample)
+    summary = histogram.summary()
+    assert (summary['p99'], summary['count'], summary['sum']) == (3, 4, 106)
+
+
+def test_render_text_is_prometheus_exposition_format():
+    registry = Registry(max_samples=10)
+    registry.observe('retrieve', 0.25)
+    registry.observe('retrieve', 0.5)
+    registry.observe('agent', 1.0)
+    registry.increment('summaries', 2)
+
+    assert registry.render_text() == (
+        '# HELP medbot_stage_seconds Latency of each pipeline stage.\n'
+        '# TYPE medbot_stage_seconds summary\n'
+        'medbot_stage_seconds{stage="agent",quantile="0.50"} 1.000000\n'
+        'medbot_stage_seconds{stage="agent",quantile="0.95"} 1.000000\n'
+        'medbot_stage_seconds{stage="agent",quantile="0.99"} 1.000000\n'
+        'medbot_stage_seconds_sum{stage="agent"} 1.000000\n'
+        'medbot_stage_seconds_count{stage="agent"} 1\n'
+        'medbot_stage_seconds{stage="retrieve",quantile="0.50"} 0.500000\n'
+        'medbot_stage_seconds{stage="retrieve",quantile="0.95"} 0.500000\n'
+        'medbot_stage_seconds{stage="retrieve",quantile="0.99"} 0.500000\n'
+        'medbot_stage_seconds_sum{stage="retrieve"} 0.750000\n'
+        'medbot_stage_seconds_count{stage="retrieve"} 2\n'
+        '# HELP medbot_events_total Running totals such as summaries made or tokens saved.\n'
+        '# TYPE medbot_events_total counter\n'
+        'medbot_events_total{name="summaries"} 2\n'
+    )
+
+
+def test_metrics_endpoint_serves_the_registry(monkeypatch):
+    registry = Registry(max_samples=10)
+    registry.observe('retrieve', 0.1)
+    monkeypatch.setattr(tracing, 'registry', registry)
+    monkeypatch.setattr(tracing, '_server', None)
+
+    server = tracing.start_metrics_server(host='127.0.0.1', port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers['Content-Type'] == 'text/plain; version=0.0.4'
+            assert response.read().decode('utf-8') == registry.render_text()
+    finally:
+        server.shutdown()
+        server.server_close()